@@ -0,0 +1,189 @@
+"""Admission control for ask_agent_prompt_handler.
+
+Protects the Bedrock quota from a single chatty client or bot:
+  * token buckets per phone number and per session,
+  * a global ceiling on concurrent invoke_agent calls,
+  * a short, bounded wait queue in front of that ceiling.
+
+Over-limit requests are rejected immediately with a retry-after hint.
+State lives in the shared key/value store (kv_store.py) so limits hold
+across Lambda containers; concurrency slots and queue places are leases
+that expire on their own if a container dies mid-call.
+"""
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from kv_store import KeyValueStore, create_kv_store
+from metrics import emit_metrics
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() not in ("0", "false", "no")
+PHONE_BUCKET_CAPACITY = float(os.getenv("RATE_LIMIT_PHONE_CAPACITY", "10"))
+PHONE_REFILL_PER_MINUTE = float(os.getenv("RATE_LIMIT_PHONE_REFILL_PER_MINUTE", "6"))
+SESSION_BUCKET_CAPACITY = float(os.getenv("RATE_LIMIT_SESSION_CAPACITY", "5"))
+SESSION_REFILL_PER_MINUTE = float(os.getenv("RATE_LIMIT_SESSION_REFILL_PER_MINUTE", "10"))
+MAX_CONCURRENT_AGENT_CALLS = int(os.getenv("MAX_CONCURRENT_AGENT_CALLS", "20"))
+ADMISSION_QUEUE_MAX = int(os.getenv("ADMISSION_QUEUE_MAX", "10"))
+ADMISSION_QUEUE_WAIT_SECONDS = float(os.getenv("ADMISSION_QUEUE_WAIT_SECONDS", "2"))
+# Should exceed the Lambda timeout so a live call never loses its slot
+ADMISSION_LEASE_SECONDS = float(os.getenv("ADMISSION_LEASE_SECONDS", "120"))
+
+CONCURRENCY_KEY = "admission#concurrency"
+CAS_ATTEMPTS = 20
+
+
+@dataclass
+class Admission:
+    admitted: bool
+    reason: Optional[str] = None
+    retry_after: float = 0.0
+    queued_seconds: float = 0.0
+    release: Callable[[], None] = lambda: None
+
+
+class AdmissionController:
+    def __init__(self, store: KeyValueStore,
+                 phone_capacity: float = PHONE_BUCKET_CAPACITY,
+                 phone_refill_per_minute: float = PHONE_REFILL_PER_MINUTE,
+                 session_capacity: float = SESSION_BUCKET_CAPACITY,
+                 session_refill_per_minute: float = SESSION_REFILL_PER_MINUTE,
+                 max_concurrent: int = MAX_CONCURRENT_AGENT_CALLS,
+                 queue_max: int = ADMISSION_QUEUE_MAX,
+                 queue_wait_seconds: float = ADMISSION_QUEUE_WAIT_SECONDS,
+                 lease_seconds: float = ADMISSION_LEASE_SECONDS,
+                 poll_interval: float = 0.05) -> None:
+        self.store = store
+        self.phone_limit = (phone_capacity, phone_refill_per_minute / 60.0)
+        self.session_limit = (session_capacity, session_refill_per_minute / 60.0)
+        self.max_concurrent = max_concurrent
+        self.queue_max = queue_max
+        self.queue_wait_seconds = queue_wait_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+
+    # -- token buckets -----------------------------------------------------
+
+    def _take_token(self, key: str, capacity: float, refill_per_second: float) -> float:
+        """Consume one token; return 0 on success, otherwise seconds until a token is available."""
+        for _ in range(CAS_ATTEMPTS):
+            now = time.time()
+            state, version = self.store.get(key)
+            tokens = capacity
+            if state:
+                elapsed = max(0.0, now - state["updated_at"])
+                tokens = min(capacity, state["tokens"] + elapsed * refill_per_second)
+            if tokens < 1:
+                return (1 - tokens) / refill_per_second if refill_per_second > 0 else self.lease_seconds
+            # A full bucket needs capacity / rate seconds to refill: no need to keep it longer
+            ttl = capacity / refill_per_second if refill_per_second > 0 else None
+            if self.store.put(key, {"tokens": tokens - 1, "updated_at": now}, ttl_seconds=ttl,
+                              expected_version=version):
+                return 0.0
+        # Heavy contention on the same bucket is itself a sign of abuse
+        return 1.0
+
+    # -- concurrency ceiling and wait queue ---------------------------------
+
+    def _update_slots(self, mutate: Callable[[dict, float], Optional[bool]]) -> Optional[bool]:
+        """Apply mutate(state, now) to the concurrency record with compare-and-set."""
+        for _ in range(CAS_ATTEMPTS):
+            now = time.time()
+            state, version = self.store.get(CONCURRENCY_KEY)
+            state = state or {"leases": {}, "waiters": {}}
+            for field in ("leases", "waiters"):
+                state[field] = {k: exp for k, exp in state[field].items() if exp > now}
+            before = {field: dict(state[field]) for field in ("leases", "waiters")}
+            result = mutate(state, now)
+            # Waiters poll this record: skip the write when nothing changed
+            if state == before:
+                return result
+            if self.store.put(CONCURRENCY_KEY, state, ttl_seconds=self.lease_seconds,
+                              expected_version=version):
+                return result
+        return None
+
+    def _try_lease(self, lease_id: str, waiting: bool, wait_seconds: float) -> Optional[bool]:
+        def mutate(state, now):
+            # Newcomers do not overtake requests already waiting for a slot
+            ahead = 0 if waiting else len(state["waiters"])
+            if len(state["leases"]) + ahead < self.max_concurrent:
+                state["waiters"].pop(lease_id, None)
+                state["leases"][lease_id] = now + self.lease_seconds
+                return True
+            if not waiting:
+                if len(state["waiters"]) >= self.queue_max:
+                    return False
+                state["waiters"][lease_id] = now + wait_seconds + 1
+            return None
+        return self._update_slots(mutate)
+
+    def _drop(self, lease_id: str) -> None:
+        def mutate(state, now):
+            state["leases"].pop(lease_id, None)
+            state["waiters"].pop(lease_id, None)
+        self._update_slots(mutate)
+
+    # -- public API ---------------------------------------------------------
+
+    def check_rate_limits(self, phone_number: Optional[str] = None,
+                          session_id: Optional[str] = None) -> Admission:
+        """Apply the per-phone and per-session token buckets only."""
+        buckets = []
+        if phone_number:
+            buckets.append(("phone_rate_limited", f"admission#phone#{phone_number}", self.phone_limit))
+        if session_id:
+            buckets.append(("session_rate_limited", f"admission#session#{session_id}", self.session_limit))
+        for reason, key, (capacity, rate) in buckets:
+            retry_after = self._take_token(key, capacity, rate)
+            if retry_after > 0:
+                return self._reject(reason, retry_after)
+        return Admission(admitted=True)
+
+    def admit(self, phone_number: Optional[str] = None, session_id: Optional[str] = None,
+              check_rate_limits: bool = True, wait_seconds: Optional[float] = None) -> Admission:
+        """Apply the rate limits (unless check_rate_limits is False) then take a concurrency slot.
+
+        wait_seconds overrides how long the request may queue for a slot.
+        """
+        if check_rate_limits:
+            limited = self.check_rate_limits(phone_number, session_id)
+            if not limited.admitted:
+                return limited
+        wait_seconds = self.queue_wait_seconds if wait_seconds is None else wait_seconds
+
+        lease_id = str(uuid.uuid4())
+        started = time.monotonic()
+        outcome = self._try_lease(lease_id, waiting=False, wait_seconds=wait_seconds)
+        if outcome is False:
+            return self._reject("queue_full", wait_seconds)
+        while outcome is not True:
+            if time.monotonic() - started >= wait_seconds:
+                self._drop(lease_id)
+                return self._reject("concurrency_limited", wait_seconds)
+            time.sleep(self.poll_interval)
+            outcome = self._try_lease(lease_id, waiting=True, wait_seconds=wait_seconds)
+
+        queued = time.monotonic() - started
+        if queued > 0.001:
+            emit_metrics({"AdmissionQueueWaitMs": (queued * 1000, "Milliseconds")},
+                         dimensions={"Service": "AskAgent"})
+        return Admission(admitted=True, queued_seconds=queued, release=lambda: self._drop(lease_id))
+
+    def _reject(self, reason: str, retry_after: float) -> Admission:
+        emit_metrics({"AdmissionRejected": 1}, dimensions={"Service": "AskAgent", "Reason": reason})
+        return Admission(admitted=False, reason=reason, retry_after=round(retry_after, 1))
+
+
+class _AdmitAll:
+    def check_rate_limits(self, phone_number: Optional[str] = None,
+                          session_id: Optional[str] = None) -> Admission:
+        return Admission(admitted=True)
+
+    def admit(self, phone_number: Optional[str] = None, session_id: Optional[str] = None,
+              check_rate_limits: bool = True, wait_seconds: Optional[float] = None) -> Admission:
+        return Admission(admitted=True)
+
+
+admission_controller = AdmissionController(create_kv_store()) if ADMISSION_ENABLED else _AdmitAll()
@@ -0,0 +1,104 @@
+"""Asynchronous job mode for long multi-agent turns.
+
+A turn submitted with ``"async": true`` is stored as a job in the shared
+key/value store and handed to a worker; the caller gets a job id at once and
+polls ``GET /jobs/{jobId}`` until the result is available. Results expire
+after JOB_TTL_SECONDS.
+
+Workers:
+  * ``lambda``: the function re-invokes itself asynchronously (InvocationType=Event)
+    with an ``asyncJob`` payload; requires KV_STORE_BACKEND=dynamodb so the
+    worker and the poller see the same store.
+  * ``thread``: an in-process thread pool, for local runs and containers.
+
+JOB_WORKER_MODE selects one; by default ``lambda`` inside Lambda, ``thread`` elsewhere.
+"""
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import json_codec
+from kv_store import InMemoryKVStore, create_kv_store
+
+logger = logging.getLogger()
+
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "3600"))
+JOB_WORKER_MODE = os.getenv("JOB_WORKER_MODE") or ("lambda" if os.getenv("AWS_LAMBDA_FUNCTION_NAME") else "thread")
+JOB_WORKER_THREADS = int(os.getenv("JOB_WORKER_THREADS", "4"))
+# Suggested delay before the first poll, returned to the client
+JOB_POLL_AFTER_MS = int(os.getenv("JOB_POLL_AFTER_MS", "1000"))
+# Workers are not bound by the API Gateway timeout: they may wait longer for a concurrency slot
+JOB_SLOT_WAIT_SECONDS = float(os.getenv("JOB_SLOT_WAIT_SECONDS", "60"))
+
+PENDING = "PENDING"
+RUNNING = "RUNNING"
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+
+job_store = create_kv_store()
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_lambda_client = None
+
+
+def _job_key(job_id: str) -> str:
+    return f"job#{job_id}"
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    job, _ = job_store.get(_job_key(job_id))
+    return job
+
+
+def _save(job: Dict[str, Any]) -> None:
+    job["updatedAt"] = time.time()
+    job_store.put(_job_key(job["jobId"]), job, ttl_seconds=JOB_TTL_SECONDS)
+
+
+def mark_running(job: Dict[str, Any]) -> None:
+    job["status"] = RUNNING
+    _save(job)
+
+
+def complete_job(job: Dict[str, Any], message: str) -> None:
+    job.update(status=SUCCEEDED, message=message)
+    _save(job)
+
+
+def fail_job(job: Dict[str, Any], error: str) -> None:
+    job.update(status=FAILED, error=error)
+    _save(job)
+
+
+def submit_job(payload: Dict[str, Any], context: Any, worker: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """Record a PENDING job for payload (prompt, sessionId, phoneNumber) and hand it to a worker.
+
+    In thread mode worker(job) runs in the pool; in lambda mode the function is
+    re-invoked with {"asyncJob": job} and must call worker itself. Lambda mode
+    with the in-memory store raises RuntimeError instead of queuing a lost job.
+    """
+    if JOB_WORKER_MODE == "lambda" and isinstance(job_store, InMemoryKVStore):
+        # The worker invocation and the polls land on other containers: they would never find the job
+        raise RuntimeError("Async jobs in lambda worker mode need a shared store: "
+                           "set KV_STORE_BACKEND=dynamodb (table KV_TABLE_NAME, default AgentState)")
+    job = dict(payload, jobId=str(uuid.uuid4()), status=PENDING, createdAt=time.time())
+    _save(job)
+    if JOB_WORKER_MODE == "lambda":
+        global _lambda_client
+        if _lambda_client is None:
+            import boto3
+            _lambda_client = boto3.client("lambda")
+        _lambda_client.invoke(
+            FunctionName=getattr(context, "invoked_function_arn", None) or os.environ["AWS_LAMBDA_FUNCTION_NAME"],
+            InvocationType="Event",
+            Payload=json_codec.dumps_bytes({"asyncJob": job}),
+        )
+    else:
+        global _thread_pool
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=JOB_WORKER_THREADS, thread_name_prefix="agent-job")
+        _thread_pool.submit(worker, job)
+    logger.info("Queued agent job %s (%s worker)", job["jobId"], JOB_WORKER_MODE)
+    return job
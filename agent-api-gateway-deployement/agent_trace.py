@@ -0,0 +1,299 @@
+"""Bedrock Agent trace capture and per-collaborator latency breakdown.
+
+With tracing on, invoke_agent is called with enableTrace=True and the
+``trace`` events of the response stream are turned into a timeline of steps:
+model invocations (with token counts), action-group calls, collaborator
+hand-offs, knowledge-base lookups and guardrail checks, each attributed to
+the agent that produced it (``router`` or the collaborator name).
+
+Step durations come from the trace metadata (totalTimeMs) when Bedrock
+provides it, otherwise from the event times (or arrival times) of the
+matching input and output events. At the end of a turn the summary is emitted as metrics
+(one EMF record per collaborator) and, when AGENT_TRACE_RECORD_PATH is set,
+the raw events are appended to a JSONL file that replay_trace_file() and
+tools/agent_trace_report.py can summarize offline.
+
+AGENT_TRACE_ENABLED turns tracing on for every turn; a request can also ask
+for it with ``"trace": true`` and then gets the summary in its response.
+"""
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import json_codec
+from metrics import emit_metrics
+
+logger = logging.getLogger()
+
+TRACE_ENABLED = os.getenv("AGENT_TRACE_ENABLED", "false").lower() in ("1", "true", "yes")
+TRACE_RECORD_PATH = os.getenv("AGENT_TRACE_RECORD_PATH")
+
+ROUTER = "router"
+
+# Trace parts without an input/output pair: one event is one complete step
+_SINGLE_EVENT_PARTS = {
+    "guardrailTrace": "guardrail",
+    "preProcessingTrace": "pre_processing",
+    "postProcessingTrace": "post_processing",
+    "routingClassifierTrace": "routing_classifier",
+}
+
+_INVOCATION_KINDS = {
+    "ACTION_GROUP": "action_group",
+    "ACTION_GROUP_CODE_INTERPRETER": "action_group",
+    "AGENT_COLLABORATOR": "collaborator",
+    "KNOWLEDGE_BASE": "knowledge_base",
+}
+
+
+def _event_time_ms(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return value.timestamp() * 1000 if isinstance(value, datetime) else None
+
+
+def _metadata(part: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the metadata block of a trace part, wherever this trace type puts it."""
+    if "metadata" in part:
+        return part["metadata"] or {}
+    for value in part.values():
+        if isinstance(value, dict) and "metadata" in value:
+            return value["metadata"] or {}
+    return {}
+
+
+class TraceCollector:
+    """Accumulate the trace events of one agent turn."""
+
+    def __init__(self) -> None:
+        self.started_ms = time.time() * 1000
+        self.events: List[Dict[str, Any]] = []
+        self.steps: List[Dict[str, Any]] = []
+        self._first_event_ms: Optional[float] = None
+        # (traceId, "model" | "tool") -> open step waiting for its output event
+        self._open: Dict[tuple, Dict[str, Any]] = {}
+
+    def add(self, event: Dict[str, Any], received_ms: Optional[float] = None) -> None:
+        """Feed one ``trace`` event of the invoke_agent stream."""
+        received_ms = time.time() * 1000 if received_ms is None else received_ms
+        self.events.append({"receivedMs": received_ms - self.started_ms, "trace": event})
+        self._parse(event, received_ms - self.started_ms)
+
+    def _parse(self, event: Dict[str, Any], offset_ms: float) -> None:
+        agent = event.get("collaboratorName") or ROUTER
+        event_ms = _event_time_ms(event.get("eventTime"))
+        # Bedrock's event times place steps more precisely than arrival times (events come in bursts)
+        if event_ms is not None:
+            if self._first_event_ms is None:
+                self._first_event_ms = event_ms
+            offset_ms = event_ms - self._first_event_ms
+        body = event.get("trace") or {}
+
+        for name, kind in _SINGLE_EVENT_PARTS.items():
+            if name in body:
+                part = body[name]
+                meta = _metadata(part)
+                self._add_step(agent, kind, name=part.get("action") or kind, start_ms=offset_ms,
+                               duration_ms=meta.get("totalTimeMs"), usage=meta.get("usage"))
+
+        orchestration = body.get("orchestrationTrace")
+        if not orchestration:
+            if "failureTrace" in body:
+                self._add_step(agent, "failure", name=body["failureTrace"].get("failureReason", "failure"),
+                               start_ms=offset_ms, duration_ms=0)
+            return
+
+        if "modelInvocationInput" in orchestration:
+            trace_id = orchestration["modelInvocationInput"].get("traceId")
+            self._open[(trace_id, "model")] = self._add_step(
+                agent, "model", name=orchestration["modelInvocationInput"].get("type", "ORCHESTRATION"),
+                start_ms=offset_ms, event_ms=event_ms)
+        if "modelInvocationOutput" in orchestration:
+            output = orchestration["modelInvocationOutput"]
+            self._close((output.get("traceId"), "model"), agent, "model", offset_ms, event_ms, output)
+        if "invocationInput" in orchestration:
+            invocation = orchestration["invocationInput"]
+            kind = _INVOCATION_KINDS.get(invocation.get("invocationType"))
+            if kind:
+                self._open[(invocation.get("traceId"), "tool")] = self._add_step(
+                    agent, kind, name=self._invocation_name(invocation), start_ms=offset_ms, event_ms=event_ms)
+        if "observation" in orchestration:
+            observation = orchestration["observation"]
+            kind = _INVOCATION_KINDS.get(observation.get("type"))
+            if kind:
+                self._close((observation.get("traceId"), "tool"), agent, kind, offset_ms, event_ms, observation)
+
+    @staticmethod
+    def _invocation_name(invocation: Dict[str, Any]) -> str:
+        action = invocation.get("actionGroupInvocationInput")
+        if action:
+            target = action.get("apiPath") or action.get("function") or ""
+            return f"{action.get('actionGroupName', '')}{' ' + target if target else ''}".strip()
+        collaborator = invocation.get("agentCollaboratorInvocationInput")
+        if collaborator:
+            return collaborator.get("agentCollaboratorName", "collaborator")
+        knowledge_base = invocation.get("knowledgeBaseLookupInput")
+        if knowledge_base:
+            return knowledge_base.get("knowledgeBaseId", "knowledge_base")
+        return invocation.get("invocationType", "")
+
+    def _add_step(self, agent: str, kind: str, name: str, start_ms: float,
+                  duration_ms: Optional[float] = None, usage: Optional[Dict[str, Any]] = None,
+                  event_ms: Optional[float] = None) -> Dict[str, Any]:
+        step = {
+            "agent": agent,
+            "kind": kind,
+            "name": name,
+            "startMs": round(start_ms, 1),
+            "durationMs": duration_ms,
+            "inputTokens": (usage or {}).get("inputTokens", 0),
+            "outputTokens": (usage or {}).get("outputTokens", 0),
+            "_eventMs": event_ms,
+        }
+        self.steps.append(step)
+        return step
+
+    def _close(self, key: tuple, agent: str, kind: str, offset_ms: float,
+               event_ms: Optional[float], part: Dict[str, Any]) -> None:
+        meta = _metadata(part)
+        step = self._open.pop(key, None)
+        if step is None:
+            # Output without its input (truncated recording): keep what the metadata says
+            step = self._add_step(agent, kind, name=kind, start_ms=offset_ms)
+        usage = meta.get("usage") or {}
+        step["inputTokens"] += usage.get("inputTokens", 0)
+        step["outputTokens"] += usage.get("outputTokens", 0)
+        if meta.get("totalTimeMs") is not None:
+            step["durationMs"] = meta["totalTimeMs"]
+        elif event_ms is not None and step["_eventMs"] is not None:
+            step["durationMs"] = max(0.0, event_ms - step["_eventMs"])
+        else:
+            step["durationMs"] = max(0.0, offset_ms - step["startMs"])
+
+    def summary(self, total_ms: Optional[float] = None) -> Dict[str, Any]:
+        """Per-turn summary: totals per agent and the step timeline."""
+        if total_ms is None:
+            ends = [s["startMs"] + (s["durationMs"] or 0.0) for s in self.steps]
+            total_ms = max([self.events[-1]["receivedMs"]] + ends) if self.events else 0.0
+        agents: Dict[str, Dict[str, Any]] = {}
+        timeline = []
+        for step in self.steps:
+            duration = step["durationMs"] or 0.0
+            totals = agents.setdefault(step["agent"], {
+                "modelMs": 0.0, "modelCalls": 0, "toolMs": 0.0, "toolCalls": 0,
+                "collaboratorMs": 0.0, "guardrailMs": 0.0, "otherMs": 0.0,
+                "inputTokens": 0, "outputTokens": 0,
+            })
+            if step["kind"] == "model":
+                totals["modelMs"] += duration
+                totals["modelCalls"] += 1
+            elif step["kind"] in ("action_group", "knowledge_base"):
+                totals["toolMs"] += duration
+                totals["toolCalls"] += 1
+            elif step["kind"] == "collaborator":
+                # Wall time spent waiting on a collaborator; its own steps are listed under its name
+                totals["collaboratorMs"] += duration
+            elif step["kind"] == "guardrail":
+                totals["guardrailMs"] += duration
+            else:
+                totals["otherMs"] += duration
+            totals["inputTokens"] += step["inputTokens"]
+            totals["outputTokens"] += step["outputTokens"]
+            timeline.append({k: v for k, v in step.items() if not k.startswith("_")})
+        for totals in agents.values():
+            for field in ("modelMs", "toolMs", "collaboratorMs", "guardrailMs", "otherMs"):
+                totals[field] = round(totals[field], 1)
+        return {
+            "totalMs": round(total_ms, 1),
+            "events": len(self.events),
+            "agents": agents,
+            "timeline": timeline,
+        }
+
+
+def finish_turn(collector: TraceCollector, session_id: str) -> Dict[str, Any]:
+    """Summarize a finished turn, emit its metrics and record its raw events if configured."""
+    summary = collector.summary(total_ms=time.time() * 1000 - collector.started_ms)
+    for agent, totals in summary["agents"].items():
+        emit_metrics(
+            {
+                "ModelTimeMs": (totals["modelMs"], "Milliseconds"),
+                "ToolTimeMs": (totals["toolMs"], "Milliseconds"),
+                "GuardrailTimeMs": (totals["guardrailMs"], "Milliseconds"),
+                "ModelCalls": totals["modelCalls"],
+                "ToolCalls": totals["toolCalls"],
+                "InputTokens": totals["inputTokens"],
+                "OutputTokens": totals["outputTokens"],
+            },
+            dimensions={"Service": "AskAgent", "Collaborator": agent},
+        )
+    emit_metrics(
+        {"TurnDurationMs": (summary["totalMs"], "Milliseconds"), "TraceEvents": summary["events"]},
+        dimensions={"Service": "AskAgent"},
+        properties={"sessionId": session_id},
+    )
+    if TRACE_RECORD_PATH:
+        try:
+            record_trace(TRACE_RECORD_PATH, collector, session_id)
+        except OSError as e:
+            logger.warning("Could not record agent trace: %s", e)
+    return summary
+
+
+def record_trace(path: str, collector: TraceCollector, session_id: str) -> None:
+    """Append the raw events of a turn to a JSONL file (one line per event)."""
+    with open(path, "a", encoding="utf-8") as f:
+        for event in collector.events:
+            f.write(json_codec.dumps(dict(event, sessionId=session_id)) + "\n")
+
+
+def iter_recorded_turns(lines: Iterable[str]) -> Iterable[Dict[str, Any]]:
+    """Group recorded events into turns: a turn ends when the session changes or receivedMs goes back."""
+    turn: List[Dict[str, Any]] = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        event = json_codec.loads(line)
+        # Bare trace events (e.g. exported from the console) carry no capture envelope
+        if "trace" not in event or "receivedMs" not in event:
+            event = {"receivedMs": None, "trace": event}
+        if turn and (event.get("sessionId") != turn[-1].get("sessionId") or
+                     (event["receivedMs"] is not None and turn[-1]["receivedMs"] is not None and
+                      event["receivedMs"] < turn[-1]["receivedMs"])):
+            yield _replay(turn)
+            turn = []
+        turn.append(event)
+    if turn:
+        yield _replay(turn)
+
+
+def _replay(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    collector = TraceCollector()
+    collector.started_ms = 0.0
+    last = 0.0
+    for event in events:
+        received = event["receivedMs"]
+        if received is None:
+            # Without capture times, fall back on Bedrock's event times relative to the first event
+            event_ms = _event_time_ms(event["trace"].get("eventTime"))
+            first_ms = _event_time_ms(events[0]["trace"].get("eventTime"))
+            received = event_ms - first_ms if event_ms is not None and first_ms is not None else last
+        last = received
+        collector.add(event["trace"], received_ms=received)
+    summary = collector.summary()
+    summary["sessionId"] = events[0].get("sessionId")
+    return summary
+
+
+def replay_trace_file(path: str) -> List[Dict[str, Any]]:
+    """Summarize every turn recorded in a trace file."""
+    with open(path, encoding="utf-8") as f:
+        return list(iter_recorded_turns(f))
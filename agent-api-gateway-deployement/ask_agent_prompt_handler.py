@@ -1,20 +1,228 @@
-import json
+import math
 import boto3
 import os
 import uuid
 from datetime import datetime
 
+import agent_jobs
+import agent_trace
+import intent_split
+import json_codec
+from admission_control import admission_controller
+from handler_profiler import profile_handler
+from phone_numbers import normalize_phone_or_raw
+from session_guard import BUSY, DUPLICATE, request_fingerprint, session_guard
+
 bedrock_client = boto3.client("bedrock-agent-runtime")
 
+AGENT_ID = os.environ.get('AGENT_ID', 'A4EY2J0JY4')
+AGENT_ALIAS = os.environ.get('AGENT_ALIAS', 'N3TXZ4PIC6')
+
 # CORS headers
 CORS_HEADERS = {
     'Content-Type': 'application/json',
     'Access-Control-Allow-Origin': '*',
     'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+    'Access-Control-Expose-Headers': 'Retry-After'
 }
 
 
+def run_agent_turn(user_prompt, session_id, phone_number=None, trace_collector=None,
+                   agent_id=None, agent_alias=None):
+    """
+    Invokes the router agent (or the agent given) for one conversation turn and returns its text answer.
+    With a trace_collector, the orchestration trace is requested and fed to it.
+    """
+    # Include phone number context in the prompt if provided
+    if phone_number:
+        context_prompt = f"User phone: {phone_number}\n\nUser request: {user_prompt}"
+    else:
+        context_prompt = user_prompt
+
+    response = bedrock_client.invoke_agent(
+        agentId=agent_id or AGENT_ID,
+        agentAliasId=agent_alias or AGENT_ALIAS,
+        sessionId=session_id,
+        inputText=context_prompt,
+        enableTrace=trace_collector is not None
+    )
+
+    # Parse the response - it's a streaming response
+    agent_response = ""
+
+    # The response is an event stream
+    if "completion" in response:
+        for event in response["completion"]:
+            # Handle different event types
+            if "chunk" in event:
+                chunk = event["chunk"]
+                if "bytes" in chunk:
+                    agent_response += chunk["bytes"].decode('utf-8')
+            elif "trace" in event:
+                if trace_collector is not None:
+                    trace_collector.add(event["trace"])
+            elif isinstance(event, dict) and "text" in event:
+                agent_response += event.get("text", "")
+
+    # Fallback: try to get the response as a string
+    if not agent_response:
+        agent_response = str(response.get("completion", "No response from agent"))
+
+    return agent_response.strip()
+
+
+def answer_prompt(user_prompt, session_id, phone_number=None, traced=False, split=None):
+    """
+    Answers one turn: through the router, or, in split mode, through the collaborators of its
+    independent intents concurrently (see intent_split.py).
+    Returns the answer and the (sessionId, TraceCollector) pairs to finish when traced.
+    """
+    plan = intent_split.plan_split(user_prompt, phone_number) if intent_split.split_enabled(split) else None
+    if not plan:
+        collector = agent_trace.TraceCollector() if traced else None
+        answer = run_agent_turn(user_prompt, session_id, phone_number, trace_collector=collector)
+        return answer, [(session_id, collector)] if collector is not None else []
+
+    traces = []
+
+    def invoke(sub):
+        sub_session = intent_split.sub_session_id(session_id, sub.agent)
+        collector = agent_trace.TraceCollector() if traced else None
+        if collector is not None:
+            traces.append((sub_session, collector))
+        agent = intent_split.COLLABORATOR_AGENTS[sub.agent]
+        return run_agent_turn(sub.text, sub_session, phone_number, trace_collector=collector,
+                              agent_id=agent['agentId'], agent_alias=agent['aliasId'])
+
+    # Extra concurrent calls take their own slot without queueing; the others run after
+    answer = intent_split.run_split(
+        plan, invoke, acquire_slot=lambda: admission_controller.admit(check_rate_limits=False, wait_seconds=0))
+    return answer, traces
+
+
+def _too_many_requests(admission, session_id):
+    return {
+        'statusCode': 429,
+        'headers': dict(CORS_HEADERS, **{'Retry-After': str(max(1, math.ceil(admission.retry_after)))}),
+        'body': json_codec.dumps({
+            'status': 'error',
+            'message': 'Too many requests, please retry shortly',
+            'reason': admission.reason,
+            'retryAfter': admission.retry_after,
+            'sessionId': session_id
+        })
+    }
+
+
+def _session_busy(turn, session_id):
+    return {
+        'statusCode': 409,
+        'headers': dict(CORS_HEADERS, **{'Retry-After': str(max(1, math.ceil(turn.retry_after)))}),
+        'body': json_codec.dumps({
+            'status': 'error',
+            'message': 'Another request is still running in this conversation, please retry shortly',
+            'reason': turn.reason,
+            'retryAfter': turn.retry_after,
+            'sessionId': session_id
+        })
+    }
+
+
+def process_job(job):
+    """
+    Runs a queued turn in a worker and stores the outcome with the job for polling.
+    """
+    # Turns of a session run one at a time; an identical turn already answered is reused
+    turn = session_guard.begin(job['sessionId'],
+                               request_fingerprint(job['sessionId'], job['prompt'], job.get('phoneNumber')),
+                               wait_seconds=agent_jobs.JOB_SLOT_WAIT_SECONDS)
+    if turn.status == DUPLICATE:
+        agent_jobs.complete_job(job, turn.result['message'])
+        return
+    if turn.status == BUSY:
+        agent_jobs.fail_job(job, 'Another request is still running in this conversation, please retry')
+        return
+    admission = admission_controller.admit(check_rate_limits=False, wait_seconds=agent_jobs.JOB_SLOT_WAIT_SECONDS)
+    if not admission.admitted:
+        turn.release()
+        agent_jobs.fail_job(job, f'Agent capacity exceeded ({admission.reason}), please retry')
+        return
+    try:
+        agent_jobs.mark_running(job)
+        message, traces = answer_prompt(job['prompt'], job['sessionId'], job.get('phoneNumber'),
+                                        traced=agent_trace.TRACE_ENABLED, split=job.get('split'))
+        agent_jobs.complete_job(job, message)
+        turn.complete({
+            'status': 'success',
+            'message': message,
+            'sessionId': job['sessionId'],
+            'timestamp': datetime.utcnow().isoformat()
+        })
+        for trace_session, collector in traces:
+            agent_trace.finish_turn(collector, trace_session)
+    except Exception as e:
+        print(f"Error running agent job {job['jobId']}: {e}")
+        agent_jobs.fail_job(job, str(e))
+    finally:
+        admission.release()
+        turn.release()
+
+
+def job_status_response(job_id):
+    """
+    Builds the poll response for GET /jobs/{jobId}.
+    """
+    job = agent_jobs.get_job(job_id)
+    if not job:
+        return {
+            'statusCode': 404,
+            'headers': CORS_HEADERS,
+            'body': json_codec.dumps({
+                'status': 'error',
+                'message': 'Job not found or expired',
+                'jobId': job_id
+            })
+        }
+    if job['status'] == agent_jobs.SUCCEEDED:
+        return {
+            'statusCode': 200,
+            'headers': CORS_HEADERS,
+            'body': json_codec.dumps({
+                'status': 'success',
+                'jobStatus': job['status'],
+                'jobId': job_id,
+                'message': job['message'],
+                'sessionId': job['sessionId'],
+                'timestamp': datetime.utcfromtimestamp(job['updatedAt']).isoformat()
+            })
+        }
+    if job['status'] == agent_jobs.FAILED:
+        return {
+            'statusCode': 200,
+            'headers': CORS_HEADERS,
+            'body': json_codec.dumps({
+                'status': 'error',
+                'jobStatus': job['status'],
+                'jobId': job_id,
+                'message': 'Failed to process your request',
+                'error': job.get('error'),
+                'sessionId': job['sessionId']
+            })
+        }
+    return {
+        'statusCode': 202,
+        'headers': CORS_HEADERS,
+        'body': json_codec.dumps({
+            'status': 'pending',
+            'jobStatus': job['status'],
+            'jobId': job_id,
+            'pollAfterMs': agent_jobs.JOB_POLL_AFTER_MS
+        })
+    }
+
+
+@profile_handler("askAgent")
 def lambda_handler(event, context):
     """
     Handles chatbot prompts from the frontend.
@@ -26,25 +234,41 @@ def lambda_handler(event, context):
         return {
             'statusCode': 200,
             'headers': CORS_HEADERS,
-            'body': json.dumps({'message': 'OK'})
+            'body': json_codec.dumps({'message': 'OK'})
         }
     
+    # Asynchronous self-invocation carrying a queued job (see agent_jobs.py)
+    if 'asyncJob' in event:
+        process_job(event['asyncJob'])
+        return {'status': 'done', 'jobId': event['asyncJob'].get('jobId')}
+    
+    # Job polling: GET /jobs/{jobId}
+    job_id = (event.get('pathParameters') or {}).get('jobId')
+    if not job_id and event.get('rawPath', '').startswith('/jobs/'):
+        job_id = event['rawPath'][len('/jobs/'):]
+    if job_id:
+        return job_status_response(job_id)
+    
     # Parse the incoming request
     try:
         if isinstance(event.get('body'), str):
-            body = json.loads(event['body'])
+            body = json_codec.loads(event['body'])
         else:
             body = event.get('body', event)
         
         user_prompt = body.get('prompt') or body.get('message')
         session_id = body.get('sessionId') or str(uuid.uuid4())
-        phone_number = body.get('phoneNumber') or body.get('phone')
+        # E.164 so the agent, the actions and the per-phone limits all see the same key
+        phone_number = normalize_phone_or_raw(body.get('phoneNumber') or body.get('phone'))
+        async_mode = body.get('async') in (True, 'true', '1', 1)
+        trace_requested = body.get('trace') in (True, 'true', '1', 1)
+        split_requested = body.get('split')
         
         if not user_prompt:
             return {
                 'statusCode': 400,
                 'headers': CORS_HEADERS,
-                'body': json.dumps({
+                'body': json_codec.dumps({
                     'status': 'error',
                     'message': 'Prompt is required'
                 })
@@ -55,57 +279,103 @@ def lambda_handler(event, context):
         return {
             'statusCode': 400,
             'headers': CORS_HEADERS,
-            'body': json.dumps({
+            'body': json_codec.dumps({
                 'status': 'error',
                 'message': 'Invalid request format'
             })
         }
 
-    # Invoke Bedrock Agent
+    fingerprint = request_fingerprint(session_id, user_prompt, phone_number)
+
+    # Async mode: enqueue the turn and return a job id right away; the worker takes the concurrency slot
+    if async_mode:
+        # A resubmitted prompt (retry, reconnect, second tab) polls the job already queued for it
+        existing_job_id = session_guard.submitted_job(fingerprint)
+        if existing_job_id:
+            return {
+                'statusCode': 202,
+                'headers': CORS_HEADERS,
+                'body': json_codec.dumps({
+                    'status': 'accepted',
+                    'jobId': existing_job_id,
+                    'sessionId': session_id,
+                    'pollAfterMs': agent_jobs.JOB_POLL_AFTER_MS,
+                    'coalesced': True
+                })
+            }
+        limited = admission_controller.check_rate_limits(phone_number=phone_number, session_id=session_id)
+        if not limited.admitted:
+            return _too_many_requests(limited, session_id)
+        try:
+            job = agent_jobs.submit_job(
+                {'prompt': user_prompt, 'sessionId': session_id, 'phoneNumber': phone_number,
+                 'split': split_requested},
+                context,
+                process_job
+            )
+            session_guard.remember_job(fingerprint, job['jobId'])
+        except Exception as e:
+            print(f"Error queuing agent job: {e}")
+            return {
+                'statusCode': 500,
+                'headers': CORS_HEADERS,
+                'body': json_codec.dumps({
+                    'status': 'error',
+                    'message': 'Failed to queue your request',
+                    'error': str(e)
+                })
+            }
+        return {
+            'statusCode': 202,
+            'headers': CORS_HEADERS,
+            'body': json_codec.dumps({
+                'status': 'accepted',
+                'jobId': job['jobId'],
+                'sessionId': session_id,
+                'pollAfterMs': agent_jobs.JOB_POLL_AFTER_MS
+            })
+        }
+
+    # One turn at a time per session; an identical prompt in flight shares that turn's answer
+    turn = session_guard.begin(session_id, fingerprint)
+    if turn.status == DUPLICATE:
+        return {
+            'statusCode': 200,
+            'headers': CORS_HEADERS,
+            'body': json_codec.dumps(dict(turn.result, coalesced=True))
+        }
+    if turn.status == BUSY:
+        return _session_busy(turn, session_id)
+
+    # Admission control: per-phone/per-session rate limits and global concurrency ceiling
+    admission = admission_controller.admit(phone_number=phone_number, session_id=session_id)
+    if not admission.admitted:
+        turn.release()
+        return _too_many_requests(admission, session_id)
+
+    # Invoke Bedrock Agent (with the orchestration trace when enabled or requested)
     try:
-        agent_id = 'A4EY2J0JY4'
-        agent_alias =  'N3TXZ4PIC6'
-        
-        # Include phone number context in the prompt if provided
-        if phone_number:
-            context_prompt = f"User phone: {phone_number}\n\nUser request: {user_prompt}"
-        else:
-            context_prompt = user_prompt
-        
-        response = bedrock_client.invoke_agent(
-            agentId=agent_id,
-            agentAliasId=agent_alias,
-            sessionId=session_id,
-            inputText=context_prompt
-        )
-        
-        # Parse the response - it's a streaming response
-        agent_response = ""
+        agent_response, traces = answer_prompt(user_prompt, session_id, phone_number,
+                                               traced=agent_trace.TRACE_ENABLED or trace_requested,
+                                               split=split_requested)
         
-        # The response is an event stream
-        if "completion" in response:
-            for event in response["completion"]:
-                # Handle different event types
-                if "chunk" in event:
-                    chunk = event["chunk"]
-                    if "bytes" in chunk:
-                        agent_response += chunk["bytes"].decode('utf-8')
-                elif isinstance(event, dict) and "text" in event:
-                    agent_response += event.get("text", "")
-        
-        # Fallback: try to get the response as a string
-        if not agent_response:
-            agent_response = str(response.get("completion", "No response from agent"))
+        response_body = {
+            'status': 'success',
+            'message': agent_response,
+            'sessionId': session_id,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+        # Published before the trace is attached: duplicates get the answer, not this turn's trace
+        turn.complete(dict(response_body))
+        summaries = [agent_trace.finish_turn(collector, trace_session) for trace_session, collector in traces]
+        if summaries and trace_requested:
+            # A split turn has one trace per collaborator call
+            response_body['trace'] = summaries[0] if len(summaries) == 1 else {'split': summaries}
         
         return {
             'statusCode': 200,
             'headers': CORS_HEADERS,
-            'body': json.dumps({
-                'status': 'success',
-                'message': agent_response.strip(),
-                'sessionId': session_id,
-                'timestamp': datetime.utcnow().isoformat()
-            })
+            'body': json_codec.dumps(response_body)
         }
     
     except Exception as e:
@@ -113,9 +383,12 @@ def lambda_handler(event, context):
         return {
             'statusCode': 500,
             'headers': CORS_HEADERS,
-            'body': json.dumps({
+            'body': json_codec.dumps({
                 'status': 'error',
                 'message': 'Failed to process your request',
                 'error': str(e)
             })
         }
+    finally:
+        admission.release()
+        turn.release()
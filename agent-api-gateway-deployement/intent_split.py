@@ -0,0 +1,196 @@
+"""Split mode: concurrent collaborator calls for prompts with independent intents.
+
+The router handles a multi-intent prompt ("envoie 500 FC à X et recommande-moi
+un forfait") one collaborator after the other, although neither needs the
+other's answer. In split mode the prompt is cut into clauses and each clause is
+classified with the routing keywords of the router prompt. When the intents are
+independent, each collaborator agent is invoked directly and concurrently, on
+its own session (``<sessionId>:<Agent>``), and the answers are merged in the
+order of the prompt.
+
+The prompt goes to the router as before (sequential) when:
+  * it has a single intent, a clause the keywords do not recognize, or fewer
+    than two collaborators;
+  * it states an order or a condition (puis, ensuite, si, then, if, ...) or
+    refers back to another clause (active-le, it, ce forfait, ...);
+  * one intent writes what another reads or writes: a balance check or an
+    activation next to a transfer, an activation next to a recommendation;
+  * no phone number is known for a clause (no phone context and none in the
+    clause): the router would carry it over from the other clause.
+
+Clauses for the same collaborator stay together, in one call. Each extra
+concurrent call takes its own admission slot (without waiting); a clause that
+gets none runs after the others.
+
+INTENT_SPLIT_ENABLED turns split mode on for every turn; a request can also ask
+for it (or opt out) with ``"split": true|false``. COLLABORATOR_AGENTS maps each
+collaborator to its agent and alias, e.g.
+``{"SubscriptionAgent": {"agentId": "...", "aliasId": "..."}, ...}``.
+"""
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import json_codec
+from metrics import emit_metrics
+
+logger = logging.getLogger()
+
+INTENT_SPLIT_ENABLED = os.getenv("INTENT_SPLIT_ENABLED", "false").lower() in ("1", "true", "yes")
+COLLABORATOR_AGENTS: Dict[str, Dict[str, str]] = json_codec.loads(os.getenv("COLLABORATOR_AGENTS") or "{}")
+# Collaborator calls of one turn running at the same time
+INTENT_SPLIT_MAX_PARALLEL = int(os.getenv("INTENT_SPLIT_MAX_PARALLEL", "3"))
+
+
+@dataclass(frozen=True)
+class Intent:
+    name: str
+    agent: str
+    keywords: tuple
+    reads: frozenset = frozenset()
+    writes: frozenset = frozenset()
+
+
+# In priority order: "recommande-moi un forfait" is a recommendation, "transfère du crédit" a transfer.
+# Keywords follow the ROUTING LOGIC of agents/router_agent_prompt.txt.
+INTENTS = (
+    Intent("recommend", "RecommendationAgent",
+           ("recommand", "recommend", "conseil", "suggè", "sugge", "meilleur", "best"),
+           reads=frozenset({"subscriptions"})),
+    Intent("transfer", "MoneyTransferAgent",
+           ("envoi", "envoy", "transf", "paiement", "payment", "send", "mobile money"),
+           writes=frozenset({"balance"})),
+    Intent("activate", "SubscriptionAgent", ("activ", "souscri", "subscribe"),
+           reads=frozenset({"balance"}), writes=frozenset({"balance", "subscriptions"})),
+    Intent("balance", "SubscriptionAgent", ("solde", "balance", "crédit", "credit"),
+           reads=frozenset({"balance", "subscriptions"})),
+)
+
+_KEYWORD_RES = [(intent, re.compile(r"(?<!\w)(?:" + "|".join(re.escape(k) for k in intent.keywords) + ")"))
+                for intent in INTENTS]
+_CLAUSE_SEPARATOR = re.compile(r"\s*(?:[;\n]|[.!?](?=\s)|,?\s+(?:et|and)\s+)\s*", re.IGNORECASE)
+_DEPENDENCY_MARKERS = re.compile(
+    r"(?<!\w)(?:puis|ensuite|apr[eè]s|avant|sinon|si|selon|reste|then|after|afterwards|before|if|otherwise|"
+    r"depending|rest|remaining|it|that one|ce forfait|cette offre|celui-ci|celui-l[aà])(?!\w)"
+    r"|-(?:le|la|les|lui)(?!\w)",
+    re.IGNORECASE)
+_PHONE = re.compile(r"(?:\+|00)?\d[\d\s\-.]{7,}\d")
+
+
+@dataclass
+class SubIntent:
+    agent: str
+    text: str
+    intents: List[str] = field(default_factory=list)
+
+
+def split_enabled(requested: Any = None) -> bool:
+    """Split mode for this turn: the request's ``split`` flag if given, else INTENT_SPLIT_ENABLED."""
+    if requested is not None:
+        enabled = requested in (True, "true", "1", 1)
+    else:
+        enabled = INTENT_SPLIT_ENABLED
+    return enabled and bool(COLLABORATOR_AGENTS)
+
+
+def classify(clause: str) -> Optional[Intent]:
+    text = clause.lower()
+    for intent, keyword_re in _KEYWORD_RES:
+        if keyword_re.search(text):
+            return intent
+    return None
+
+
+def _clauses(prompt: str) -> List[str]:
+    clauses, start = [], 0
+    for separator in _CLAUSE_SEPARATOR.finditer(prompt):
+        clauses.append(prompt[start:separator.start()])
+        start = separator.end()
+    clauses.append(prompt[start:])
+    return [clause.strip() for clause in clauses if clause.strip()]
+
+
+def _conflict(a: Intent, b: Intent) -> bool:
+    return bool(a.writes & (b.reads | b.writes) or b.writes & a.reads)
+
+
+def plan_split(prompt: str, phone_number: Optional[str] = None) -> Optional[List[SubIntent]]:
+    """The sub-intents to run concurrently, in prompt order, or None if the prompt must go to the router."""
+    if _DEPENDENCY_MARKERS.search(prompt):
+        return None
+    classified = [(clause, classify(clause)) for clause in _clauses(prompt)]
+    if len(classified) < 2 or any(intent is None for _, intent in classified):
+        return None
+    for i, (_, a) in enumerate(classified):
+        for _, b in classified[i + 1:]:
+            if a.agent != b.agent and _conflict(a, b):
+                return None
+    if not phone_number and not all(_PHONE.search(clause) for clause, _ in classified):
+        return None
+
+    plan: Dict[str, SubIntent] = {}
+    for clause, intent in classified:
+        sub = plan.setdefault(intent.agent, SubIntent(agent=intent.agent, text=clause))
+        if sub.intents:
+            sub.text = f"{sub.text}. {clause}"
+        sub.intents.append(intent.name)
+    if len(plan) < 2 or any(agent not in COLLABORATOR_AGENTS for agent in plan):
+        return None
+    return list(plan.values())
+
+
+def sub_session_id(session_id: str, agent: str) -> str:
+    """Session of a collaborator within a conversation (Bedrock session ids are at most 100 characters)."""
+    suffix = f":{agent}"
+    return session_id[:100 - len(suffix)] + suffix
+
+
+def run_split(plan: List[SubIntent], invoke: Callable[[SubIntent], str],
+              acquire_slot: Callable[[], Any]) -> str:
+    """Run invoke(sub) for every sub-intent, concurrently where slots allow, and merge the answers.
+
+    The first sub-intent uses the turn's own admission slot; acquire_slot()
+    returns an Admission for each extra concurrent call. A failed sub-intent is
+    reported in the merged answer; if all of them fail, the first error is raised.
+    """
+    concurrent, deferred, admissions = plan[:1], [], []
+    for sub in plan[1:]:
+        if len(concurrent) < INTENT_SPLIT_MAX_PARALLEL:
+            admission = acquire_slot()
+            if admission.admitted:
+                admissions.append(admission)
+                concurrent.append(sub)
+                continue
+        deferred.append(sub)
+
+    outcomes: Dict[int, Any] = {}
+
+    def attempt(sub: SubIntent) -> None:
+        try:
+            outcomes[id(sub)] = invoke(sub)
+        except Exception as e:
+            logger.warning("Split sub-intent for %s failed: %s", sub.agent, e)
+            outcomes[id(sub)] = e
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(concurrent), thread_name_prefix="split") as pool:
+            list(pool.map(attempt, concurrent))
+    finally:
+        for admission in admissions:
+            admission.release()
+    for sub in deferred:
+        attempt(sub)
+
+    emit_metrics({"SplitTurns": 1, "SplitSubIntents": len(plan), "SplitDeferred": len(deferred)},
+                 dimensions={"Service": "AskAgent"})
+    failures = [outcomes[id(sub)] for sub in plan if isinstance(outcomes[id(sub)], Exception)]
+    if len(failures) == len(plan):
+        raise failures[0]
+    return "\n\n".join(
+        f"Je n'ai pas pu traiter cette partie de votre demande : « {sub.text} ». Veuillez réessayer."
+        if isinstance(outcomes[id(sub)], Exception) else outcomes[id(sub)]
+        for sub in plan
+    )
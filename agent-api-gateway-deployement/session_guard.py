@@ -0,0 +1,157 @@
+"""Per-session turn serialization and duplicate-submit coalescing.
+
+The frontend only guards double submits with an in-page flag. Retries,
+reconnects and several tabs still send concurrent turns on the same
+sessionId, which conflict inside Bedrock or run the same money transfer twice.
+
+  * One turn at a time per session: a turn holds a lease on its session in
+    the shared key/value store. A different prompt on a busy session waits up
+    to SESSION_WAIT_SECONDS for the lease, then gets a ``session_busy`` rejection.
+  * Identical prompts are coalesced: a prompt whose fingerprint (session, phone,
+    normalized text) matches the turn in flight waits for that turn's answer
+    instead of starting a new agent run. Successful answers are kept for
+    COALESCE_RESULT_TTL_SECONDS, so a late retry gets the same answer too.
+    A failed turn stores nothing: the next duplicate runs the turn again.
+  * Async submissions are deduplicated the same way: an identical prompt
+    submitted while its job is queued or running gets the same jobId back.
+
+Leases expire on their own (SESSION_LEASE_SECONDS) if a container dies mid-turn.
+"""
+import hashlib
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from kv_store import KeyValueStore, create_kv_store
+from metrics import emit_metrics
+
+SESSION_GUARD_ENABLED = os.getenv("SESSION_GUARD_ENABLED", "true").lower() not in ("0", "false", "no")
+# Should exceed the Lambda timeout so a live turn never loses its session
+SESSION_LEASE_SECONDS = float(os.getenv("SESSION_LEASE_SECONDS", "120"))
+SESSION_WAIT_SECONDS = float(os.getenv("SESSION_WAIT_SECONDS", "10"))
+# Kept under the API Gateway timeout (29 s)
+COALESCE_WAIT_SECONDS = float(os.getenv("COALESCE_WAIT_SECONDS", "25"))
+COALESCE_RESULT_TTL_SECONDS = float(os.getenv("COALESCE_RESULT_TTL_SECONDS", "30"))
+
+OWNER = "owner"
+DUPLICATE = "duplicate"
+BUSY = "busy"
+
+
+def request_fingerprint(session_id: str, prompt: str, phone_number: Optional[str] = None) -> str:
+    """Identity of a turn: same session, same phone, same prompt up to case and spacing."""
+    text = " ".join(prompt.split()).casefold()
+    return hashlib.sha256(f"{session_id}\n{phone_number or ''}\n{text}".encode("utf-8")).hexdigest()[:32]
+
+
+@dataclass
+class Turn:
+    status: str
+    result: Optional[Dict[str, Any]] = None
+    reason: Optional[str] = None
+    retry_after: float = 0.0
+    complete: Callable[[Dict[str, Any]], None] = lambda result: None
+    release: Callable[[], None] = lambda: None
+
+
+class SessionGuard:
+    def __init__(self, store: KeyValueStore,
+                 lease_seconds: float = SESSION_LEASE_SECONDS,
+                 wait_seconds: float = SESSION_WAIT_SECONDS,
+                 coalesce_wait_seconds: float = COALESCE_WAIT_SECONDS,
+                 result_ttl_seconds: float = COALESCE_RESULT_TTL_SECONDS,
+                 poll_interval: float = 0.1) -> None:
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.wait_seconds = wait_seconds
+        self.coalesce_wait_seconds = coalesce_wait_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self.poll_interval = poll_interval
+
+    @staticmethod
+    def _lease_key(session_id: str) -> str:
+        return f"session#lease#{session_id}"
+
+    @staticmethod
+    def _result_key(fingerprint: str) -> str:
+        return f"session#result#{fingerprint}"
+
+    @staticmethod
+    def _job_key(fingerprint: str) -> str:
+        return f"session#job#{fingerprint}"
+
+    def submitted_job(self, fingerprint: str) -> Optional[str]:
+        """jobId of an identical async turn submitted recently, if any."""
+        job, _ = self.store.get(self._job_key(fingerprint))
+        return job["jobId"] if job else None
+
+    def remember_job(self, fingerprint: str, job_id: str) -> None:
+        self.store.put(self._job_key(fingerprint), {"jobId": job_id},
+                       ttl_seconds=self.lease_seconds + self.result_ttl_seconds)
+
+    def begin(self, session_id: str, fingerprint: str, wait_seconds: Optional[float] = None) -> Turn:
+        """Take the session for this turn, or return the answer of an identical turn.
+
+        wait_seconds overrides how long the turn may wait, for the session or for an
+        identical turn in flight (workers are not bound by the API Gateway timeout).
+        """
+        started = time.monotonic()
+        lease_key = self._lease_key(session_id)
+        while True:
+            result, _ = self.store.get(self._result_key(fingerprint))
+            if result is not None:
+                self._count("TurnsCoalesced")
+                return Turn(status=DUPLICATE, result=result)
+
+            lease, version = self.store.get(lease_key)
+            if lease is None:
+                owner = str(uuid.uuid4())
+                if self.store.put(lease_key, {"owner": owner, "fingerprint": fingerprint},
+                                  ttl_seconds=self.lease_seconds, expected_version=version):
+                    return Turn(status=OWNER,
+                                complete=lambda answer: self._complete(lease_key, owner, fingerprint, answer),
+                                release=lambda: self._release(lease_key, owner))
+                continue
+
+            duplicate = lease["fingerprint"] == fingerprint
+            # A duplicate waits for the turn in flight; a different prompt waits for the session
+            limit = wait_seconds if wait_seconds is not None else (
+                self.coalesce_wait_seconds if duplicate else self.wait_seconds)
+            if time.monotonic() - started >= limit:
+                reason = "duplicate_in_flight" if duplicate else "session_busy"
+                self._count("SessionBusyRejected", reason)
+                return Turn(status=BUSY, reason=reason, retry_after=max(1.0, self.poll_interval))
+            time.sleep(self.poll_interval)
+
+    def _complete(self, lease_key: str, owner: str, fingerprint: str, result: Dict[str, Any]) -> None:
+        # The answer is published before the lease goes, so waiting duplicates never start a new run
+        self.store.put(self._result_key(fingerprint), result, ttl_seconds=self.result_ttl_seconds)
+        self._release(lease_key, owner)
+
+    def _release(self, lease_key: str, owner: str) -> None:
+        lease, _ = self.store.get(lease_key)
+        if lease is not None and lease.get("owner") == owner:
+            self.store.delete(lease_key)
+
+    @staticmethod
+    def _count(metric: str, reason: Optional[str] = None) -> None:
+        dimensions = {"Service": "AskAgent"}
+        if reason:
+            dimensions["Reason"] = reason
+        emit_metrics({metric: 1}, dimensions=dimensions)
+
+
+class _Unguarded:
+    def submitted_job(self, fingerprint: str) -> Optional[str]:
+        return None
+
+    def remember_job(self, fingerprint: str, job_id: str) -> None:
+        pass
+
+    def begin(self, session_id: str, fingerprint: str, wait_seconds: Optional[float] = None) -> Turn:
+        return Turn(status=OWNER)
+
+
+session_guard = SessionGuard(create_kv_store()) if SESSION_GUARD_ENABLED else _Unguarded()
@@ -1,17 +1,32 @@
 import os
-import json
 import logging
 from typing import Any, Dict, Optional
 from http import HTTPStatus
 import urllib.request
 import urllib.error
 
+from error_codes import api_result_code, backoff_delay, call_with_retries, is_retryable
+from handler_profiler import profile_handler
+import json_codec
+from openapi_validation import load_validators, validation_error_response
+from tool_response import build_tool_text
+from traffic_capture import capture_handler
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 API_BASE_URL_ENV = "API_BASE_URL"
 API_KEY_ENV = "API_KEY"
 DEFAULT_API_BASE_URL = "https://w39lzo6tk7.execute-api.us-east-1.amazonaws.com/prod"
+OPENAPI_SPEC_ENV = "OPENAPI_SPEC_PATH"
+MAX_ATTEMPTS = int(os.getenv("ACTION_MAX_ATTEMPTS", "3"))
+RETRY_BASE_SECONDS = float(os.getenv("ACTION_RETRY_BASE_SECONDS", "0.1"))
+RETRY_CAP_SECONDS = float(os.getenv("ACTION_RETRY_CAP_SECONDS", "1.0"))
+
+# Parameter validators compiled once per container from the action group's OpenAPI schema
+VALIDATORS = load_validators(
+    os.getenv(OPENAPI_SPEC_ENV) or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'subscription_agent_actions_api.json')
+)
 
 
 def _build_url(path: str) -> str:
@@ -34,13 +49,13 @@ def _make_api_call(path: str, method: str = 'POST', body: Optional[Dict[str, Any
         headers['x-api-key'] = api_key
     data = None
     if body is not None:
-        data = json.dumps(body).encode('utf-8')
+        data = json_codec.dumps_bytes(body)
     req = urllib.request.Request(url, data=data, headers=headers, method=method)
     try:
         with urllib.request.urlopen(req, timeout=timeout) as resp:
             resp_body = resp.read().decode('utf-8')
             try:
-                parsed = json.loads(resp_body) if resp_body else None
+                parsed = json_codec.loads(resp_body) if resp_body else None
             except Exception:
                 parsed = resp_body
             return {
@@ -50,7 +65,7 @@ def _make_api_call(path: str, method: str = 'POST', body: Optional[Dict[str, Any
     except urllib.error.HTTPError as e:
         try:
             err_body = e.read().decode('utf-8')
-            parsed = json.loads(err_body) if err_body else None
+            parsed = json_codec.loads(err_body) if err_body else None
         except Exception:
             parsed = err_body
         return {
@@ -66,9 +81,12 @@ def _make_api_call(path: str, method: str = 'POST', body: Optional[Dict[str, Any
         }
 
 
+# Opt-in capture of real tool calls for tools/replay_action_traffic.py (ACTION_CAPTURE_PATH)
+@capture_handler("subscriptions")
+@profile_handler("subscriptions")
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     try:
-        logger.info('Received event: %s', json.dumps(event, default=str))
+        logger.info('Received event: %s', json_codec.dumps(event))
         
         action_group = event['actionGroup']
         api_path = event['apiPath']
@@ -88,12 +106,12 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         parameters = app_json['properties']
                     else:
                         parameters = app_json
-                    logger.info('Extracted parameters from requestBody: %s', json.dumps(parameters))
+                    logger.info('Extracted parameters from requestBody: %s', json_codec.dumps(parameters))
         
         # Fallback to top-level parameters if requestBody not present
         if not parameters:
             parameters = event.get('parameters', [])
-            logger.info('Using top-level parameters: %s', json.dumps(parameters))
+            logger.info('Using top-level parameters: %s', json_codec.dumps(parameters))
 
         # Parse parameters from Bedrock format (array of {name, type, value})
         if isinstance(parameters, list):
@@ -102,13 +120,19 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 if isinstance(param, dict) and 'name' in param and 'value' in param:
                     params_dict[param['name']] = param['value']
             parameters = params_dict
-            logger.info('Parsed parameters to dict: %s', json.dumps(parameters))
+            logger.info('Parsed parameters to dict: %s', json_codec.dumps(parameters))
         elif not isinstance(parameters, dict):
             parameters = {}
 
+        # Reject malformed tool calls here instead of after a round trip to the business API
+        parameters, validation_errors = VALIDATORS.validate(api_path, http_method, parameters)
+        if validation_errors:
+            logger.info('Rejected invalid parameters: %s', json_codec.dumps(validation_errors))
+            return validation_error_response(event, validation_errors)
+
         # Map parameters to match backend Lambda expectations
         backend_params = parameters.copy()
-        logger.info('Initial backend_params: %s', json.dumps(backend_params))
+        logger.info('Initial backend_params: %s', json_codec.dumps(backend_params))
         
         # For /checkBalance: map customerId -> phone_number
         if api_path.rstrip('/').endswith('/checkBalance') or api_path == '/checkBalance':
@@ -125,6 +149,10 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             if 'planId' in backend_params:
                 backend_params['subscription_id'] = backend_params.pop('planId')
                 logger.info('Mapped planId to subscription_id')
+            # Cart: several plans activated in one backend transaction
+            if 'planIds' in backend_params:
+                backend_params['plan_ids'] = [p.strip() for p in str(backend_params.pop('planIds')).split(',') if p.strip()]
+                logger.info('Mapped planIds to plan_ids')
             
             # Handle old schema (customerId + subscriptionPlan) - for backward compatibility
             if 'customerId' in backend_params:
@@ -134,8 +162,12 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 backend_params['subscription_id'] = backend_params.pop('subscriptionPlan')
                 logger.info('Mapped subscriptionPlan to subscription_id (old schema)')
         
-        logger.info('Final backend_params to send to API: %s', json.dumps(backend_params))
-        api_result = _make_api_call(api_path, method=http_method, body=backend_params)
+        logger.info('Final backend_params to send to API: %s', json_codec.dumps(backend_params))
+        # Only transaction conflicts and throttles are replayed, with jittered backoff (see common/error_codes.py).
+        # An uncoded 503 is only replayed on idempotent routes: a transfer may already have gone through.
+        api_result, error_code, attempts = call_with_retries(
+            lambda: _make_api_call(api_path, method=http_method, body=backend_params),
+            lambda result: api_result_code(result, api_path), max_attempts=MAX_ATTEMPTS, base=RETRY_BASE_SECONDS, cap=RETRY_CAP_SECONDS)
 
         # Normalize result
         status_code = api_result.get('statusCode', HTTPStatus.INTERNAL_SERVER_ERROR)
@@ -152,14 +184,16 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             # Default to success when HTTP 2xx
             action_status = 'COMPLETED'
             should_retry = False
-        elif 500 <= int(status_code) < 600:
-            # Server error -> allow retry
-            action_status = 'FAILED'
-            should_retry = True
         else:
-            # Client error or other -> don't retry by default
+            # The error code, not the HTTP class, decides: only transient failures are worth another call
             action_status = 'FAILED'
-            should_retry = False
+            should_retry = is_retryable(error_code)
+        if error_code:
+            details['errorCode'] = error_code
+        if attempts > 1:
+            details['attempts'] = attempts
+        if should_retry:
+            details['retryAfterMs'] = int(backoff_delay(attempts + 1, RETRY_BASE_SECONDS, RETRY_CAP_SECONDS) * 1000)
 
         # Add semantic hints for known endpoints to help the agent
         try:
@@ -194,20 +228,20 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         should_retry = False
                     elif body.get('status') == 'error':
                         action_status = 'FAILED'
-                        should_retry = False
+                        should_retry = is_retryable(error_code)
         except Exception:
             # keep defaults on any parsing error
             pass
 
-        # Build tool text for agent visibility
-        tool_text = json.dumps({
+        # Build tool text for agent visibility (compact, whitelisted per route: see common/tool_response.py)
+        tool_text = build_tool_text(api_path, {
             'actionStatus': action_status,
             'shouldRetry': should_retry,
             'httpStatusCode': status_code,
             'details': details,
             'responseBody': body,
             'error': error
-        }, default=str)
+        })
 
         action_response = {
             'actionGroup': action_group,
@@ -226,7 +260,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'response': action_response
         }
 
-        logger.info('Lambda response: %s', json.dumps(response))
+        logger.info('Lambda response: %s', json_codec.dumps(response))
         return response
 
     except KeyError as e:
@@ -240,7 +274,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'httpStatusCode': HTTPStatus.BAD_REQUEST,
                 'responseBody': {
                     'TEXT': {
-                        'body': json.dumps({'error': f'Missing required field: {str(e)}'})
+                        'body': json_codec.dumps({'error': f'Missing required field: {str(e)}'})
                     }
                 }
             }
@@ -256,7 +290,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'httpStatusCode': HTTPStatus.INTERNAL_SERVER_ERROR,
                 'responseBody': {
                     'TEXT': {
-                        'body': json.dumps({'error': str(e)})
+                        'body': json_codec.dumps({'error': str(e)})
                     }
                 }
             }
@@ -272,7 +306,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'httpStatusCode': HTTPStatus.INTERNAL_SERVER_ERROR,
                 'responseBody': {
                     'TEXT': {
-                        'body': json.dumps({'error': 'Internal server error'})
+                        'body': json_codec.dumps({'error': 'Internal server error'})
                     }
                 }
             }
@@ -1,24 +1,127 @@
-import json
-import boto3
 import os
 from datetime import datetime, timedelta
 from decimal import Decimal
 
-# Configuration AWS
-DYNAMO_TABLE_DATA = "TelcoData" # TelcoData
-DYNAMO_TABLE_CATALOG = "Catalog" # Catalog
-dynamodb_resource = boto3.resource('dynamodb')
-dynamodb_client = boto3.client('dynamodb')
-table_data = dynamodb_resource.Table(DYNAMO_TABLE_DATA)
-table_catalog = dynamodb_resource.Table(DYNAMO_TABLE_CATALOG)
+from capacity_metrics import capacity_scope
+from error_codes import (INSUFFICIENT_FUNDS, INTERNAL_ERROR, INVALID_REQUEST, THROTTLED, TRANSACTION_CONFLICT,
+                         UNKNOWN_PLAN, UNKNOWN_SUBSCRIBER)
+from handler_profiler import profile_handler
+import json_codec
+from phone_numbers import normalize_phone
+# Stockage et caches partagés par toutes les routes (voir shared_resources.py)
+from shared_resources import (DYNAMO_TABLE_DATA, balance_cache, find_catalog_plans, is_unknown_subscriber,
+                              remember_unknown_subscriber, storage)
+from storage import CONDITIONAL_CHECK_FAILED, TransactionCancelled, put_op, update_op
 
+# Forfaits activables en une seule demande (panier)
+CART_MAX_PLANS = int(os.environ.get('CART_MAX_PLANS', '5'))
 
+CANCELLATION_MESSAGES = {
+    INSUFFICIENT_FUNDS: "Activation échouée : Votre solde de crédit est insuffisant.",
+    UNKNOWN_SUBSCRIBER: "Activation échouée : Le compte n'existe pas.",
+    TRANSACTION_CONFLICT: "Activation échouée : Opération concurrente sur le compte, veuillez réessayer.",
+    THROTTLED: "Activation échouée : Service momentanément surchargé, veuillez réessayer.",
+}
+
+
+def build_cart_ops(phone_number, cart, now, transaction_type='SUBSCRIPTION_ACTIVATION', details=None,
+                   transaction_suffix=None):
+    """Opérations de la transaction d'activation d'un ou plusieurs forfaits.
+
+    cart est une liste de (subscription_id, sub_item, new_sub). Quel que soit le nombre de
+    forfaits, la transaction compte deux opérations : un débit conditionnel du total avec
+    ajout de tous les forfaits, et une seule entrée de journal.
+
+    Avec transaction_suffix, l'entrée de journal est TRANS#{now}#{suffixe}, écrite sans
+    jamais écraser un item existant.
+    """
+    prices = [Decimal(str(sub_item['price'])) for _, sub_item, _ in cart]
+    total = sum(prices, Decimal(0))
+    transaction = {
+        'PK': f'USER#{phone_number}',
+        'SK': f'TRANS#{now.isoformat()}' + (f'#{transaction_suffix}' if transaction_suffix else ''),
+        'Type': 'TRANSACTION',
+        'amount': -total,
+        'transaction_type': transaction_type,
+    }
+    if len(cart) == 1:
+        transaction['details'] = details or f"Activation du forfait {cart[0][1]['name']}"
+        transaction['subscription_id'] = cart[0][0]
+    else:
+        transaction['details'] = details or f"Activation des forfaits {', '.join(sub_item['name'] for _, sub_item, _ in cart)}"
+        transaction['cart'] = [{'id': subscription_id, 'price': price}
+                               for (subscription_id, _, _), price in zip(cart, prices)]
+    return [
+        # Débit et ajout des forfaits (via Update)
+        update_op(
+            DYNAMO_TABLE_DATA,
+            {'PK': f'USER#{phone_number}', 'SK': 'METADATA'},
+            increment={'balance_credit': -total},
+            append={'active_subs': [new_sub for _, _, new_sub in cart]},
+            require_exists=True,
+            require_min={'balance_credit': total}
+        ),
+        # Enregistrement de la transaction
+        put_op(DYNAMO_TABLE_DATA, transaction, require_absent=bool(transaction_suffix))
+    ]
+
+
+def build_activation_ops(phone_number, subscription_id, sub_item, new_sub, now,
+                         transaction_type='SUBSCRIPTION_ACTIVATION', details=None, transaction_suffix=None):
+    """Opérations de la transaction d'activation d'un seul forfait.
+
+    Partagées avec le moteur de renouvellement (renewal_engine.py).
+    """
+    return build_cart_ops(phone_number, [(subscription_id, sub_item, new_sub)], now, transaction_type, details,
+                          transaction_suffix)
+
+
+def requested_plan_ids(body):
+    """Identifiants de forfaits demandés : liste (ou chaîne séparée par des virgules) ou forfait unique."""
+    plan_ids = body.get('plan_ids') or body.get('planIds') or body.get('subscription_ids')
+    if plan_ids is None:
+        plan_ids = body.get('subscription_id') or body.get('subscriptionId') or body.get('planId')
+    if isinstance(plan_ids, str):
+        plan_ids = plan_ids.strip('[]').split(',')
+    return [str(plan_id).strip().strip('"\'') for plan_id in plan_ids or [] if str(plan_id).strip()]
+
+
+def plan_results(plan_ids, catalog_items, status, new_subs=None):
+    """Résultat par forfait d'une activation de panier."""
+    results = []
+    for plan_id in plan_ids:
+        sub_item = catalog_items.get(plan_id)
+        if not sub_item:
+            results.append({"id": plan_id, "status": "unknown_plan", "code": UNKNOWN_PLAN})
+            continue
+        result = {"id": plan_id, "name": sub_item['name'], "price": float(sub_item['price']), "status": status}
+        if new_subs:
+            result["expiration_date"] = new_subs[plan_id]['expiration_date']
+        results.append(result)
+    return results
+
+
+def cancellation_code(error):
+    """Code d'erreur d'une activation annulée (première opération : débit conditionnel du compte)."""
+    if error.throttled:
+        return THROTTLED
+    if error.conflict:
+        return TRANSACTION_CONFLICT
+    if error.reasons and error.reasons[0] == CONDITIONAL_CHECK_FAILED:
+        if 0 in error.items and error.items[0] is None:
+            return UNKNOWN_SUBSCRIBER
+        return INSUFFICIENT_FUNDS
+    return INTERNAL_ERROR
+
+
+@capacity_scope('activateSubscription')
+@profile_handler('activateSubscription')
 def lambda_handler(event, context):
-    """Active un forfait pour l'utilisateur spécifié."""
+    """Active un forfait, ou un panier de forfaits (plan_ids) en une seule transaction, pour l'utilisateur spécifié."""
     # Handle API Gateway proxy format
     if 'body' in event and isinstance(event['body'], str):
         try:
-            body = json.loads(event['body'])
+            body = json_codec.loads(event['body'])
         except:
             body = event
     else:
@@ -26,84 +129,87 @@ def lambda_handler(event, context):
     
     try:
         phone_number = body.get('phone_number') or body.get('phoneNumber')
-        subscription_id = body.get('subscription_id') or body.get('subscriptionId') or body.get('planId')
-        if not phone_number or not subscription_id:
-            return {"status": "error", "message": "Numéro de téléphone ou ID de forfait manquant."}
-    except (KeyError, AttributeError):
-        return {"status": "error", "message": "Numéro de téléphone ou ID de forfait manquant."}
+        plan_ids = requested_plan_ids(body)
+        # Opt-in au renouvellement automatique (voir renewal_engine.py)
+        auto_renew = str(body.get('auto_renew', body.get('autoRenew', ''))).lower() in ('true', '1', 'yes', 'oui')
+        if not phone_number or not plan_ids:
+            return {"status": "error", "code": INVALID_REQUEST, "message": "Numéro de téléphone ou ID de forfait manquant."}
+    except (KeyError, AttributeError, TypeError):
+        return {"status": "error", "code": INVALID_REQUEST, "message": "Numéro de téléphone ou ID de forfait manquant."}
+    if len(plan_ids) > CART_MAX_PLANS:
+        return {"status": "error", "code": INVALID_REQUEST,
+                "message": f"Au plus {CART_MAX_PLANS} forfaits peuvent être activés ensemble."}
+    if len(set(plan_ids)) != len(plan_ids):
+        return {"status": "error", "code": INVALID_REQUEST, "message": "Un même forfait est demandé plusieurs fois."}
+    is_cart = len(plan_ids) > 1
 
-    # 1. Récupérer les détails du forfait et le coût (depuis la table Catalog)
+    raw_phone, phone_number = phone_number, normalize_phone(phone_number)
+    if not phone_number:
+        return {"status": "error", "code": INVALID_REQUEST, "message": f"Le numéro de téléphone {raw_phone} est invalide."}
+    # Abonné déjà confirmé inexistant : inutile de lire le catalogue et de tenter la transaction
+    if is_unknown_subscriber(phone_number):
+        return {"status": "error", "code": UNKNOWN_SUBSCRIBER, "message": f"Utilisateur {phone_number} non trouvé."}
+
+    # 1. Récupérer les détails et le coût de tous les forfaits (depuis la table Catalog)
     try:
-        # Catalog structure: PK=category (DATA, VOIX_SMS, PACK), SK=subscription_id
-        # Since we don't know PK, scan for the subscription_id in SK
-        catalog_resp = table_catalog.scan(
-            FilterExpression='SK = :sid',
-            ExpressionAttributeValues={':sid': subscription_id}
-        )
-        sub_item = catalog_resp['Items'][0] if catalog_resp['Items'] else None
-        if not sub_item:
-            return {"status": "error", "message": f"Forfait ID '{subscription_id}' introuvable dans le catalogue."}
-        
-        price = Decimal(str(sub_item['price']))
-        duration_days = int(sub_item['duration_days'])
-        
+        # Lecture du catalogue mise en cache et partagée avec les autres routes ; un seul scan pour tout le panier
+        catalog_items = find_catalog_plans(plan_ids)
     except Exception as e:
         print(f"Erreur lors de la récupération du forfait: {e}")
-        return {"status": "error", "message": "Impossible de charger les détails du forfait."}
-        
-    # 2. Préparer l'objet du nouveau forfait
+        return {"status": "error", "code": INTERNAL_ERROR, "message": "Impossible de charger les détails du forfait."}
+    unknown = [plan_id for plan_id in plan_ids if not catalog_items[plan_id]]
+    if unknown:
+        result = {"status": "error", "code": UNKNOWN_PLAN,
+                  "message": f"Forfait ID '{', '.join(unknown)}' introuvable dans le catalogue."}
+        if is_cart:
+            result["plans"] = plan_results(plan_ids, catalog_items, "not_activated")
+        return result
+
+    # 2. Préparer les objets des nouveaux forfaits
     now = datetime.utcnow()
-    expiration_date = now + timedelta(days=duration_days)
-    new_sub = {
-        "id": subscription_id,
-        "name": sub_item['name'],
-        "activation_date": now.isoformat(),
-        "expiration_date": expiration_date.isoformat()
-    }
+    cart = []
+    for plan_id in plan_ids:
+        sub_item = catalog_items[plan_id]
+        new_sub = {
+            "id": plan_id,
+            "name": sub_item['name'],
+            "activation_date": now.isoformat(),
+            "expiration_date": (now + timedelta(days=int(sub_item['duration_days']))).isoformat()
+        }
+        if auto_renew:
+            new_sub['auto_renew'] = True
+        cart.append((plan_id, sub_item, new_sub))
+    total_price = sum((Decimal(str(sub_item['price'])) for _, sub_item, _ in cart), Decimal(0))
 
-    # 3. Débiter le solde (crédit) et mettre à jour le profil de l'utilisateur (transactionnel pour le débit)
+    # 3. Débiter le solde (crédit) et mettre à jour le profil de l'utilisateur (une seule transaction pour tout le panier)
     try:
-        # Utilisez TransactWriteItems pour le débit et la mise à jour des subs
-        dynamodb_client.transact_write_items(
-            TransactItems=[
-                # Débit et ajout du forfait (via Update)
-                {
-                    'Update': {
-                        'TableName': DYNAMO_TABLE_DATA,
-                        'Key': {'PK': {'S': f'USER#{phone_number}'}, 'SK': {'S': 'METADATA'}},
-                        'UpdateExpression': 'SET balance_credit = balance_credit - :cost, active_subs = list_append(active_subs, :newsub)',
-                        'ConditionExpression': 'attribute_exists(PK) AND balance_credit >= :cost', 
-                        'ExpressionAttributeValues': {
-                            ':cost': {'N': str(price)},
-                            ':newsub': {'L': [{'M': {
-                                'id': {'S': new_sub['id']},
-                                'name': {'S': new_sub['name']},
-                                'activation_date': {'S': new_sub['activation_date']},
-                                'expiration_date': {'S': new_sub['expiration_date']}
-                            }}]}
-                        }
-                    }
-                },
-                # Enregistrement de la transaction
-                {
-                    'Put': {
-                        'TableName': DYNAMO_TABLE_DATA,
-                        'Item': {
-                            'PK': {'S': f'USER#{phone_number}'},
-                            'SK': {'S': f'TRANS#{now.isoformat()}'},
-                            'Type': {'S': 'TRANSACTION'},
-                            'amount': {'N': str(-price)},
-                            'transaction_type': {'S': 'SUBSCRIPTION_ACTIVATION'},
-                            'details': {'S': f"Activation du forfait {sub_item['name']}"}
-                        }
-                    }
-                }
-            ]
-        )
-        return {"status": "success", "message": f"Le forfait {sub_item['name']} a été activé avec succès et expire le {expiration_date.strftime('%d/%m/%Y')}."}
-
-    except dynamodb_client.exceptions.TransactionCanceledException:
-        return {"status": "error", "message": "Activation échouée : Votre solde de crédit est insuffisant ou le compte est invalide."}
+        storage.transact_write(build_cart_ops(phone_number, cart, now))
+        balance_cache.invalidate(phone_number)
+        if not is_cart:
+            sub_item, new_sub = cart[0][1], cart[0][2]
+            expiration_date = datetime.fromisoformat(new_sub['expiration_date'])
+            return {"status": "success", "message": f"Le forfait {sub_item['name']} a été activé avec succès et expire le {expiration_date.strftime('%d/%m/%Y')}."}
+        activated = ', '.join(
+            f"{sub_item['name']} (expire le {datetime.fromisoformat(new_sub['expiration_date']).strftime('%d/%m/%Y')})"
+            for _, sub_item, new_sub in cart)
+        return {"status": "success", "message": f"Les forfaits {activated} ont été activés avec succès.",
+                "total_price": float(total_price),
+                "plans": plan_results(plan_ids, catalog_items, "activated", {pid: ns for pid, _, ns in cart})}
+
+    except TransactionCancelled as e:
+        # Seuls conflits et throttling sont rejouables (voir common/error_codes.py)
+        code = cancellation_code(e)
+        if code == UNKNOWN_SUBSCRIBER:
+            remember_unknown_subscriber(phone_number)
+        if code == INTERNAL_ERROR:
+            print(f"Activation annulée: {e}")
+            return {"status": "error", "code": code, "message": "Une erreur inattendue est survenue lors de l'activation."}
+        result = {"status": "error", "code": code, "message": CANCELLATION_MESSAGES[code]}
+        if is_cart:
+            # Tout ou rien : aucun forfait du panier n'a été activé
+            result["total_price"] = float(total_price)
+            result["plans"] = plan_results(plan_ids, catalog_items, "not_activated")
+        return result
     except Exception as e:
         print(f"Erreur d'activation de forfait: {e}")
-        return {"status": "error", "message": "Une erreur inattendue est survenue lors de l'activation."}
\ No newline at end of file
+        return {"status": "error", "code": INTERNAL_ERROR, "message": "Une erreur inattendue est survenue lors de l'activation."}
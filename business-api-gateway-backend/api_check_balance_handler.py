@@ -1,23 +1,21 @@
-import json
-import boto3
 import os
 from datetime import datetime, timedelta
-from decimal import Decimal
 
-# Configuration AWS
-DYNAMO_TABLE_DATA = "TelcoData" # TelcoData
-DYNAMO_TABLE_CATALOG ="Catalog" # Catalog
-dynamodb_resource = boto3.resource('dynamodb')
-dynamodb_client = boto3.client('dynamodb')
-table_data = dynamodb_resource.Table(DYNAMO_TABLE_DATA)
-table_catalog = dynamodb_resource.Table(DYNAMO_TABLE_CATALOG)
+from capacity_metrics import capacity_scope
+from handler_profiler import profile_handler
+import json_codec
+from phone_numbers import normalize_phone
+# Stockage et caches partagés par toutes les routes (voir shared_resources.py)
+from shared_resources import get_balance_projection, is_unknown_subscriber, remember_unknown_subscriber
 
+@capacity_scope('checkBalance')
+@profile_handler('checkBalance')
 def lambda_handler(event, context):
     """Récupère les soldes et les forfaits actifs de l'utilisateur."""
     # Handle API Gateway proxy format
     if 'body' in event and isinstance(event['body'], str):
         try:
-            body = json.loads(event['body'])
+            body = json_codec.loads(event['body'])
         except:
             body = event
     else:
@@ -30,24 +28,26 @@ def lambda_handler(event, context):
     except (KeyError, AttributeError):
         return {"status": "error", "message": "Le numéro de téléphone est manquant."}
 
+    # Les clés sont au format E.164 : 0891234567 et +243 89 123 4567 désignent le même abonné
+    raw_phone, phone_number = phone_number, normalize_phone(phone_number)
+    if not phone_number:
+        return {"status": "error", "message": f"Le numéro de téléphone {raw_phone} est invalide."}
+    if is_unknown_subscriber(phone_number):
+        return {"status": "error", "message": f"Utilisateur {phone_number} non trouvé."}
+
     try:
-        response = table_data.get_item(
-            Key={
-                'PK': f'USER#{phone_number}',
-                'SK': 'METADATA'
-            },
-            ProjectionExpression='balance_credit, balance_mobile_money, active_subs'
-        )
+        # Lecture via le cache des soldes (read-through, invalidé par les transferts et activations)
+        item = get_balance_projection(phone_number)
 
-        item = response.get('Item')
         if not item:
+            remember_unknown_subscriber(phone_number)
             return {"status": "error", "message": f"Utilisateur {phone_number} non trouvé."}
 
-        # Conversion des types DynamoDB (Decimal) en float pour la sérialisation JSON
+        # La projection est déjà décodée en types JSON (storage.decode_balance_projection)
         return {
             "status": "success",
-            "balance_credit": float(item.get('balance_credit', Decimal(0))),
-            "balance_mobile_money": float(item.get('balance_mobile_money', Decimal(0))),
+            "balance_credit": item.get('balance_credit', 0.0),
+            "balance_mobile_money": item.get('balance_mobile_money', 0.0),
             "active_subscriptions": item.get('active_subs', [])
         }
     except Exception as e:
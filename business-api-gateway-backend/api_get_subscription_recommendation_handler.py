@@ -1,28 +1,28 @@
-import json
-import boto3
 import os
 from datetime import datetime, timedelta
 from decimal import Decimal
 
-# Configuration AWS
-DYNAMO_TABLE_DATA = "TelcoData"# TelcoData
-DYNAMO_TABLE_CATALOG = "Catalog" # Catalog
-dynamodb_resource = boto3.resource('dynamodb')
-dynamodb_client = boto3.client('dynamodb')
-table_data = dynamodb_resource.Table(DYNAMO_TABLE_DATA)
-table_catalog = dynamodb_resource.Table(DYNAMO_TABLE_CATALOG)
+from capacity_metrics import capacity_scope
+from handler_profiler import profile_handler
+import json_codec
+from phone_numbers import normalize_phone
+# Stockage et caches partagés par toutes les routes (voir shared_resources.py)
+from shared_resources import (get_balance_projection, is_unknown_subscriber, query_catalog_category,
+                              remember_unknown_subscriber)
 
 
+@capacity_scope('getSubscriptionRecommendation')
+@profile_handler('getSubscriptionRecommendation')
 def lambda_handler(event, context):
     """Recommande un forfait basé sur les forfaits actifs de l'utilisateur."""
     # Handle API Gateway proxy format
     if 'body' in event and isinstance(event['body'], str):
         try:
-            body = json.loads(event['body'])
-        except json.JSONDecodeError:
+            body = json_codec.loads(event['body'])
+        except json_codec.JSONDecodeError:
             return {
                 "statusCode": 400,
-                "body": json.dumps({"status": "error", "message": "Invalid JSON in request body."})
+                "body": json_codec.dumps({"status": "error", "message": "Invalid JSON in request body."})
             }
     else:
         body = event
@@ -34,15 +34,27 @@ def lambda_handler(event, context):
     except KeyError:
         return {
             "statusCode": 400,
-            "body": json.dumps({"status": "error", "message": "Le numéro de téléphone est manquant."})
+            "body": json_codec.dumps({"status": "error", "message": "Le numéro de téléphone est manquant."})
+        }
+
+    raw_phone, phone_number = phone_number, normalize_phone(phone_number)
+    if not phone_number:
+        return {
+            "statusCode": 400,
+            "body": json_codec.dumps({"status": "error", "message": f"Le numéro de téléphone {raw_phone} est invalide."})
         }
 
     # 1. Récupérer les forfaits actifs de l'utilisateur (via check_balance, ou directement)
-    try:
-        user_data_response = table_data.get_item(Key={'PK': f'USER#{phone_number}', 'SK': 'METADATA'})
-        active_subs = user_data_response['Item'].get('active_subs', [])
-    except Exception:
-        active_subs = [] # Supposons qu'il n'y ait pas de forfaits actifs
+    active_subs = [] # Supposons qu'il n'y ait pas de forfaits actifs
+    if not is_unknown_subscriber(phone_number):
+        try:
+            user_item = get_balance_projection(phone_number)
+            if user_item:
+                active_subs = user_item.get('active_subs', [])
+            else:
+                remember_unknown_subscriber(phone_number)
+        except Exception as e:
+            print(f"Erreur lors de la lecture des forfaits actifs: {e}")
 
     # 2. Vérifier si un forfait Data est actif
     has_active_data = any('DATA' in sub['id'] for sub in active_subs)
@@ -59,14 +71,11 @@ def lambda_handler(event, context):
 
     # 4. Récupérer les détails des forfaits recommandés dans le catalogue
     try:
-        # Requête pour obtenir tous les forfaits de la catégorie sélectionnée (PK)
-        catalog_resp = table_catalog.query(
-            KeyConditionExpression='PK = :pk',
-            ExpressionAttributeValues={':pk': pk_reco}
-        )
+        # Requête pour obtenir tous les forfaits de la catégorie sélectionnée (PK), via le cache du catalogue
+        catalog_items = query_catalog_category(pk_reco)
         
         # Simplement prendre le premier (le plus pertinent selon la logique du tri interne ou de la requête)
-        recommendation_item = catalog_resp['Items'][0] if catalog_resp['Items'] else None
+        recommendation_item = catalog_items[0] if catalog_items else None
 
         if recommendation_item:
             response_body = {
@@ -81,7 +90,7 @@ def lambda_handler(event, context):
             }
             return {
                 "statusCode": 200,
-                "body": json.dumps(response_body)
+                "body": json_codec.dumps(response_body)
             }
         else:
             response_body = {
@@ -90,12 +99,12 @@ def lambda_handler(event, context):
             }
             return {
                 "statusCode": 200,
-                "body": json.dumps(response_body)
+                "body": json_codec.dumps(response_body)
             }
 
     except Exception as e:
         print(f"Erreur de recommandation: {e}")
         return {
             "statusCode": 500,
-            "body": json.dumps({"status": "error", "message": "Erreur interne lors de la génération de la recommandation."})
+            "body": json_codec.dumps({"status": "error", "message": "Erreur interne lors de la génération de la recommandation."})
         }
\ No newline at end of file
@@ -0,0 +1,70 @@
+import os
+from decimal import Decimal
+
+from capacity_metrics import capacity_scope
+from error_codes import INVALID_REQUEST
+from handler_profiler import profile_handler
+import json_codec
+from phone_numbers import normalize_phone
+from transaction_archive import create_object_store, transaction_history
+
+HISTORY_MAX_LIMIT = int(os.environ.get('HISTORY_MAX_LIMIT', '200'))
+
+# Stockage d'archives partagé par les invocations du conteneur
+archive_store = create_object_store()
+
+
+def _to_json(value):
+    # Decimal -> float pour la sérialisation JSON, comme /checkBalance
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, list):
+        return [_to_json(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _to_json(v) for k, v in value.items()}
+    return value
+
+
+@capacity_scope('transactionHistory')
+@profile_handler('transactionHistory')
+def lambda_handler(event, context):
+    """Historique des transactions d'un utilisateur, récentes et archivées confondues."""
+    if 'body' in event and isinstance(event['body'], str):
+        try:
+            body = json_codec.loads(event['body'])
+        except ValueError:
+            body = event
+    else:
+        body = event
+
+    raw_phone = body.get('phone_number') or body.get('phoneNumber')
+    if not raw_phone:
+        return {"status": "error", "message": "Le numéro de téléphone est manquant."}
+    phone_number = normalize_phone(raw_phone)
+    if not phone_number:
+        return {"status": "error", "message": f"Le numéro de téléphone {raw_phone} est invalide."}
+    raw_limit = body.get('limit')
+    try:
+        limit = 50 if raw_limit in (None, '') else int(raw_limit)
+    except (TypeError, ValueError):
+        limit = None
+    # Une limite négative couperait silencieusement les transactions les plus anciennes
+    if limit is None or limit < 1:
+        return {"status": "error", "code": INVALID_REQUEST,
+                "message": "La limite doit être un entier supérieur ou égal à 1."}
+    limit = min(limit, HISTORY_MAX_LIMIT)
+
+    try:
+        items = transaction_history(phone_number, since=body.get('since'), until=body.get('until'),
+                                    limit=limit, store=archive_store)
+    except Exception as e:
+        print(f"Erreur lors de la lecture de l'historique de {phone_number}: {e}")
+        return {"status": "error", "message": "Erreur interne lors de l'accès aux données."}
+    return {
+        "status": "success",
+        "transactions": [
+            dict(_to_json({k: v for k, v in item.items() if k not in ('PK', 'SK', 'Type')}),
+                 timestamp=item['SK'][len('TRANS#'):].split('#', 1)[0])
+            for item in items
+        ]
+    }
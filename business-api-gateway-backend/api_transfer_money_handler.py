@@ -1,29 +1,80 @@
-import json
-import boto3
 import os
+import time
 from datetime import datetime, timedelta
 from decimal import Decimal
 
-# Configuration AWS
-DYNAMO_TABLE_DATA = "TelcoData" # TelcoData
-DYNAMO_TABLE_CATALOG = "Catalog" # Catalog
-dynamodb_resource = boto3.resource('dynamodb')
-dynamodb_client = boto3.client('dynamodb')
-table_data = dynamodb_resource.Table(DYNAMO_TABLE_DATA)
-table_catalog = dynamodb_resource.Table(DYNAMO_TABLE_CATALOG)
+from capacity_metrics import capacity_scope
+from error_codes import (HTTP_STATUS, INSUFFICIENT_FUNDS, INTERNAL_ERROR, INVALID_REQUEST, THROTTLED,
+                         TRANSACTION_CONFLICT, UNKNOWN_RECIPIENT, UNKNOWN_SUBSCRIBER, VELOCITY_LIMIT_EXCEEDED)
+from handler_profiler import profile_handler
+import json_codec
+from phone_numbers import normalize_phone
+# Stockage et caches partagés par toutes les routes (voir shared_resources.py)
+from shared_resources import (DYNAMO_TABLE_DATA, balance_cache, is_unknown_subscriber, remember_unknown_subscriber,
+                              storage)
+from storage import CONDITIONAL_CHECK_FAILED, TransactionCancelled, put_op, update_op
+from velocity_limits import exceeded_window, oversized_window, retry_after_seconds, velocity_ops
 
+# Les compteurs de vélocité suivent les trois opérations du transfert dans la transaction
+VELOCITY_OPS_OFFSET = 3
 
+CANCELLATION_MESSAGES = {
+    INSUFFICIENT_FUNDS: "Transaction annulée : Solde Mobile Money insuffisant.",
+    UNKNOWN_SUBSCRIBER: "Transaction annulée : Le compte émetteur n'existe pas.",
+    UNKNOWN_RECIPIENT: "Transaction annulée : Le compte destinataire n'existe pas.",
+    TRANSACTION_CONFLICT: "Transaction annulée : Opération concurrente sur le compte, veuillez réessayer.",
+    THROTTLED: "Transaction annulée : Service momentanément surchargé, veuillez réessayer.",
+}
+
+
+def error_response(code, message, **extra):
+    """Réponse d'erreur avec un code exploitable par les adapters (voir common/error_codes.py)."""
+    return {
+        "statusCode": HTTP_STATUS[code],
+        "body": json_codec.dumps(dict({"status": "error", "code": code, "message": message}, **extra))
+    }
+
+
+def velocity_error(source_phone, window, now_ts):
+    retry_after = retry_after_seconds(window, now_ts)
+    print(f"Limite de vélocité {window.name} atteinte pour {source_phone}")
+    return error_response(
+        VELOCITY_LIMIT_EXCEEDED,
+        f"Transfert refusé : limite de transferts {window.label} atteinte. Réessayez dans {retry_after} secondes.",
+        retry_after_seconds=retry_after
+    )
+
+
+def cancellation_code(error):
+    """Code d'erreur d'un transfert annulé, d'après les raisons par opération.
+
+    Ordre des opérations : débit de la source, crédit de la cible, journalisation.
+    """
+    if error.throttled:
+        return THROTTLED
+    if error.conflict:
+        return TRANSACTION_CONFLICT
+    reasons = error.reasons + [None] * 2
+    if reasons[0] == CONDITIONAL_CHECK_FAILED:
+        # La condition du débit porte sur l'existence et le solde : l'item renvoyé les départage
+        if 0 in error.items and error.items[0] is None:
+            return UNKNOWN_SUBSCRIBER
+        return INSUFFICIENT_FUNDS
+    if reasons[1] == CONDITIONAL_CHECK_FAILED:
+        return UNKNOWN_RECIPIENT
+    return INTERNAL_ERROR
+
+
+@capacity_scope('transferMoney')
+@profile_handler('transferMoney')
 def lambda_handler(event, context):
     """Effectue un transfert d'argent mobile entre deux utilisateurs."""
     # Handle API Gateway proxy format
     if 'body' in event and isinstance(event['body'], str):
         try:
-            body = json.loads(event['body'])
-        except json.JSONDecodeError:
-            return {
-                "statusCode": 400,
-                "body": json.dumps({"status": "error", "message": "Invalid JSON in request body."})
-            }
+            body = json_codec.loads(event['body'])
+        except json_codec.JSONDecodeError:
+            return error_response(INVALID_REQUEST, "Invalid JSON in request body.")
     else:
         body = event
     
@@ -35,91 +86,101 @@ def lambda_handler(event, context):
         if not source_phone or not target_phone:
             raise KeyError('Missing phone number')
     except KeyError:
-        return {
-            "statusCode": 400,
-            "body": json.dumps({"status": "error", "message": "Paramètres de transfert incomplets."})
-        }
+        return error_response(INVALID_REQUEST, "Paramètres de transfert incomplets.")
     except Exception:
-        return {
-            "statusCode": 400,
-            "body": json.dumps({"status": "error", "message": "Le montant du transfert est invalide."})
-        }
+        return error_response(INVALID_REQUEST, "Le montant du transfert est invalide.")
+
+    raw_phones = (source_phone, target_phone)
+    source_phone, target_phone = normalize_phone(source_phone), normalize_phone(target_phone)
+    if not source_phone or not target_phone:
+        invalid = raw_phones[0] if not source_phone else raw_phones[1]
+        return error_response(INVALID_REQUEST, f"Le numéro de téléphone {invalid} est invalide.")
+    for phone, code in ((source_phone, UNKNOWN_SUBSCRIBER), (target_phone, UNKNOWN_RECIPIENT)):
+        if is_unknown_subscriber(phone):
+            return error_response(code, f"Utilisateur {phone} non trouvé.")
 
     if source_phone == target_phone or amount <= 0:
-        return {
-            "statusCode": 400,
-            "body": json.dumps({"status": "error", "message": "Transfert invalide (même destinataire ou montant négatif/nul)."})
-        }
+        return error_response(INVALID_REQUEST, "Transfert invalide (même destinataire ou montant négatif/nul).")
 
-    # Utilisation de l'API Client pour les transactions
+    # Un transfert plus gros que le plafond d'une fenêtre est refusé sans transaction
+    now_ts = time.time()
+    oversized = oversized_window(amount)
+    if oversized:
+        return error_response(
+            VELOCITY_LIMIT_EXCEEDED,
+            f"Transfert refusé : le montant dépasse le plafond de {oversized.max_amount} {oversized.label}."
+        )
+    velocity_checks = velocity_ops(source_phone, amount, now_ts)
+
+    # Transaction atomique : débit, crédit, journalisation et compteurs de vélocité
     try:
         now = datetime.utcnow().isoformat()
         
-        dynamodb_client.transact_write_items(
-            TransactItems=[
-                # 1. Débit du compte source (Mobile Money)
-                {
-                    'Update': {
-                        'TableName': DYNAMO_TABLE_DATA,
-                        'Key': {'PK': {'S': f'USER#{source_phone}'}, 'SK': {'S': 'METADATA'}},
-                        'UpdateExpression': 'SET balance_mobile_money = balance_mobile_money - :amt',
-                        # Condition pour éviter le découvert
-                        'ConditionExpression': 'attribute_exists(PK) AND balance_mobile_money >= :amt', 
-                        'ExpressionAttributeValues': {':amt': {'N': str(amount)}},
-                    }
-                },
-                # 2. Crédit du compte cible (Mobile Money)
-                {
-                    'Update': {
-                        'TableName': DYNAMO_TABLE_DATA,
-                        'Key': {'PK': {'S': f'USER#{target_phone}'}, 'SK': {'S': 'METADATA'}},
-                        'UpdateExpression': 'SET balance_mobile_money = balance_mobile_money + :amt',
-                        'ConditionExpression': 'attribute_exists(PK)', # S'assurer que le compte cible existe
-                        'ExpressionAttributeValues': {':amt': {'N': str(amount)}},
-                    }
-                },
-                # 3. Enregistrement de la transaction (Débit)
-                {
-                    'Put': {
-                        'TableName': DYNAMO_TABLE_DATA,
-                        'Item': {
-                            'PK': {'S': f'USER#{source_phone}'},
-                            'SK': {'S': f'TRANS#{now}'},
-                            'Type': {'S': 'TRANSACTION'},
-                            'amount': {'N': str(-amount)}, 
-                            'transaction_type': {'S': 'MOBILE_MONEY_TRANSFER_SENT'},
-                            'details': {'S': f'Transfert envoyé à {target_phone}'}
-                        }
-                    }
-                }
-            ]
-        )
+        storage.transact_write([
+            # 1. Débit du compte source (Mobile Money)
+            update_op(
+                DYNAMO_TABLE_DATA,
+                {'PK': f'USER#{source_phone}', 'SK': 'METADATA'},
+                increment={'balance_mobile_money': -amount},
+                # Condition pour éviter le découvert
+                require_exists=True,
+                require_min={'balance_mobile_money': amount}
+            ),
+            # 2. Crédit du compte cible (Mobile Money)
+            update_op(
+                DYNAMO_TABLE_DATA,
+                {'PK': f'USER#{target_phone}', 'SK': 'METADATA'},
+                increment={'balance_mobile_money': amount},
+                require_exists=True  # S'assurer que le compte cible existe
+            ),
+            # 3. Enregistrement de la transaction (Débit)
+            put_op(DYNAMO_TABLE_DATA, {
+                'PK': f'USER#{source_phone}',
+                'SK': f'TRANS#{now}',
+                'Type': 'TRANSACTION',
+                'amount': -amount,
+                'transaction_type': 'MOBILE_MONEY_TRANSFER_SENT',
+                'details': f'Transfert envoyé à {target_phone}',
+                # Utilisé par ledger_projector pour créer l'enregistrement côté destinataire
+                'counterparty': target_phone
+            })
+        ] + [op for _, op in velocity_checks])
+        # Les deux soldes ont changé : invalidation après le commit
+        balance_cache.invalidate(source_phone, target_phone)
         response_body = {
             "status": "success",
             "message": f"Transfert de {amount} vers {target_phone} effectué. Votre nouveau solde sera mis à jour."
         }
         return {
             "statusCode": 200,
-            "body": json.dumps(response_body)
+            "body": json_codec.dumps(response_body)
         }
     
-    except dynamodb_client.exceptions.TransactionCanceledException as e:
-        # Gérer spécifiquement l'échec de la condition (solde insuffisant ou cible inexistante)
-        error_reason = str(e)
-        if 'ConditionCheckFailed' in error_reason:
-             # Une logique plus fine peut déterminer si c'est le compte source ou cible qui a échoué
-            return {
-                "statusCode": 400,
-                "body": json.dumps({"status": "error", "message": "Transaction annulée : Solde insuffisant ou compte destinataire invalide."})
-            }
-        return {
-            "statusCode": 500,
-            "body": json.dumps({"status": "error", "message": f"Erreur de transaction DynamoDB : {error_reason}"})
-        }
-        
+    except TransactionCancelled as e:
+        window = None
+        if not (e.throttled or e.conflict):
+            window = exceeded_window(e.reasons, VELOCITY_OPS_OFFSET, velocity_checks, now_ts)
+        # Chaque raison d'annulation devient un code : seuls conflits et throttling sont rejouables.
+        # Solde et comptes passent avant la vélocité : attendre ne lèverait pas ces refus.
+        code = cancellation_code(e)
+        if window and code == INTERNAL_ERROR:
+            return velocity_error(source_phone, window, now_ts)
+        if window and code == INSUFFICIENT_FUNDS:
+            retry_after = retry_after_seconds(window, now_ts)
+            return error_response(
+                code,
+                f"{CANCELLATION_MESSAGES[code]} La limite de transferts {window.label} est également atteinte "
+                f"(prochain transfert possible dans {retry_after} secondes).",
+                velocity_limit_exceeded=True, retry_after_seconds=retry_after
+            )
+        if code == UNKNOWN_RECIPIENT:
+            remember_unknown_subscriber(target_phone)
+        elif code == UNKNOWN_SUBSCRIBER:
+            remember_unknown_subscriber(source_phone)
+        if code == INTERNAL_ERROR:
+            return error_response(code, f"Erreur de transaction DynamoDB : {e}")
+        return error_response(code, CANCELLATION_MESSAGES[code])
+
     except Exception as e:
         print(f"Erreur inattendue: {e}")
-        return {
-            "statusCode": 500,
-            "body": json.dumps({"status": "error", "message": "Une erreur inattendue est survenue lors du transfert."})
-        }
+        return error_response(INTERNAL_ERROR, "Une erreur inattendue est survenue lors du transfert.")
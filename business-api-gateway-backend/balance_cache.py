@@ -0,0 +1,86 @@
+"""Cache read-through des soldes (projection METADATA) pour /checkBalance.
+
+/checkBalance précède presque chaque activation et chaque transfert ; sans cache,
+chaque appel est un get_item fortement cohérent. Le cache conserve la projection
+(balance_credit, balance_mobile_money, active_subs), déjà dans les types JSON de la
+réponse (voir storage.decode_balance_projection), au plus
+BALANCE_CACHE_TTL_SECONDS secondes : c'est la borne de fraîcheur (0 désactive le cache).
+
+Stockage enfichable via common/kv_store.py (BALANCE_CACHE_BACKEND) :
+  * memory   : cache du processus (défaut, et repli si le store partagé est indisponible)
+  * redis    : partagé entre conteneurs (REDIS_URL, paquet redis optionnel)
+  * dynamodb : partagé via la table du kv_store
+
+Invalidation write-through : après le commit de leur transaction, le transfert,
+l'activation et le renouvellement appellent invalidate(). L'invalidation écrit une
+marque (et incrémente la version) au lieu de supprimer la clé ; un chargement n'est
+mis en cache que si la version n'a pas changé depuis sa lecture (compare-and-set).
+Une lecture commencée avant un commit ne peut donc pas réinstaller un solde périmé.
+
+Avec le store memory et des Lambdas séparées par route, l'invalidation ne touche que
+le conteneur qui a écrit : les autres voient l'ancien solde au plus TTL secondes.
+"""
+import os
+
+from kv_store import InMemoryKVStore, create_kv_store
+
+BALANCE_CACHE_BACKEND = os.environ.get('BALANCE_CACHE_BACKEND', 'memory')
+BALANCE_CACHE_TTL_SECONDS = float(os.environ.get('BALANCE_CACHE_TTL_SECONDS', '10'))
+
+_INVALIDATED = {'invalidated': True}
+
+
+def _key(phone_number):
+    return f'balance#{phone_number}'
+
+
+class BalanceCache:
+    """Cache read-through des projections METADATA, indexé par numéro E.164."""
+
+    def __init__(self, store, ttl_seconds):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, phone_number, loader):
+        """Retourne la projection en cache, ou celle de loader() (mise en cache si l'item existe)."""
+        if self.ttl_seconds <= 0:
+            return loader()
+        try:
+            value, version = self.store.get(_key(phone_number))
+        except Exception as e:
+            # Un cache indisponible ne doit pas faire échouer la lecture
+            print(f"Cache des soldes illisible: {e}")
+            return loader()
+        if value and not value.get('invalidated'):
+            self.hits += 1
+            return value
+        self.misses += 1
+        item = loader()
+        if item:
+            try:
+                self.store.put(_key(phone_number), item, ttl_seconds=self.ttl_seconds,
+                               expected_version=version)
+            except Exception as e:
+                print(f"Écriture du cache des soldes impossible: {e}")
+        return item
+
+    def invalidate(self, *phone_numbers):
+        """À appeler après le commit d'une transaction qui modifie ces comptes."""
+        if self.ttl_seconds <= 0:
+            return
+        for phone_number in phone_numbers:
+            try:
+                self.store.put(_key(phone_number), _INVALIDATED, ttl_seconds=self.ttl_seconds)
+            except Exception as e:
+                print(f"Invalidation du cache des soldes impossible pour {phone_number}: {e}")
+
+
+def create_balance_cache():
+    try:
+        store = create_kv_store(BALANCE_CACHE_BACKEND)
+    except Exception as e:
+        print(f"Cache des soldes partagé indisponible ({e}) : repli sur le cache du processus")
+        store = InMemoryKVStore()
+    return BalanceCache(store, BALANCE_CACHE_TTL_SECONDS)
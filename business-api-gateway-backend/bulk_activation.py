@@ -0,0 +1,370 @@
+"""Activations groupées de forfaits pour les comptes entreprise.
+
+Un job active un même forfait pour des milliers de numéros (ex. F_P_PREMIUM pour
+tous les employés d'une entreprise) :
+
+  * POST /bulkActivation {"plan_id", "phone_numbers", "auto_renew"} crée le job.
+    Tous les numéros sont validés d'emblée : normalisation E.164, doublons retirés,
+    existence vérifiée par lectures groupées (BatchGetItem, 100 clés par appel).
+    Le forfait est lu et tarifé une seule fois. La réponse (202) donne job_id,
+    les numéros acceptés et ceux refusés.
+  * GET /bulkActivation/{job_id} (ou POST /bulkActivation {"job_id"}) retourne
+    l'avancement : compteurs par résultat, débit en activations/s, durée restante estimée.
+    Un POST sur un job inachevé le relance.
+
+Exécution : pool de BULK_WORKERS threads, au plus BULK_MAX_PER_SECOND activations par
+seconde. Chaque numéro passe par sa propre transaction conditionnelle (celle de
+l'activation) avec un marqueur BULK#{job_id} : rejouer un job ne débite jamais deux fois.
+L'avancement est enregistré tous les BULK_CHECKPOINT_EVERY numéros (BULK_JOB#{job_id} / JOB).
+Un bail (lease_until) garantit qu'un seul worker exécute un job à la fois.
+
+Workers (BULK_WORKER_MODE) :
+  * lambda : la fonction se réinvoque en asynchrone ({"bulkJob": job_id}) ; un job qui
+    approche du timeout enregistre son avancement et se réinvoque pour continuer ;
+  * thread : thread du processus (serveur local dispatch_app, conteneur).
+Par défaut : lambda dans Lambda, thread ailleurs.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from api_activate_subscription_handler import build_activation_ops, cancellation_code
+from capacity_metrics import capacity_scope, handler_scope, run_in_scope
+from error_codes import (INSUFFICIENT_FUNDS, INTERNAL_ERROR, INVALID_REQUEST, UNKNOWN_PLAN, UNKNOWN_SUBSCRIBER,
+                         backoff_delay, is_retryable)
+from handler_profiler import profile_handler
+import json_codec
+from metrics import emit_metrics
+from phone_numbers import normalize_phone
+from shared_resources import (DYNAMO_TABLE_DATA, RateLimiter, balance_cache, find_catalog_plan,
+                              is_unknown_subscriber, remember_unknown_subscriber, storage)
+from storage import CONDITIONAL_CHECK_FAILED, TransactionCancelled, put_op, update_op
+
+BULK_MAX_NUMBERS = int(os.environ.get('BULK_MAX_NUMBERS', '20000'))
+BULK_WORKERS = int(os.environ.get('BULK_WORKERS', '16'))
+BULK_MAX_PER_SECOND = float(os.environ.get('BULK_MAX_PER_SECOND', '50'))
+BULK_MAX_ATTEMPTS = int(os.environ.get('BULK_MAX_ATTEMPTS', '3'))
+BULK_CHECKPOINT_EVERY = int(os.environ.get('BULK_CHECKPOINT_EVERY', '100'))
+# Un worker arrêté sans libérer son bail bloque le job au plus BULK_LEASE_SECONDS
+BULK_LEASE_SECONDS = int(os.environ.get('BULK_LEASE_SECONDS', '120'))
+BULK_SAFETY_MARGIN_MS = int(os.environ.get('BULK_SAFETY_MARGIN_MS', '20000'))
+BULK_WORKER_MODE = os.environ.get('BULK_WORKER_MODE') or ('lambda' if os.environ.get('AWS_LAMBDA_FUNCTION_NAME') else 'thread')
+# Numéros par item CHUNK# (la liste du job est découpée pour rester loin de la limite de 400 Ko par item)
+CHUNK_SIZE = 500
+# Échecs détaillés conservés dans le job ; au-delà seuls les compteurs sont tenus
+MAX_REPORTED_FAILURES = 100
+MARKER_TTL_SECONDS = 30 * 24 * 3600
+
+OUTCOMES = ('activated', 'insufficient_funds', 'unknown_subscriber', 'already_activated', 'failed')
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+_lambda_client = None
+
+
+def _response(status_code, body):
+    return {"statusCode": status_code, "headers": JSON_HEADERS, "body": json_codec.dumps(body)}
+
+
+def _job_key(job_id):
+    return {'PK': f'BULK_JOB#{job_id}', 'SK': 'JOB'}
+
+
+def validate_numbers(raw_numbers):
+    """Sépare les numéros en (existants, invalides, inconnus), doublons retirés, par lectures groupées."""
+    valid, invalid = [], []
+    for raw in raw_numbers:
+        phone_number = normalize_phone(str(raw))
+        if phone_number:
+            valid.append(phone_number)
+        else:
+            invalid.append(raw)
+    valid = list(dict.fromkeys(valid))
+    to_read = [p for p in valid if not is_unknown_subscriber(p)]
+    found = storage.batch_get(DYNAMO_TABLE_DATA, [{'PK': f'USER#{p}', 'SK': 'METADATA'} for p in to_read],
+                              attributes=['PK'])
+    existing = {item['PK'].split('#', 1)[1] for item in found}
+    unknown = [p for p in valid if p not in existing]
+    for phone_number in unknown:
+        remember_unknown_subscriber(phone_number)
+    return [p for p in valid if p in existing], invalid, unknown
+
+
+def create_job(plan_id, raw_numbers, auto_renew=False):
+    """Valide et enregistre un job ; retourne (code HTTP, corps)."""
+    if not plan_id or not raw_numbers:
+        return 400, {"status": "error", "code": INVALID_REQUEST, "message": "ID de forfait ou liste de numéros manquant."}
+    if len(raw_numbers) > BULK_MAX_NUMBERS:
+        return 400, {"status": "error", "code": INVALID_REQUEST,
+                     "message": f"Au plus {BULK_MAX_NUMBERS} numéros par job."}
+    # Forfait lu et tarifé une seule fois pour tout le job
+    plan = find_catalog_plan(plan_id)
+    if not plan:
+        return 404, {"status": "error", "code": UNKNOWN_PLAN, "message": f"Forfait ID '{plan_id}' introuvable dans le catalogue."}
+    phone_numbers, invalid, unknown = validate_numbers(raw_numbers)
+    if not phone_numbers:
+        return 400, {"status": "error", "code": INVALID_REQUEST, "message": "Aucun numéro valide à activer.",
+                     "invalid_numbers": invalid, "unknown_numbers": unknown}
+
+    job_id = str(uuid.uuid4())
+    for index in range(0, len(phone_numbers), CHUNK_SIZE):
+        storage.put_item(DYNAMO_TABLE_DATA, {
+            'PK': f'BULK_JOB#{job_id}', 'SK': f'CHUNK#{index // CHUNK_SIZE:05d}', 'Type': 'BULK_JOB_CHUNK',
+            'phone_numbers': phone_numbers[index:index + CHUNK_SIZE],
+        })
+    now = datetime.utcnow().isoformat()
+    storage.put_item(DYNAMO_TABLE_DATA, dict(_job_key(job_id), **{
+        'Type': 'BULK_JOB', 'status': 'pending', 'plan_id': plan_id, 'plan_name': plan['name'],
+        'price': Decimal(str(plan['price'])), 'duration_days': int(plan['duration_days']),
+        'auto_renew': bool(auto_renew), 'total': len(phone_numbers), 'done': 0, 'amount_debited': Decimal(0),
+        'running_seconds': Decimal(0), 'failures': [], 'created_at': now, 'updated_at': now, 'lease_until': 0,
+        **{outcome: 0 for outcome in OUTCOMES},
+    }))
+    return 202, {"status": "accepted", "job_id": job_id, "plan_id": plan_id, "accepted": len(phone_numbers),
+                 "invalid_numbers": invalid, "unknown_numbers": unknown}
+
+
+def activate(job, phone_number, now):
+    """Active le forfait du job pour un numéro ; retourne le résultat (voir OUTCOMES)."""
+    plan = {'name': job['plan_name'], 'price': job['price']}
+    new_sub = {
+        'id': job['plan_id'],
+        'name': job['plan_name'],
+        'activation_date': now.isoformat(),
+        'expiration_date': (now + timedelta(days=int(job['duration_days']))).isoformat(),
+    }
+    if job.get('auto_renew'):
+        new_sub['auto_renew'] = True
+    ops = build_activation_ops(phone_number, job['plan_id'], plan, new_sub, now,
+                               details=f"Activation groupée du forfait {job['plan_name']}")
+    # Marqueur par (job, numéro) : une reprise ne réactive pas un numéro déjà traité
+    ops.append(put_op(DYNAMO_TABLE_DATA, {
+        'PK': f'USER#{phone_number}', 'SK': f"BULK#{job['job_id']}", 'Type': 'BULK_MARKER',
+        'expires_at': int(time.time()) + MARKER_TTL_SECONDS,
+    }, require_absent=True))
+    for attempt in range(1, BULK_MAX_ATTEMPTS + 1):
+        try:
+            storage.transact_write(ops)
+            balance_cache.invalidate(phone_number)
+            return 'activated'
+        except TransactionCancelled as e:
+            if e.reasons and e.reasons[-1] == CONDITIONAL_CHECK_FAILED:
+                return 'already_activated'
+            code = cancellation_code(e)
+            if code == INSUFFICIENT_FUNDS:
+                return 'insufficient_funds'
+            if code == UNKNOWN_SUBSCRIBER:
+                return 'unknown_subscriber'
+            if not is_retryable(code) or attempt == BULK_MAX_ATTEMPTS:
+                print(f"Activation groupée annulée pour {phone_number} (job {job['job_id']}): {e}")
+                return 'failed'
+            time.sleep(backoff_delay(attempt))
+    return 'failed'
+
+
+def _load_numbers(job_id):
+    chunks = [item for item in storage.query(DYNAMO_TABLE_DATA, f'BULK_JOB#{job_id}') if item['SK'].startswith('CHUNK#')]
+    return [p for chunk in chunks for p in chunk['phone_numbers']]
+
+
+def _claim(job_id, now_ts):
+    """Prend le bail du job ; False si un autre worker le détient."""
+    try:
+        storage.transact_write([update_op(DYNAMO_TABLE_DATA, _job_key(job_id),
+                                          set={'lease_until': now_ts + BULK_LEASE_SECONDS, 'status': 'running'},
+                                          require_exists=True, require_max={'lease_until': now_ts})])
+        return True
+    except TransactionCancelled:
+        return False
+
+
+def run_job(job_id, remaining_ms=lambda: float('inf'), workers=BULK_WORKERS, max_per_second=BULK_MAX_PER_SECOND):
+    """Exécute (ou reprend) un job ; retourne son statut."""
+    job = storage.get_item(DYNAMO_TABLE_DATA, _job_key(job_id))
+    if not job or job.get('status') == 'complete':
+        return job_status(job_id)
+    if not _claim(job_id, int(time.time())):
+        return job_status(job_id)
+    job['job_id'] = job_id
+    started = time.monotonic()
+    phone_numbers = _load_numbers(job_id)
+    # Reprise par position : la liste du job est figée à sa création
+    done = int(job.get('done', 0))
+    counts = {outcome: int(job.get(outcome, 0)) for outcome in OUTCOMES}
+    debited = Decimal(str(job.get('amount_debited', 0)))
+    failures = list(job.get('failures') or [])
+    running_seconds = float(job.get('running_seconds', 0))
+    now = datetime.utcnow()
+    limiter = RateLimiter(max_per_second)
+    finished = {}  # index -> résultat, en attente que les précédents soient terminés
+    status = 'complete'
+
+    def task(index):
+        limiter.acquire()
+        try:
+            return index, activate(job, phone_numbers[index], now)
+        except Exception as e:
+            print(f"Erreur d'activation groupée pour {phone_numbers[index]}: {e}")
+            return index, 'failed'
+
+    def checkpoint(state):
+        elapsed = running_seconds + time.monotonic() - started
+        storage.transact_write([update_op(DYNAMO_TABLE_DATA, _job_key(job_id), set=dict(
+            counts, status=state, done=done, amount_debited=debited, failures=failures,
+            running_seconds=Decimal(str(round(elapsed, 3))), updated_at=datetime.utcnow().isoformat(),
+            lease_until=0 if state != 'running' else int(time.time()) + BULK_LEASE_SECONDS))])
+
+    pending = set()
+    next_index = done
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while next_index < len(phone_numbers) or pending:
+            # File bornée : au plus deux tâches en attente par worker
+            while next_index < len(phone_numbers) and len(pending) < 2 * workers:
+                if remaining_ms() < BULK_SAFETY_MARGIN_MS:
+                    status = 'incomplete'
+                    break
+                pending.add(pool.submit(run_in_scope(task), next_index))
+                next_index += 1
+            if not pending:
+                break
+            completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                index, outcome = future.result()
+                finished[index] = outcome
+            # L'avancement enregistré ne couvre qu'une suite continue de numéros traités
+            advanced = 0
+            while done in finished:
+                outcome = finished.pop(done)
+                counts[outcome] += 1
+                if outcome == 'activated':
+                    debited += job['price']
+                elif outcome != 'already_activated' and len(failures) < MAX_REPORTED_FAILURES:
+                    failures.append({'phone_number': phone_numbers[done], 'outcome': outcome})
+                done += 1
+                advanced += 1
+            if advanced and done % BULK_CHECKPOINT_EVERY < advanced:
+                checkpoint('running')
+            if status == 'incomplete' and next_index < len(phone_numbers):
+                # On laisse se terminer les tâches en vol, sans en lancer de nouvelles
+                next_index = len(phone_numbers)
+
+    if done < len(phone_numbers):
+        status = 'incomplete'
+    checkpoint(status)
+    emit_metrics(
+        dict({f'BulkActivations_{outcome}': counts[outcome] for outcome in OUTCOMES},
+             BulkJobSeconds=(round(time.monotonic() - started, 3), 'Seconds')),
+        dimensions={'Service': 'BulkActivation'},
+        properties={'jobId': job_id, 'status': status},
+    )
+    return job_status(job_id)
+
+
+def job_status(job_id):
+    """Avancement d'un job pour le polling, ou None s'il n'existe pas."""
+    job = storage.get_item(DYNAMO_TABLE_DATA, _job_key(job_id))
+    if not job:
+        return None
+    total, done = int(job['total']), int(job.get('done', 0))
+    running_seconds = float(job.get('running_seconds', 0))
+    throughput = done / running_seconds if running_seconds else 0.0
+    status = {
+        'job_id': job_id,
+        'status': job['status'],
+        'plan_id': job['plan_id'],
+        'total': total,
+        'done': done,
+        'progress': round(done / total, 4) if total else 1.0,
+        'amount_debited': float(job.get('amount_debited', 0)),
+        'running_seconds': round(running_seconds, 3),
+        'throughput_per_second': round(throughput, 2),
+        'eta_seconds': round((total - done) / throughput, 1) if throughput and done < total else None,
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+        'failures': job.get('failures') or [],
+        **{outcome: int(job.get(outcome, 0)) for outcome in OUTCOMES},
+    }
+    return status
+
+
+def start_job(job_id, context=None):
+    """Confie le job à un worker (réinvocation asynchrone de la fonction, ou thread local)."""
+    if BULK_WORKER_MODE == 'lambda':
+        global _lambda_client
+        if _lambda_client is None:
+            import boto3
+            _lambda_client = boto3.client('lambda')
+        _lambda_client.invoke(
+            FunctionName=getattr(context, 'invoked_function_arn', None) or os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+            InvocationType='Event',
+            Payload=json_codec.dumps_bytes({'bulkJob': job_id}),
+        )
+    else:
+        threading.Thread(target=_run_local_job, args=(job_id,), name=f'bulk-{job_id[:8]}', daemon=True).start()
+
+
+def _run_local_job(job_id):
+    # Le thread survit à la requête qui l'a lancé : ses appels DynamoDB ont leur propre portée
+    with handler_scope('bulkActivation'):
+        run_job(job_id)
+
+
+def _path_job_id(event):
+    job_id = (event.get('pathParameters') or {}).get('job_id') or (event.get('pathParameters') or {}).get('jobId')
+    path = event.get('rawPath') or event.get('path') or ''
+    if not job_id and '/bulkActivation/' in path:
+        job_id = path.split('/bulkActivation/', 1)[1].strip('/')
+    return job_id
+
+
+@capacity_scope('bulkActivation')
+@profile_handler('bulkActivation')
+def lambda_handler(event, context):
+    """Création, relance et suivi des jobs ; exécution des jobs pour les invocations asynchrones."""
+    # Invocation asynchrone d'un worker (voir start_job)
+    if 'bulkJob' in event:
+        remaining = (context.get_remaining_time_in_millis if context is not None and
+                     hasattr(context, 'get_remaining_time_in_millis') else lambda: float('inf'))
+        status = run_job(event['bulkJob'], remaining_ms=remaining)
+        if status and status['status'] == 'incomplete':
+            # Timeout Lambda proche : la suite du job part dans une nouvelle invocation
+            start_job(event['bulkJob'], context)
+        return status
+
+    if 'body' in event and isinstance(event['body'], str):
+        try:
+            body = json_codec.loads(event['body'] or '{}')
+        except json_codec.JSONDecodeError:
+            return _response(400, {"status": "error", "code": INVALID_REQUEST, "message": "Corps de requête JSON invalide."})
+    else:
+        body = event
+
+    try:
+        job_id = _path_job_id(event) or body.get('job_id') or body.get('jobId')
+        if job_id:
+            status = job_status(job_id)
+            if status is None:
+                return _response(404, {"status": "error", "code": INVALID_REQUEST, "message": f"Job {job_id} introuvable."})
+            method = event.get('requestContext', {}).get('http', {}).get('method') or event.get('httpMethod')
+            if method != 'GET' and status['status'] != 'complete':
+                # Relance explicite d'un job interrompu (sans effet si un worker détient le bail)
+                start_job(job_id, context)
+            return _response(200, status)
+
+        plan_id = body.get('plan_id') or body.get('planId')
+        raw_numbers = body.get('phone_numbers') or body.get('phoneNumbers') or []
+        if isinstance(raw_numbers, str):
+            raw_numbers = [n for n in raw_numbers.replace('\n', ',').split(',') if n.strip()]
+        auto_renew = str(body.get('auto_renew', body.get('autoRenew', ''))).lower() in ('true', '1', 'yes', 'oui')
+        status_code, result = create_job(plan_id, raw_numbers, auto_renew)
+        if status_code == 202:
+            start_job(result['job_id'], context)
+        return _response(status_code, result)
+    except Exception as e:
+        print(f"Erreur du job d'activation groupée: {e}")
+        return _response(500, {"status": "error", "code": INTERNAL_ERROR,
+                               "message": "Une erreur inattendue est survenue lors de l'activation groupée."})
@@ -0,0 +1,273 @@
+"""Instrumentation de la capacité DynamoDB consommée, par handler et par opération.
+
+DynamoDBStorage enveloppe son client boto3 avec instrument_client() : chaque appel
+(GetItem, BatchGetItem, Query, Scan, TransactWriteItems, PutItem, ...) demande
+ReturnConsumedCapacity=TOTAL et relève :
+  * les unités de lecture et d'écriture consommées, par table ;
+  * les items renvoyés et, pour Query et Scan, les items lus (ScannedCount) ;
+  * la latence de l'appel.
+
+Les appels sont agrégés par (opération, table) dans la portée du handler en cours
+(décorateur capacity_scope sur chaque lambda_handler) et émis en fin d'invocation,
+un enregistrement EMF par (handler, opération, table). Les appels faits hors de toute
+portée (outils, scripts) ne sont pas relevés ; un outil peut ouvrir handler_scope().
+
+Lectures signalées (métriques dédiées et une ligne de log par handler et table) :
+  * scan          : tout Scan, qui lit (et facture) la table entière ;
+  * filtre        : Query ou Scan dont moins d'un item lu sur CAPACITY_OVERFETCH_RATIO
+                    est renvoyé (FilterExpression appliquée après la lecture facturée) ;
+  * item_complet  : GetItem, BatchGetItem ou Query sans ProjectionExpression (octets
+                    transférés et décodés ; la capacité, elle, ne dépend pas de la projection) ;
+  * gros_items    : plus de CAPACITY_LARGE_READ_UNITS unités de lecture par item renvoyé.
+
+CAPACITY_METRICS_ENABLED=false retire l'instrumentation (client boto3 nu).
+"""
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import emit_metrics
+
+CAPACITY_METRICS_ENABLED = os.environ.get('CAPACITY_METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+CAPACITY_OVERFETCH_RATIO = float(os.environ.get('CAPACITY_OVERFETCH_RATIO', '2'))
+CAPACITY_LARGE_READ_UNITS = float(os.environ.get('CAPACITY_LARGE_READ_UNITS', '2'))
+
+# Opérations du client bas niveau instrumentées (nom boto3 -> nom DynamoDB)
+OPERATIONS = {
+    'get_item': 'GetItem',
+    'batch_get_item': 'BatchGetItem',
+    'query': 'Query',
+    'scan': 'Scan',
+    'put_item': 'PutItem',
+    'update_item': 'UpdateItem',
+    'delete_item': 'DeleteItem',
+    'batch_write_item': 'BatchWriteItem',
+    'transact_get_items': 'TransactGetItems',
+    'transact_write_items': 'TransactWriteItems',
+}
+WRITE_OPERATIONS = frozenset({'PutItem', 'UpdateItem', 'DeleteItem', 'BatchWriteItem', 'TransactWriteItems'})
+FLAGGED_READS = ('scan', 'filtre', 'item_complet', 'gros_items')
+
+_current_scope = contextvars.ContextVar('capacity_scope', default=None)
+# (handler, table, signalement) déjà journalisés par ce conteneur
+_logged_flags = set()
+_logged_lock = threading.Lock()
+
+
+class _Totals:
+    __slots__ = ('calls', 'read_units', 'write_units', 'items', 'scanned', 'latency_ms', 'errors', 'flags')
+
+    def __init__(self):
+        self.calls = 0
+        self.read_units = 0.0
+        self.write_units = 0.0
+        self.items = 0
+        self.scanned = 0
+        self.latency_ms = 0.0
+        self.errors = 0
+        self.flags = dict.fromkeys(FLAGGED_READS, 0)
+
+    def add(self, call):
+        self.calls += 1
+        self.read_units += call['read_units']
+        self.write_units += call['write_units']
+        self.items += call['items']
+        self.scanned += call['scanned']
+        self.latency_ms += call['latency_ms']
+        self.errors += call['error']
+        for flag in call['flags']:
+            self.flags[flag] += 1
+
+
+class CapacityScope:
+    """Appels DynamoDB d'une invocation de handler, agrégés par (opération, table)."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, call):
+        with self._lock:
+            self.totals.setdefault((call['operation'], call['table']), _Totals()).add(call)
+
+    def flush(self):
+        with self._lock:
+            totals, self.totals = self.totals, {}
+        for (operation, table), total in totals.items():
+            _emit(self.handler, operation, table, total)
+
+
+def _emit(handler, operation, table, total):
+    metrics = {
+        'DynamoCalls': total.calls,
+        'ConsumedReadUnits': total.read_units,
+        'ConsumedWriteUnits': total.write_units,
+        'ItemsReturned': total.items,
+        'ItemsScanned': total.scanned,
+        'DynamoLatencyMs': (round(total.latency_ms, 3), 'Milliseconds'),
+        'DynamoErrors': total.errors,
+    }
+    metrics.update({f'FlaggedReads_{flag}': count for flag, count in total.flags.items() if count})
+    emit_metrics(metrics, dimensions={'Service': 'DynamoDB', 'Handler': handler, 'Operation': operation,
+                                      'Table': table})
+
+
+@contextmanager
+def handler_scope(handler):
+    """Agrège les appels DynamoDB faits dans le bloc et les émet à la sortie."""
+    scope = CapacityScope(handler)
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+        scope.flush()
+
+
+def capacity_scope(handler):
+    """Décorateur de lambda_handler : attribue ses appels DynamoDB à handler.
+
+    Une portée déjà ouverte (handler appelé depuis un autre handler, ou depuis une tâche
+    soumise avec run_in_scope) est conservée : ses appels restent attribués à l'appelant.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(event, context):
+            if _current_scope.get() is not None:
+                return function(event, context)
+            with handler_scope(handler):
+                return function(event, context)
+        return wrapper
+    return decorate
+
+
+def run_in_scope(function):
+    """function exécutée dans le contexte courant : à passer aux pools de threads (pool.submit)."""
+    return functools.partial(contextvars.copy_context().run, function)
+
+
+def _capacity_by_table(response, operation):
+    """{table: (unités lues, unités écrites)} d'après ConsumedCapacity (dict ou liste)."""
+    consumed = response.get('ConsumedCapacity') or []
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    by_table = {}
+    for entry in consumed:
+        read = entry.get('ReadCapacityUnits')
+        write = entry.get('WriteCapacityUnits')
+        if read is None and write is None:
+            # Avec TOTAL, seul CapacityUnits est renvoyé : lecture ou écriture selon l'opération
+            units = entry.get('CapacityUnits', 0.0)
+            read, write = (None, units) if operation in WRITE_OPERATIONS else (units, None)
+        by_table[entry.get('TableName', '?')] = (float(read or 0.0), float(write or 0.0))
+    return by_table
+
+
+def _tables(params):
+    if 'TableName' in params:
+        return [params['TableName']]
+    if 'RequestItems' in params:
+        return list(params['RequestItems'])
+    if 'TransactItems' in params:
+        return list(dict.fromkeys(next(iter(entry.values()))['TableName'] for entry in params['TransactItems']))
+    return ['?']
+
+
+def _items(response, table):
+    if 'Item' in response:
+        return 1
+    if 'Items' in response:
+        return len(response['Items'])
+    if 'Responses' in response:
+        responses = response['Responses']
+        return len(responses.get(table, [])) if isinstance(responses, dict) else len(responses)
+    return 0
+
+
+def _flags(operation, params, items, scanned, read_units):
+    flags = []
+    if operation == 'Scan':
+        flags.append('scan')
+    if operation in ('Query', 'Scan') and scanned and scanned >= CAPACITY_OVERFETCH_RATIO * max(items, 1):
+        flags.append('filtre')
+    if operation in ('GetItem', 'Query') and 'ProjectionExpression' not in params:
+        flags.append('item_complet')
+    if operation == 'BatchGetItem' and any('ProjectionExpression' not in request
+                                           for request in params['RequestItems'].values()):
+        flags.append('item_complet')
+    if items and read_units / items > CAPACITY_LARGE_READ_UNITS:
+        flags.append('gros_items')
+    return flags
+
+
+def record_call(operation, params, response, latency_ms, error=False):
+    """Relève un appel DynamoDB (une entrée par table touchée) dans la portée courante."""
+    scope = _current_scope.get()
+    if scope is None:
+        return
+    by_table = _capacity_by_table(response, operation)
+    tables = _tables(params)
+    for table in tables:
+        read_units, write_units = by_table.get(table, (0.0, 0.0))
+        items = _items(response, table)
+        scanned = response.get('ScannedCount', 0)
+        flags = [] if error else _flags(operation, params, items, scanned, read_units)
+        call = {
+            'operation': operation, 'table': table, 'read_units': read_units, 'write_units': write_units,
+            'items': items, 'scanned': scanned, 'latency_ms': latency_ms / len(tables), 'error': int(error),
+            'flags': flags,
+        }
+        for flag in flags:
+            _log_flag(scope.handler, operation, table, flag, call)
+        scope.record(call)
+
+
+def _log_flag(handler, operation, table, flag, call):
+    key = (handler, table, flag)
+    with _logged_lock:
+        if key in _logged_flags:
+            return
+        _logged_flags.add(key)
+    print(f"Lecture signalée ({flag}) : {handler} {operation} sur {table}, {call['items']} items renvoyés, "
+          f"{call['scanned']} lus, {call['read_units']} unités de lecture")
+
+
+class InstrumentedClient:
+    """Client DynamoDB boto3 dont les opérations de données relèvent la capacité consommée.
+
+    Tout le reste (exceptions, meta, autres opérations) est délégué au client d'origine.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        operation = OPERATIONS.get(name)
+        if operation is None:
+            return attribute
+
+        @functools.wraps(attribute)
+        def call(**params):
+            params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+            started = time.perf_counter()
+            try:
+                response = attribute(**params)
+            except Exception:
+                # Les erreurs (transaction annulée, throttling) ne renvoient pas la capacité consommée
+                record_call(operation, params, {}, (time.perf_counter() - started) * 1000, error=True)
+                raise
+            record_call(operation, params, response, (time.perf_counter() - started) * 1000)
+            return response
+        return call
+
+
+def instrument_client(client):
+    """client enveloppé par InstrumentedClient, sauf si CAPACITY_METRICS_ENABLED=false."""
+    if not CAPACITY_METRICS_ENABLED or isinstance(client, InstrumentedClient):
+        return client
+    return InstrumentedClient(client)
@@ -0,0 +1,232 @@
+"""Point d'entrée unique pour toutes les routes du backend métier.
+
+Deux modes de déploiement :
+  * Lambda unique : handler ``dispatch_app.lambda_handler``, toutes les routes
+    de l'API Gateway pointent vers la même fonction.
+  * Serveur HTTP local multi-thread (on-prem / conteneur) :
+    ``python dispatch_app.py --port 8080 --workers 16``
+
+Dans les deux cas, tous les handlers tournent dans le même processus et
+partagent le stockage et les caches de shared_resources. En local, le backend
+se choisit avec STORAGE_BACKEND (memory, sqlite) et --seed charge database/.
+"""
+import argparse
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import api_activate_subscription_handler
+import api_check_balance_handler
+import api_get_subscription_recommendation_handler
+import api_transaction_history_handler
+import api_transfer_money_handler
+import bulk_activation
+import json_codec
+import shared_resources
+from handler_profiler import profile_handler
+from storage import load_seed_csv
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+ROUTES = {
+    '/checkBalance': api_check_balance_handler.lambda_handler,
+    '/activateSubscription': api_activate_subscription_handler.lambda_handler,
+    '/transferMoney': api_transfer_money_handler.lambda_handler,
+    '/getSubscriptionRecommendation': api_get_subscription_recommendation_handler.lambda_handler,
+    # Transactions récentes et archivées (voir transaction_archive.py)
+    '/transactionHistory': api_transaction_history_handler.lambda_handler,
+    # POST crée (ou relance) un job, GET /bulkActivation/{job_id} en donne l'avancement
+    '/bulkActivation': bulk_activation.lambda_handler,
+}
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+
+def resolve_route(event):
+    """Retourne le chemin de route correspondant à l'événement, ou None."""
+    path = (
+        event.get('rawPath')
+        or event.get('path')
+        or event.get('requestContext', {}).get('http', {}).get('path')
+        or event.get('routeKey', '').split(' ')[-1]
+    )
+    if not path:
+        return None
+    path = path.split('?', 1)[0].rstrip('/')
+    # Le chemin peut être préfixé par le stage (/prod/checkBalance)
+    for route in ROUTES:
+        if path == route or path.endswith(route) or f'{route}/' in path:
+            return route
+    return None
+
+
+@profile_handler('dispatch')
+def lambda_handler(event, context):
+    """Distribue l'événement API Gateway vers le handler de la route demandée."""
+    # Réinvocation asynchrone d'un worker d'activation groupée (voir bulk_activation.start_job)
+    if 'bulkJob' in event:
+        return bulk_activation.lambda_handler(event, context)
+    route = resolve_route(event)
+    if route is None:
+        return {
+            "statusCode": 404,
+            "headers": JSON_HEADERS,
+            "body": json_codec.dumps({"status": "error", "message": "Route inconnue."})
+        }
+    return ROUTES[route](event, context)
+
+
+def to_http_response(result):
+    """Convertit le retour d'un handler en (statut, en-têtes, corps) comme le fait API Gateway.
+
+    Les handlers qui renvoient un dict sans statusCode sont sérialisés en JSON avec un statut 200.
+    """
+    if isinstance(result, dict) and 'statusCode' in result:
+        headers = dict(JSON_HEADERS)
+        headers.update(result.get('headers') or {})
+        body = result.get('body', '')
+        if not isinstance(body, str):
+            body = json_codec.dumps(body)
+        return int(result['statusCode']), headers, body.encode('utf-8')
+    return 200, dict(JSON_HEADERS), json_codec.dumps_bytes(result)
+
+
+class DispatchRequestHandler(BaseHTTPRequestHandler):
+    """Traduit une requête HTTP locale en événement API Gateway (payload 2.0)."""
+
+    protocol_version = 'HTTP/1.1'
+    # Libère vite le worker d'une connexion keep-alive inactive
+    timeout = float(os.environ.get('DISPATCH_KEEPALIVE_SECONDS', '5'))
+
+    def _dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length).decode('utf-8') if length else ''
+        event = {
+            'version': '2.0',
+            'routeKey': f'{method} {self.path}',
+            'rawPath': self.path.split('?', 1)[0],
+            'headers': {k.lower(): v for k, v in self.headers.items()},
+            'requestContext': {'http': {'method': method, 'path': self.path}},
+            'body': raw_body,
+            'isBase64Encoded': False,
+        }
+        if method == 'GET' and event['rawPath'] == '/health':
+            status, headers, body = 200, dict(JSON_HEADERS), b'{"status": "ok"}'
+        else:
+            try:
+                status, headers, body = to_http_response(lambda_handler(event, None))
+            except Exception as e:
+                logger.exception('Erreur non gérée sur %s', self.path)
+                status, headers = 500, dict(JSON_HEADERS)
+                body = json_codec.dumps_bytes({"status": "error", "message": f"Erreur interne : {e}"})
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        if self.server.saturated():
+            # Des connexions attendent un worker : celle-ci ne le garde pas en keep-alive
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def log_message(self, format, *args):
+        logger.info('%s - %s', self.address_string(), format % args)
+
+
+SATURATED_BODY = json_codec.dumps_bytes({"status": "error", "code": "THROTTLED",
+                                         "message": "Serveur saturé, veuillez réessayer."})
+SATURATED_RESPONSE = (b'HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\nRetry-After: 1\r\n'
+                      b'Connection: close\r\nContent-Length: ' + str(len(SATURATED_BODY)).encode() + b'\r\n\r\n'
+                      + SATURATED_BODY)
+
+
+class PooledHTTPServer(HTTPServer):
+    """Serveur HTTP dont les requêtes sont traitées par un pool de threads borné.
+
+    Au plus max_workers + max_queued connexions sont acceptées à la fois ; au-delà,
+    la connexion reçoit aussitôt un 503 (Retry-After: 1) sans attendre un worker.
+    """
+
+    def __init__(self, server_address, handler_class, max_workers=16, max_queued=None):
+        super().__init__(server_address, handler_class)
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dispatch')
+        self._slots = threading.BoundedSemaphore(max_workers + (max_workers if max_queued is None else max_queued))
+        self._in_flight = 0
+        self._count_lock = threading.Lock()
+
+    def saturated(self):
+        """Vrai si des connexions attendent un worker."""
+        return self._in_flight > self.max_workers
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            self._reject(request)
+            return
+        with self._count_lock:
+            self._in_flight += 1
+        self._pool.submit(self._process_request_worker, request, client_address)
+
+    def _reject(self, request):
+        try:
+            request.settimeout(1)
+            request.sendall(SATURATED_RESPONSE)
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._count_lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+def serve(host='127.0.0.1', port=8080, workers=16, queued=None):
+    server = PooledHTTPServer((host, port), DispatchRequestHandler, max_workers=workers, max_queued=queued)
+    logger.info('Backend métier à l\'écoute sur http://%s:%s (%s workers)', host, port, workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    parser = argparse.ArgumentParser(description='Serveur local pour toutes les routes du backend métier.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=16, help='Taille du pool de threads')
+    parser.add_argument('--queue', type=int, default=None,
+                        help="Connexions en attente d'un worker au-delà desquelles on répond 503 (défaut : --workers)")
+    parser.add_argument('--seed', metavar='DIR',
+                        help='Charge TelcoData.csv et Catalog.csv de DIR dans le stockage (backends memory/sqlite)')
+    args = parser.parse_args()
+    if args.seed:
+        for table, filename in ((shared_resources.DYNAMO_TABLE_DATA, 'TelcoData.csv'),
+                                (shared_resources.DYNAMO_TABLE_CATALOG, 'Catalog.csv')):
+            count = load_seed_csv(shared_resources.storage, table, os.path.join(args.seed, filename))
+            logger.info('%s items chargés dans %s', count, table)
+    serve(args.host, args.port, args.workers, args.queue)
@@ -0,0 +1,143 @@
+"""Projections du grand livre alimentées par le flux de modifications de TelcoData.
+
+Branché sur DynamoDB Streams (NEW_IMAGE ou NEW_AND_OLD_IMAGES) avec
+ReportBatchItemFailures, ce consommateur lit les transactions validées
+(items TRANS# insérés par les handlers) et écrit, hors du chemin critique :
+  * l'enregistrement côté destinataire d'un transfert (MOBILE_MONEY_TRANSFER_RECEIVED),
+  * un agrégat journalier par utilisateur (SK = AGG#DAY#AAAA-MM-JJ),
+  * un résumé par utilisateur (SK = SUMMARY).
+
+Chaque enregistrement source est projeté dans une seule transaction qui pose
+aussi un marqueur PROJ# conditionnel : rejouer un lot est sans effet (idempotent).
+En local, storage.LocalStream fournit des lots au même format que le flux.
+"""
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from capacity_metrics import capacity_scope
+from handler_profiler import profile_handler
+from metrics import emit_metrics
+from shared_resources import DYNAMO_TABLE_DATA, storage
+from storage import CONDITIONAL_CHECK_FAILED, TransactionCancelled, deserialize_item, put_op, update_op
+
+TRANSFER_SENT = 'MOBILE_MONEY_TRANSFER_SENT'
+TRANSFER_RECEIVED = 'MOBILE_MONEY_TRANSFER_RECEIVED'
+# Durée de vie des marqueurs d'idempotence (attribut TTL expires_at), bien au-delà de la rétention du flux (24 h)
+MARKER_TTL_SECONDS = 7 * 24 * 3600
+
+
+def _phone(pk):
+    return pk.split('#', 1)[1]
+
+
+def _aggregate_ops(pk, day, transaction_type, amount, timestamp):
+    """Incréments de l'agrégat journalier et du résumé d'un utilisateur."""
+    increments = {
+        'tx_count': 1,
+        'net_amount': amount,
+        f'count_{transaction_type}': 1,
+        f'amount_{transaction_type}': amount,
+    }
+    return [
+        update_op(DYNAMO_TABLE_DATA, {'PK': pk, 'SK': f'AGG#DAY#{day}'},
+                  set={'Type': 'DAILY_AGGREGATE', 'day': day}, increment=increments),
+        update_op(DYNAMO_TABLE_DATA, {'PK': pk, 'SK': 'SUMMARY'},
+                  set={'Type': 'SUMMARY', 'last_transaction_at': timestamp}, increment=increments),
+    ]
+
+
+def build_projection(item):
+    """Retourne les opérations de projection d'un item TRANS#, ou None s'il n'y a rien à projeter."""
+    if not item.get('SK', '').startswith('TRANS#') or item.get('Type') != 'TRANSACTION':
+        return None
+    # Les items déjà issus d'une projection sont agrégés dans la transaction qui les crée
+    if 'projected_from' in item:
+        return None
+
+    pk, sk = item['PK'], item['SK']
+    # Les SK peuvent porter un suffixe après l'horodatage (TRANS#{horodatage}#{forfait})
+    timestamp = sk[len('TRANS#'):].split('#', 1)[0]
+    day = timestamp[:10]
+    amount = Decimal(item.get('amount', 0))
+    transaction_type = item.get('transaction_type', 'UNKNOWN')
+
+    ops = [put_op(DYNAMO_TABLE_DATA, {
+        'PK': f'PROJ#{pk}',
+        'SK': sk,
+        'Type': 'PROJECTION_MARKER',
+        'expires_at': int(time.time()) + MARKER_TTL_SECONDS,
+    }, require_absent=True)]
+    ops += _aggregate_ops(pk, day, transaction_type, amount, timestamp)
+
+    counterparty = item.get('counterparty')
+    if transaction_type == TRANSFER_SENT and counterparty:
+        recipient_pk = f'USER#{counterparty}'
+        ops.append(put_op(DYNAMO_TABLE_DATA, {
+            'PK': recipient_pk,
+            'SK': f'TRANS#{timestamp}#FROM#{_phone(pk)}',
+            'Type': 'TRANSACTION',
+            'amount': -amount,
+            'transaction_type': TRANSFER_RECEIVED,
+            'details': f'Réception de transfert de {_phone(pk)}',
+            'counterparty': _phone(pk),
+            'projected_from': f'{pk}|{sk}',
+        }))
+        ops += _aggregate_ops(recipient_pk, day, TRANSFER_RECEIVED, -amount, timestamp)
+    return ops
+
+
+@capacity_scope('ledgerProjector')
+@profile_handler('ledgerProjector')
+def lambda_handler(event, context):
+    """Traite un lot d'enregistrements du flux ; retourne les échecs partiels (ReportBatchItemFailures)."""
+    records = event.get('Records', [])
+    projected = skipped = duplicates = 0
+    lags_ms = []
+    failures = []
+
+    for index, record in enumerate(records):
+        change = record.get('dynamodb', {})
+        if 'ApproximateCreationDateTime' in change:
+            lags_ms.append(max(0.0, (time.time() - float(change['ApproximateCreationDateTime'])) * 1000))
+        if record.get('eventName') != 'INSERT' or 'NewImage' not in change:
+            skipped += 1
+            continue
+
+        ops = build_projection(deserialize_item(change['NewImage']))
+        if ops is None:
+            skipped += 1
+            continue
+        try:
+            storage.transact_write(ops)
+            projected += 1
+        except TransactionCancelled as e:
+            if e.reasons and e.reasons[0] == CONDITIONAL_CHECK_FAILED:
+                # Marqueur déjà présent : enregistrement projeté lors d'une tentative précédente
+                duplicates += 1
+                continue
+            print(f"Erreur de projection pour {change.get('Keys')}: {e}")
+            failures = records[index:]
+            break
+        except Exception as e:
+            print(f"Erreur de projection pour {change.get('Keys')}: {e}")
+            # On s'arrête au premier échec pour préserver l'ordre par partition
+            failures = records[index:]
+            break
+
+    emit_metrics(
+        {
+            'RecordsReceived': len(records),
+            'RecordsProjected': projected,
+            'RecordsSkipped': skipped,
+            'DuplicatesSkipped': duplicates,
+            'RecordsFailed': len(failures),
+            'ProjectionLagMaxMs': (max(lags_ms) if lags_ms else 0.0, 'Milliseconds'),
+            'ProjectionLagAvgMs': (sum(lags_ms) / len(lags_ms) if lags_ms else 0.0, 'Milliseconds'),
+        },
+        dimensions={'Service': 'LedgerProjector'},
+        properties={'processedAt': datetime.now(timezone.utc).isoformat()},
+    )
+    return {'batchItemFailures': [
+        {'itemIdentifier': r.get('dynamodb', {}).get('SequenceNumber')} for r in failures
+    ]}
@@ -0,0 +1,280 @@
+"""Moteur de renouvellement automatique des forfaits arrivant à expiration.
+
+Déclenché par une règle planifiée (EventBridge), il parcourt les profils
+(SK = METADATA), retient les forfaits marqués ``auto_renew`` qui expirent dans
+la fenêtre RENEWAL_WINDOW_HOURS (ou ont expiré depuis moins de
+RENEWAL_GRACE_HOURS) et les renouvelle avec la même transaction que
+l'activation : débit conditionnel du crédit, ajout du forfait et journal
+TRANS#{horodatage}#{forfait} (un par renouvellement, jamais écrasé).
+
+  * Pool de RENEWAL_WORKERS threads, au plus RENEWAL_MAX_PER_SECOND renouvellements
+    par seconde (seau à jetons) pour ne pas saturer la table.
+  * Chaque renouvellement pose un marqueur conditionnel RENEWAL#{forfait}#{expiration} :
+    relancer un run ne débite jamais deux fois.
+  * Un point de reprise (RENEWAL_RUN#{run_id} / CHECKPOINT) est enregistré
+    régulièrement ; un run interrompu (timeout Lambda) reprend là où il s'est arrêté.
+  * Le rapport du run (compteurs, montant débité, durée) est enregistré
+    (RENEWAL_RUN#{run_id} / REPORT), émis en métriques et retourné.
+
+En local :
+    python renewal_engine.py --seed ../database --window-hours 72 --now 2025-11-21T12:00:00
+"""
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from api_activate_subscription_handler import build_activation_ops
+from capacity_metrics import capacity_scope, run_in_scope
+from handler_profiler import profile_handler
+from metrics import emit_metrics
+from shared_resources import DYNAMO_TABLE_DATA, RateLimiter, balance_cache, find_catalog_plan, storage
+from storage import CONDITIONAL_CHECK_FAILED, TransactionCancelled, put_op
+
+RENEWAL_WINDOW_HOURS = float(os.environ.get('RENEWAL_WINDOW_HOURS', '24'))
+RENEWAL_GRACE_HOURS = float(os.environ.get('RENEWAL_GRACE_HOURS', '24'))
+RENEWAL_WORKERS = int(os.environ.get('RENEWAL_WORKERS', '8'))
+RENEWAL_MAX_PER_SECOND = float(os.environ.get('RENEWAL_MAX_PER_SECOND', '20'))
+RENEWAL_CHECKPOINT_EVERY = int(os.environ.get('RENEWAL_CHECKPOINT_EVERY', '50'))
+# Marge laissée avant le timeout Lambda pour enregistrer le point de reprise
+RENEWAL_SAFETY_MARGIN_MS = int(os.environ.get('RENEWAL_SAFETY_MARGIN_MS', '20000'))
+# Les marqueurs doivent survivre au-delà de la période de grâce
+MARKER_TTL_SECONDS = 30 * 24 * 3600
+
+OUTCOMES = ('renewed', 'insufficient_funds', 'already_renewed', 'plan_unavailable', 'failed')
+
+
+def parse_date(value):
+    """Dates ISO du profil, avec ou sans 'Z' (toujours en UTC naïf)."""
+    return datetime.fromisoformat(value.replace('Z', '')[:26])
+
+
+def find_candidates(now, window_hours=RENEWAL_WINDOW_HOURS, grace_hours=RENEWAL_GRACE_HOURS):
+    """Forfaits auto_renew expirant dans la fenêtre, triés par (téléphone, forfait, expiration)."""
+    start = now - timedelta(hours=grace_hours)
+    end = now + timedelta(hours=window_hours)
+    candidates = []
+    for profile in storage.scan(DYNAMO_TABLE_DATA, filters={'SK': 'METADATA'}):
+        phone_number = profile['PK'].split('#', 1)[1]
+        subs = profile.get('active_subs') or []
+        # Un forfait déjà prolongé (entrée plus récente du même id) n'est pas renouvelé une seconde fois
+        latest = {}
+        for sub in subs:
+            if sub.get('expiration_date') and sub['expiration_date'] >= latest.get(sub['id'], ''):
+                latest[sub['id']] = sub['expiration_date']
+        for sub in subs:
+            if not sub.get('auto_renew') or sub.get('expiration_date') != latest.get(sub['id']):
+                continue
+            # Forfait pas encore commencé : c'est déjà un renouvellement anticipé
+            if sub.get('activation_date') and parse_date(sub['activation_date']) >= now:
+                continue
+            expiration = parse_date(sub['expiration_date'])
+            if start <= expiration <= end:
+                candidates.append({'phone_number': phone_number, 'sub': sub, 'expiration': expiration})
+    candidates.sort(key=candidate_key)
+    return candidates
+
+
+def candidate_key(candidate):
+    """Clé d'ordre stable d'un candidat, utilisée comme point de reprise."""
+    return f"{candidate['phone_number']}|{candidate['sub']['id']}|{candidate['sub']['expiration_date']}"
+
+
+def renew(candidate, now, dry_run=False):
+    """Renouvelle un forfait ; retourne (résultat, montant débité)."""
+    sub = candidate['sub']
+    plan = find_catalog_plan(sub['id'])
+    if not plan:
+        return 'plan_unavailable', Decimal(0)
+    price = Decimal(str(plan['price']))
+    if dry_run:
+        return 'renewed', price
+
+    # Le nouveau forfait prend le relais à l'expiration de l'ancien, sans chevauchement
+    starts = max(candidate['expiration'], now)
+    new_sub = {
+        'id': sub['id'],
+        'name': plan['name'],
+        'activation_date': starts.isoformat(),
+        'expiration_date': (starts + timedelta(days=int(plan['duration_days']))).isoformat(),
+        'auto_renew': True,
+    }
+    # Journal à l'heure du renouvellement et par forfait : tous les renouvellements d'un run
+    # partagent `now`, et deux forfaits d'un même abonné ne doivent pas s'écraser
+    ops = build_activation_ops(
+        candidate['phone_number'], sub['id'], plan, new_sub, datetime.utcnow(),
+        transaction_type='SUBSCRIPTION_RENEWAL',
+        details=f"Renouvellement automatique du forfait {plan['name']}",
+        transaction_suffix=sub['id'],
+    )
+    ops.append(put_op(DYNAMO_TABLE_DATA, {
+        'PK': f"USER#{candidate['phone_number']}",
+        'SK': f"RENEWAL#{sub['id']}#{sub['expiration_date']}",
+        'Type': 'RENEWAL_MARKER',
+        'expires_at': int(time.time()) + MARKER_TTL_SECONDS,
+    }, require_absent=True))
+    try:
+        storage.transact_write(ops)
+        balance_cache.invalidate(candidate['phone_number'])
+        return 'renewed', price
+    except TransactionCancelled as e:
+        reasons = list(e.reasons or [])
+        if len(reasons) == len(ops) and reasons[-1] == CONDITIONAL_CHECK_FAILED:
+            return 'already_renewed', Decimal(0)
+        if reasons and reasons[0] == CONDITIONAL_CHECK_FAILED:
+            return 'insufficient_funds', Decimal(0)
+        print(f"Renouvellement annulé pour {candidate['phone_number']} / {sub['id']}: {e}")
+        return 'failed', Decimal(0)
+
+
+def _load_checkpoint(run_id):
+    return storage.get_item(DYNAMO_TABLE_DATA, {'PK': f'RENEWAL_RUN#{run_id}', 'SK': 'CHECKPOINT'})
+
+
+def _save(run_id, sk, fields):
+    storage.put_item(DYNAMO_TABLE_DATA, dict({'PK': f'RENEWAL_RUN#{run_id}', 'SK': sk,
+                                              'Type': 'RENEWAL_RUN'}, **fields))
+
+
+def run_renewals(now=None, run_id=None, window_hours=RENEWAL_WINDOW_HOURS, grace_hours=RENEWAL_GRACE_HOURS,
+                 workers=RENEWAL_WORKERS, max_per_second=RENEWAL_MAX_PER_SECOND,
+                 remaining_ms=lambda: float('inf'), dry_run=False):
+    """Exécute (ou reprend) un run de renouvellement et retourne son rapport."""
+    now = now or datetime.utcnow()
+    run_id = run_id or now.strftime('%Y-%m-%d')
+    started = time.monotonic()
+
+    checkpoint = {} if dry_run else (_load_checkpoint(run_id) or {})
+    if checkpoint.get('status') == 'complete':
+        return {'run_id': run_id, 'status': 'complete', 'resumed': True, **_report_counts(checkpoint)}
+    # Le run garde la date de son premier passage pour que la sélection soit stable à la reprise
+    now = parse_date(checkpoint['now']) if checkpoint.get('now') else now
+    # Les forfaits déjà renouvelés sortent de la sélection : on reprend par clé, pas par position
+    last_key = checkpoint.get('last_key', '')
+    candidates = [c for c in find_candidates(now, window_hours, grace_hours) if candidate_key(c) > last_key]
+    done = int(checkpoint.get('done', 0))
+    counts = {outcome: int(checkpoint.get(outcome, 0)) for outcome in OUTCOMES}
+    debited = Decimal(str(checkpoint.get('amount_debited', 0)))
+
+    limiter = RateLimiter(max_per_second)
+    finished = {}  # index -> résultat, en attente que les précédents soient terminés
+    status = 'complete'
+
+    def task(index, candidate):
+        limiter.acquire()
+        try:
+            return index, renew(candidate, now, dry_run)
+        except Exception as e:
+            print(f"Erreur de renouvellement pour {candidate['phone_number']}: {e}")
+            return index, ('failed', Decimal(0))
+
+    def checkpoint_fields(state):
+        return dict(counts, now=now.isoformat(), done=done, last_key=last_key,
+                    amount_debited=debited, status=state, updated_at=datetime.utcnow().isoformat())
+
+    pending = set()
+    next_index = 0
+    contiguous = 0  # candidats de ce passage traités sans trou depuis le début
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while next_index < len(candidates) or pending:
+            # File bornée : au plus deux tâches en attente par worker
+            while next_index < len(candidates) and len(pending) < 2 * workers:
+                if remaining_ms() < RENEWAL_SAFETY_MARGIN_MS:
+                    status = 'incomplete'
+                    break
+                pending.add(pool.submit(run_in_scope(task), next_index, candidates[next_index]))
+                next_index += 1
+            if not pending:
+                break
+            completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                index, result = future.result()
+                finished[index] = result
+            # Le point de reprise n'avance que sur une suite continue de candidats traités
+            advanced = 0
+            while contiguous in finished:
+                outcome, amount = finished.pop(contiguous)
+                counts[outcome] += 1
+                debited += amount
+                last_key = candidate_key(candidates[contiguous])
+                contiguous += 1
+                done += 1
+                advanced += 1
+            if not dry_run and advanced and done % RENEWAL_CHECKPOINT_EVERY < advanced:
+                _save(run_id, 'CHECKPOINT', checkpoint_fields('running'))
+            if status == 'incomplete' and next_index < len(candidates):
+                # On laisse se terminer les tâches en vol, sans en lancer de nouvelles
+                next_index = len(candidates)
+
+    if contiguous < len(candidates):
+        status = 'incomplete'
+    report = {
+        'run_id': run_id,
+        'status': status,
+        'dry_run': dry_run,
+        'resumed': bool(checkpoint),
+        'window_start': (now - timedelta(hours=grace_hours)).isoformat(),
+        'window_end': (now + timedelta(hours=window_hours)).isoformat(),
+        'candidates': len(candidates) + int(checkpoint.get('done', 0)),
+        'processed': done,
+        'amount_debited': float(debited),
+        'duration_seconds': round(time.monotonic() - started, 3),
+        **counts,
+    }
+    if not dry_run:
+        _save(run_id, 'CHECKPOINT', checkpoint_fields(status))
+        _save(run_id, 'REPORT', {k: v for k, v in report.items() if k != 'run_id'})
+    emit_metrics(
+        dict({f'Renewals_{outcome}': counts[outcome] for outcome in OUTCOMES},
+             RenewalCandidates=len(candidates),
+             RenewalRunSeconds=(report['duration_seconds'], 'Seconds')),
+        dimensions={'Service': 'RenewalEngine'},
+        properties={'runId': run_id, 'status': status, 'dryRun': dry_run},
+    )
+    return report
+
+
+def _report_counts(item):
+    return {outcome: int(item.get(outcome, 0)) for outcome in OUTCOMES}
+
+
+@capacity_scope('renewalEngine')
+@profile_handler('renewalEngine')
+def lambda_handler(event, context):
+    """Point d'entrée planifié ; l'événement peut fixer run_id, window_hours, dry_run."""
+    event = event or {}
+    remaining = (context.get_remaining_time_in_millis if context is not None and
+                 hasattr(context, 'get_remaining_time_in_millis') else lambda: float('inf'))
+    return run_renewals(
+        run_id=event.get('run_id'),
+        window_hours=float(event.get('window_hours', RENEWAL_WINDOW_HOURS)),
+        grace_hours=float(event.get('grace_hours', RENEWAL_GRACE_HOURS)),
+        remaining_ms=remaining,
+        dry_run=bool(event.get('dry_run', False)),
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Renouvellement automatique des forfaits')
+    parser.add_argument('--seed', metavar='DIR', help='charge TelcoData.csv et Catalog.csv (stockage local)')
+    parser.add_argument('--now', help='date de référence ISO (défaut : maintenant)')
+    parser.add_argument('--run-id')
+    parser.add_argument('--window-hours', type=float, default=RENEWAL_WINDOW_HOURS)
+    parser.add_argument('--grace-hours', type=float, default=RENEWAL_GRACE_HOURS)
+    parser.add_argument('--workers', type=int, default=RENEWAL_WORKERS)
+    parser.add_argument('--max-per-second', type=float, default=RENEWAL_MAX_PER_SECOND)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    if args.seed:
+        from shared_resources import DYNAMO_TABLE_CATALOG
+        from storage import load_seed_csv
+        load_seed_csv(storage, DYNAMO_TABLE_DATA, os.path.join(args.seed, 'TelcoData.csv'))
+        load_seed_csv(storage, DYNAMO_TABLE_CATALOG, os.path.join(args.seed, 'Catalog.csv'))
+    result = run_renewals(now=parse_date(args.now) if args.now else None, run_id=args.run_id,
+                          window_hours=args.window_hours, grace_hours=args.grace_hours,
+                          workers=args.workers, max_per_second=args.max_per_second, dry_run=args.dry_run)
+    for key, value in result.items():
+        print(f'{key:>20}: {value}')
@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+
+from balance_cache import create_balance_cache
+from storage import BALANCE_PROJECTION, create_storage, decode_balance_projection, decode_catalog_plan
+
+# Configuration AWS
+DYNAMO_TABLE_DATA = os.environ.get('DYNAMO_TABLE_DATA_NAME', 'TelcoData')  # TelcoData
+DYNAMO_TABLE_CATALOG = os.environ.get('DYNAMO_TABLE_CATALOG_NAME', 'Catalog')  # Catalog
+CATALOG_CACHE_TTL_SECONDS = float(os.environ.get('CATALOG_CACHE_TTL_SECONDS', '300'))
+UNKNOWN_SUBSCRIBER_TTL_SECONDS = float(os.environ.get('UNKNOWN_SUBSCRIBER_TTL_SECONDS', '60'))
+UNKNOWN_SUBSCRIBER_MAX_ENTRIES = int(os.environ.get('UNKNOWN_SUBSCRIBER_MAX_ENTRIES', '10000'))
+
+# Backend de stockage partagé par toutes les routes du processus (STORAGE_BACKEND=dynamodb|memory|sqlite)
+storage = create_storage()
+
+
+class TTLCache:
+    """Cache clé/valeur en mémoire avec expiration, partagé entre les routes."""
+
+    def __init__(self, ttl_seconds, max_entries=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Retourne la valeur en cache, ou default si absente/expirée."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+        return default
+
+    def set(self, key, value):
+        if self.ttl_seconds <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self.max_entries and len(self._entries) >= self.max_entries and key not in self._entries:
+                # Purge des entrées expirées, puis des plus anciennes si le cache reste plein
+                self._entries = {k: e for k, e in self._entries.items() if e[0] > now}
+                while len(self._entries) >= self.max_entries:
+                    self._entries.pop(min(self._entries, key=lambda k: self._entries[k][0]))
+            self._entries[key] = (now + self.ttl_seconds, value)
+
+    def get_or_load(self, key, loader):
+        """Retourne la valeur en cache ou l'obtient via loader() si absente/expirée."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+        value = loader()
+        self.set(key, value)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+class RateLimiter:
+    """Seau à jetons partagé par les workers."""
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Le catalogue change rarement : activation et recommandation partagent le même cache
+catalog_cache = TTLCache(CATALOG_CACHE_TTL_SECONDS)
+_MISSING = object()
+
+
+def find_catalog_plan(subscription_id):
+    """Retourne le forfait du catalogue dont le SK vaut subscription_id, ou None."""
+    def load():
+        # Catalog structure: PK=category (DATA, VOIX_SMS, PACK), SK=subscription_id
+        # Since we don't know PK, scan for the subscription_id in SK
+        items = storage.scan(DYNAMO_TABLE_CATALOG, filters={'SK': subscription_id}, decoder=decode_catalog_plan)
+        return items[0] if items else None
+    return catalog_cache.get_or_load(('plan', subscription_id), load)
+
+
+def find_catalog_plans(subscription_ids):
+    """Forfaits du catalogue par SK ({subscription_id: item ou None}).
+
+    Les forfaits absents du cache sont lus par un seul scan du catalogue (quel que soit
+    leur nombre), qui met en cache tous les forfaits rencontrés.
+    """
+    plans = {sid: catalog_cache.get(('plan', sid), _MISSING) for sid in subscription_ids}
+    missing = [sid for sid, plan in plans.items() if plan is _MISSING]
+    if missing:
+        found = {}
+        for item in storage.scan(DYNAMO_TABLE_CATALOG, decoder=decode_catalog_plan):
+            found[item['SK']] = item
+            catalog_cache.set(('plan', item['SK']), item)
+        for sid in missing:
+            plans[sid] = found.get(sid)
+            if sid not in found:
+                catalog_cache.set(('plan', sid), None)
+    return plans
+
+
+def query_catalog_category(category):
+    """Retourne tous les forfaits d'une catégorie (PK) du catalogue."""
+    return catalog_cache.get_or_load(
+        ('category', category),
+        lambda: storage.query(DYNAMO_TABLE_CATALOG, category, decoder=decode_catalog_plan)
+    )
+
+
+# Soldes (projection METADATA) : lus par checkBalance et la recommandation, invalidés après chaque écriture
+balance_cache = create_balance_cache()
+BALANCE_ATTRIBUTES = list(BALANCE_PROJECTION)
+
+
+def get_balance_projection(phone_number):
+    """Projection METADATA de l'abonné via le cache des soldes, ou None s'il n'existe pas.
+
+    Les soldes sont des float (lecture seule : les débits restent des Decimal dans les transactions).
+    """
+    return balance_cache.get_or_load(phone_number, lambda: storage.get_item(
+        DYNAMO_TABLE_DATA,
+        {'PK': f'USER#{phone_number}', 'SK': 'METADATA'},
+        attributes=BALANCE_ATTRIBUTES,
+        decoder=decode_balance_projection
+    ))
+
+
+# Cache négatif : numéros dont l'absence a été confirmée par une lecture. Les appels répétés pour un
+# abonné inconnu (boucle de retry de l'agent) sont refusés sans requête DynamoDB pendant le TTL.
+unknown_subscribers = TTLCache(UNKNOWN_SUBSCRIBER_TTL_SECONDS, max_entries=UNKNOWN_SUBSCRIBER_MAX_ENTRIES)
+
+
+def is_unknown_subscriber(phone_number):
+    return unknown_subscribers.get(phone_number, False)
+
+
+def remember_unknown_subscriber(phone_number):
+    unknown_subscribers.set(phone_number, True)
+
+
+def forget_unknown_subscriber(phone_number):
+    """À appeler lors de la création d'un compte pour ce numéro."""
+    unknown_subscribers.invalidate(phone_number)
@@ -0,0 +1,893 @@
+"""Abstraction de stockage pour les handlers du backend métier.
+
+Couvre exactement les opérations utilisées par les handlers :
+  * get_item(table, key, attributes)          -> lecture d'un item (projection optionnelle)
+  * batch_get(table, keys, attributes)        -> items existants parmi keys (lectures groupées)
+  * query(table, pk, sk_prefix)               -> items d'une partition (SK commençant par sk_prefix)
+  * scan(table, filters)                      -> items dont les attributs valent filters
+  * scan_pages(table, ..., segment, total_segments)
+                                              -> mêmes items par pages, sur un segment du scan
+  * transact_write(ops)                       -> écritures conditionnelles atomiques
+
+Les lectures acceptent un paramètre decoder (decode_balance_projection, decode_catalog_plan)
+qui remplace deserialize_item pour les items lus sur le chemin critique.
+
+Les opérations de transaction sont construites avec update_op(), put_op() et delete_op().
+En cas d'échec d'une condition, transact_write lève TransactionCancelled avec
+un code de raison par opération (même convention que CancellationReasons de DynamoDB)
+et, pour les conditions échouées, l'item tel qu'il était (None s'il n'existe pas).
+Un conflit avec une transaction concurrente ou un throttling est signalé de la
+même façon (TRANSACTION_CONFLICT, THROTTLING_ERROR) : rien n'a été écrit, l'appel
+peut être rejoué.
+
+Implémentations :
+  * DynamoDBStorage : production (client boto3 bas niveau, thread-safe, instrumenté
+                      par capacity_metrics)
+  * InMemoryStorage : tests et benchmarks
+  * SQLiteStorage   : déploiement mono-nœud (mode WAL)
+
+Le backend est choisi par la variable d'environnement STORAGE_BACKEND
+(dynamodb | memory | sqlite), voir create_storage().
+"""
+import copy
+import csv
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from decimal import Decimal
+
+import json_codec
+
+CONDITIONAL_CHECK_FAILED = 'ConditionalCheckFailed'
+TRANSACTION_CONFLICT = 'TransactionConflict'
+THROTTLING_ERROR = 'ThrottlingError'
+# Codes DynamoDB équivalents à un throttling (raison d'annulation ou exception du client)
+THROTTLING_CODES = frozenset({
+    THROTTLING_ERROR, 'ProvisionedThroughputExceeded', 'ProvisionedThroughputExceededException',
+    'ThrottlingException', 'RequestLimitExceeded',
+})
+
+
+class TransactionCancelled(Exception):
+    """Transaction annulée ; reasons contient un code (ou None) par opération.
+
+    items contient, pour chaque opération dont la condition a échoué, l'item existant
+    (None s'il n'existe pas) ; l'entrée est absente du dict si l'item n'est pas connu.
+    """
+
+    def __init__(self, reasons, message=None, items=None):
+        self.reasons = list(reasons)
+        self.items = dict(items or {})
+        super().__init__(message or f"Transaction annulée : {self.reasons}")
+
+    @property
+    def conflict(self):
+        return TRANSACTION_CONFLICT in self.reasons
+
+    @property
+    def throttled(self):
+        return any(reason in THROTTLING_CODES for reason in self.reasons)
+
+
+# ---------------------------------------------------------------------------
+# Construction des opérations de transaction
+# ---------------------------------------------------------------------------
+
+def update_op(table, key, set=None, increment=None, append=None,
+              require_exists=False, require_min=None, require_max=None):
+    """Mise à jour d'un item.
+
+    set        : {attr: valeur} remplacés tels quels
+    increment  : {attr: delta} ajoutés (attribut créé à 0 s'il est absent)
+    append     : {attr: [valeurs]} ajoutées en fin de liste (liste créée si absente)
+    require_exists : l'item doit exister
+    require_min    : {attr: minimum} chaque attribut doit valoir au moins minimum
+    require_max    : {attr: maximum} chaque attribut, s'il existe, doit valoir au plus maximum
+    """
+    return {'Update': {
+        'table': table,
+        'key': key,
+        'set': set or {},
+        'increment': increment or {},
+        'append': append or {},
+        'condition': {'exists': require_exists, 'min': require_min or {}, 'max': require_max or {}},
+    }}
+
+
+def put_op(table, item, require_absent=False):
+    """Écriture complète d'un item ; require_absent interdit d'écraser un item existant."""
+    return {'Put': {
+        'table': table,
+        'item': item,
+        'condition': {'absent': require_absent},
+    }}
+
+
+def delete_op(table, key, require_exists=False):
+    """Suppression d'un item ; require_exists fait échouer la transaction si l'item n'existe pas."""
+    return {'Delete': {
+        'table': table,
+        'key': key,
+        'condition': {'exists': require_exists},
+    }}
+
+
+# ---------------------------------------------------------------------------
+# Format typé DynamoDB ({'S': ...}, {'N': ...}, ...)
+# ---------------------------------------------------------------------------
+
+def serialize_value(value):
+    """Convertit une valeur Python en AttributeValue DynamoDB."""
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, (int, float, Decimal)):
+        return {'N': str(value)}
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, (list, tuple)):
+        return {'L': [serialize_value(v) for v in value]}
+    if isinstance(value, dict):
+        return {'M': {k: serialize_value(v) for k, v in value.items()}}
+    raise TypeError(f"Type non supporté pour le stockage : {type(value).__name__}")
+
+
+def deserialize_value(attribute):
+    """Convertit un AttributeValue DynamoDB en valeur Python (nombres en Decimal)."""
+    (kind, value), = attribute.items()
+    if kind == 'S':
+        return value
+    if kind == 'N':
+        return Decimal(value)
+    if kind == 'BOOL':
+        return value
+    if kind == 'NULL':
+        return None
+    if kind == 'L':
+        return [deserialize_value(v) for v in value]
+    if kind == 'M':
+        return {k: deserialize_value(v) for k, v in value.items()}
+    if kind == 'SS':
+        return set(value)
+    if kind == 'NS':
+        return {Decimal(v) for v in value}
+    raise TypeError(f"Type DynamoDB non supporté : {kind}")
+
+
+def serialize_item(item):
+    return {k: serialize_value(v) for k, v in item.items()}
+
+
+def deserialize_item(item):
+    return {k: deserialize_value(v) for k, v in item.items()}
+
+
+# ---------------------------------------------------------------------------
+# Décodeurs spécialisés des items lus à chaque requête
+# ---------------------------------------------------------------------------
+# deserialize_item parcourt tous les attributs et produit des Decimal que les handlers
+# reconvertissent aussitôt en float. Les décodeurs ci-dessous (paramètre decoder des
+# lectures) ne lisent que les attributs projetés et produisent directement les types
+# des réponses JSON.
+
+BALANCE_PROJECTION = ('balance_credit', 'balance_mobile_money', 'active_subs')
+
+
+def _response_value(attribute):
+    """AttributeValue -> valeur JSON (nombres en float)."""
+    if 'S' in attribute:
+        return attribute['S']
+    if 'N' in attribute:
+        return float(attribute['N'])
+    if 'BOOL' in attribute:
+        return attribute['BOOL']
+    if 'M' in attribute:
+        return {k: _response_value(v) for k, v in attribute['M'].items()}
+    if 'L' in attribute:
+        return [_response_value(v) for v in attribute['L']]
+    if 'NULL' in attribute:
+        return None
+    return deserialize_value(attribute)
+
+
+def decode_balance_projection(item):
+    """Projection METADATA : soldes en float, active_subs en dicts de chaînes (réponse de /checkBalance)."""
+    projection = {}
+    for name in ('balance_credit', 'balance_mobile_money'):
+        if name in item:
+            projection[name] = float(item[name]['N'])
+    if 'active_subs' in item:
+        # Les attributs des forfaits sont presque tous des chaînes : chemin direct, repli générique sinon
+        projection['active_subs'] = [
+            {k: v['S'] if 'S' in v else _response_value(v) for k, v in sub['M'].items()}
+            for sub in item['active_subs']['L']
+        ]
+    return projection
+
+
+def decode_catalog_plan(item):
+    """Forfait du catalogue ; price reste un Decimal exact (il sert au débit), duration_days un int."""
+    plan = {'PK': item['PK']['S'], 'SK': item['SK']['S']}
+    for name in ('name', 'description', 'Type'):
+        if name in item:
+            plan[name] = item[name]['S']
+    if 'price' in item:
+        plan['price'] = Decimal(item['price']['N'])
+    if 'duration_days' in item:
+        plan['duration_days'] = int(Decimal(item['duration_days']['N']))
+    return plan
+
+
+def _normalize(value):
+    """Normalise les nombres en Decimal, comme le fait la couche resource de boto3."""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return Decimal(str(value))
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    return value
+
+
+def _project(item, attributes):
+    if item is None or not attributes:
+        return item
+    return {a: item[a] for a in attributes if a in item}
+
+
+def _in_segment(pk, segment, total_segments):
+    # Répartition stable des partitions entre segments (équivalent local de Segment/TotalSegments)
+    return total_segments <= 1 or zlib.crc32(pk.encode('utf-8')) % total_segments == segment
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+class StorageBackend:
+    """Interface commune à tous les backends de stockage."""
+
+    name = 'abstract'
+
+    def get_item(self, table, key, attributes=None, decoder=None):
+        """Item (ou None) ; decoder(item au format typé) remplace deserialize_item (voir decode_*)."""
+        raise NotImplementedError
+
+    def batch_get(self, table, keys, attributes=None):
+        """Items existants parmi keys (ordre non garanti), PK et SK toujours inclus dans la projection."""
+        attributes = list(dict.fromkeys(['PK', 'SK'] + list(attributes))) if attributes else None
+        items = (self.get_item(table, key, attributes) for key in keys)
+        return [item for item in items if item is not None]
+
+    def query(self, table, pk, sk_prefix=None, decoder=None):
+        raise NotImplementedError
+
+    def scan(self, table, filters=None, decoder=None):
+        raise NotImplementedError
+
+    def scan_pages(self, table, filters=None, attributes=None, segment=0, total_segments=1, page_size=1000):
+        """Itère sur les items du segment par pages (listes) de page_size items au plus.
+
+        Les segments forment une partition de la table : total_segments lecteurs
+        parallèles (segment = 0 .. total_segments - 1) lisent chaque item une fois.
+        """
+        page = []
+        for item in self.scan(table, filters):
+            if _in_segment(item['PK'], segment, total_segments):
+                page.append(_project(item, attributes))
+                if len(page) >= page_size:
+                    yield page
+                    page = []
+        if page:
+            yield page
+
+    def transact_write(self, ops):
+        raise NotImplementedError
+
+    def put_item(self, table, item):
+        """Écriture simple (hors transaction), utilisée pour le chargement des données."""
+        self.transact_write([put_op(table, item)])
+
+
+class _LocalStorage(StorageBackend):
+    """Logique commune aux backends locaux : évaluation des conditions et des mises à jour."""
+
+    _change_listeners = ()
+    _notify_lock = None
+
+    def add_change_listener(self, listener):
+        """Enregistre listener(table, old_item, new_item), appelé après le commit pour chaque item écrit."""
+        if self._notify_lock is None:
+            # Réentrant : un listener peut lui-même écrire dans le stockage (voir transact_write)
+            self._notify_lock = threading.RLock()
+        self._change_listeners = list(self._change_listeners) + [listener]
+
+    @contextmanager
+    def _transaction(self):
+        raise NotImplementedError
+        yield
+
+    def _read(self, txn, table, key):
+        raise NotImplementedError
+
+    def _write(self, txn, table, item):
+        raise NotImplementedError
+
+    def _delete(self, txn, table, key):
+        raise NotImplementedError
+
+    @staticmethod
+    def _condition_holds(existing, op_kind, op):
+        condition = op['condition']
+        if op_kind == 'Delete':
+            return not (condition.get('exists') and existing is None)
+        if op_kind == 'Put':
+            return not (condition.get('absent') and existing is not None)
+        if condition.get('exists') and existing is None:
+            return False
+        for attr, minimum in condition.get('min', {}).items():
+            current = (existing or {}).get(attr)
+            if current is None or current < _normalize(minimum):
+                return False
+        for attr, maximum in condition.get('max', {}).items():
+            current = (existing or {}).get(attr)
+            if current is not None and current > _normalize(maximum):
+                return False
+        return True
+
+    @staticmethod
+    def _apply_update(existing, op):
+        item = copy.deepcopy(existing) if existing is not None else dict(op['key'])
+        for attr, value in op['set'].items():
+            item[attr] = _normalize(value)
+        for attr, delta in op['increment'].items():
+            item[attr] = item.get(attr, Decimal(0)) + _normalize(delta)
+        for attr, values in op['append'].items():
+            item[attr] = list(item.get(attr) or []) + _normalize(list(values))
+        return item
+
+    def transact_write(self, ops):
+        listeners = self._change_listeners
+        if not listeners:
+            self._commit(ops)
+            return
+        # Verrou de notification pris avant celui du stockage (toujours dans cet ordre) et gardé
+        # jusqu'à la fin des notifications : elles suivent l'ordre des écritures, et un listener
+        # peut lui-même écrire sans bloquer une transaction concurrente.
+        with self._notify_lock:
+            staged = self._commit(ops)
+            # Notifié après le commit (new_item None : suppression). Un listener en erreur
+            # n'annule pas la transaction déjà validée : l'erreur est journalisée.
+            for listener in listeners:
+                for table, old_item, new_item in staged:
+                    if old_item is not None or new_item is not None:
+                        try:
+                            listener(table, copy.deepcopy(old_item), copy.deepcopy(new_item))
+                        except Exception as e:
+                            print(f"Erreur du listener {getattr(listener, '__qualname__', listener)} "
+                                  f"sur {table} : {e}")
+
+    def _commit(self, ops):
+        """Applique les opérations dans une transaction ; retourne les (table, ancien, nouvel item)."""
+        with self._transaction() as txn:
+            staged = []
+            reasons = []
+            failed_items = {}
+            for index, op in enumerate(ops):
+                (op_kind, body), = op.items()
+                key = body['key'] if op_kind in ('Update', 'Delete') else {
+                    'PK': body['item']['PK'], 'SK': body['item']['SK']}
+                existing = self._read(txn, body['table'], key)
+                if self._condition_holds(existing, op_kind, body):
+                    reasons.append(None)
+                    if op_kind == 'Delete':
+                        staged.append((body['table'], existing, None))
+                    elif op_kind == 'Update':
+                        staged.append((body['table'], existing, self._apply_update(existing, body)))
+                    else:
+                        staged.append((body['table'], existing, _normalize(copy.deepcopy(body['item']))))
+                else:
+                    reasons.append(CONDITIONAL_CHECK_FAILED)
+                    failed_items[index] = copy.deepcopy(existing)
+            if any(reasons):
+                raise TransactionCancelled(reasons, items=failed_items)
+            for table, existing, item in staged:
+                if item is None:
+                    if existing is not None:
+                        self._delete(txn, table, {'PK': existing['PK'], 'SK': existing['SK']})
+                else:
+                    self._write(txn, table, item)
+        return staged
+
+
+class InMemoryStorage(_LocalStorage):
+    """Stockage en mémoire du processus (tests, benchmarks, démos locales)."""
+
+    name = 'memory'
+
+    def __init__(self):
+        # {table: {pk: {sk: item}}}
+        self._tables = {}
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            yield None
+
+    def _read(self, txn, table, key):
+        return self._tables.get(table, {}).get(key['PK'], {}).get(key['SK'])
+
+    def _write(self, txn, table, item):
+        self._tables.setdefault(table, {}).setdefault(item['PK'], {})[item['SK']] = item
+
+    def _delete(self, txn, table, key):
+        partition = self._tables.get(table, {}).get(key['PK'], {})
+        partition.pop(key['SK'], None)
+        if not partition:
+            self._tables.get(table, {}).pop(key['PK'], None)
+
+    @staticmethod
+    def _copy(item, decoder):
+        # Le décodeur reçoit le format typé, comme avec DynamoDB
+        return decoder(serialize_item(item)) if decoder else copy.deepcopy(item)
+
+    def get_item(self, table, key, attributes=None, decoder=None):
+        with self._lock:
+            item = _project(self._read(None, table, key), attributes)
+            return None if item is None else self._copy(item, decoder)
+
+    def query(self, table, pk, sk_prefix=None, decoder=None):
+        with self._lock:
+            partition = self._tables.get(table, {}).get(pk, {})
+            return [self._copy(partition[sk], decoder) for sk in sorted(partition)
+                    if sk_prefix is None or sk.startswith(sk_prefix)]
+
+    def scan(self, table, filters=None, decoder=None):
+        filters = filters or {}
+        with self._lock:
+            return [
+                self._copy(item, decoder)
+                for pk in self._tables.get(table, {}).values()
+                for item in pk.values()
+                if all(item.get(a) == v for a, v in filters.items())
+            ]
+
+
+class SQLiteStorage(_LocalStorage):
+    """Stockage SQLite en mode WAL pour les déploiements mono-nœud.
+
+    Chaque item est stocké en JSON au format typé DynamoDB pour conserver les Decimal.
+    Une connexion par thread ; les transactions utilisent BEGIN IMMEDIATE.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path='telco.db'):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            ' tbl TEXT NOT NULL, pk TEXT NOT NULL, sk TEXT NOT NULL, doc TEXT NOT NULL,'
+            ' PRIMARY KEY (tbl, pk, sk)) WITHOUT ROWID'
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _encode(item):
+        return json_codec.dumps(serialize_item(item))
+
+    @staticmethod
+    def _decode(doc, decoder=None):
+        return (decoder or deserialize_item)(json_codec.loads(doc))
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def transact_write(self, ops):
+        try:
+            super().transact_write(ops)
+        except sqlite3.OperationalError as e:
+            # Verrou d'écriture non obtenu dans le délai : équivalent local d'un TransactionConflict
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            raise TransactionCancelled([TRANSACTION_CONFLICT] * len(ops), str(e)) from e
+
+    def _read(self, txn, table, key):
+        row = txn.execute(
+            'SELECT doc FROM items WHERE tbl = ? AND pk = ? AND sk = ?',
+            (table, key['PK'], key['SK'])
+        ).fetchone()
+        return self._decode(row[0]) if row else None
+
+    def _write(self, txn, table, item):
+        txn.execute(
+            'INSERT OR REPLACE INTO items (tbl, pk, sk, doc) VALUES (?, ?, ?, ?)',
+            (table, item['PK'], item['SK'], self._encode(item))
+        )
+
+    def _delete(self, txn, table, key):
+        txn.execute('DELETE FROM items WHERE tbl = ? AND pk = ? AND sk = ?', (table, key['PK'], key['SK']))
+
+    def get_item(self, table, key, attributes=None, decoder=None):
+        if decoder is None:
+            return _project(self._read(self._connection(), table, key), attributes)
+        row = self._connection().execute(
+            'SELECT doc FROM items WHERE tbl = ? AND pk = ? AND sk = ?', (table, key['PK'], key['SK'])
+        ).fetchone()
+        return decoder(_project(json_codec.loads(row[0]), attributes)) if row else None
+
+    def query(self, table, pk, sk_prefix=None, decoder=None):
+        if sk_prefix is None:
+            rows = self._connection().execute(
+                'SELECT doc FROM items WHERE tbl = ? AND pk = ? ORDER BY sk', (table, pk)
+            ).fetchall()
+        else:
+            # Borne de plage plutôt que LIKE : la clé primaire (tbl, pk, sk) sert d'index
+            rows = self._connection().execute(
+                'SELECT doc FROM items WHERE tbl = ? AND pk = ? AND sk >= ? AND sk < ? ORDER BY sk',
+                (table, pk, sk_prefix, sk_prefix + '\uffff')
+            ).fetchall()
+        return [self._decode(row[0], decoder) for row in rows]
+
+    def scan(self, table, filters=None, decoder=None):
+        filters = filters or {}
+        rows = self._connection().execute('SELECT doc FROM items WHERE tbl = ?', (table,)).fetchall()
+        if decoder is None:
+            items = (self._decode(row[0]) for row in rows)
+            return [item for item in items if all(item.get(a) == v for a, v in filters.items())]
+        # Filtre appliqué au format typé : seuls les items retenus sont décodés
+        typed_filters = {a: serialize_value(v) for a, v in filters.items()}
+        raws = (json_codec.loads(row[0]) for row in rows)
+        return [decoder(raw) for raw in raws if all(raw.get(a) == v for a, v in typed_filters.items())]
+
+    def scan_pages(self, table, filters=None, attributes=None, segment=0, total_segments=1, page_size=1000):
+        # Curseur lu par blocs : la mémoire reste bornée à une page, quelle que soit la taille de la table
+        filters = filters or {}
+        cursor = self._connection().execute('SELECT pk, doc FROM items WHERE tbl = ?', (table,))
+        while True:
+            rows = cursor.fetchmany(page_size)
+            if not rows:
+                return
+            items = (self._decode(doc) for pk, doc in rows if _in_segment(pk, segment, total_segments))
+            page = [_project(item, attributes) for item in items
+                    if all(item.get(a) == v for a, v in filters.items())]
+            if page:
+                yield page
+
+
+class DynamoDBStorage(StorageBackend):
+    """Backend DynamoDB basé sur le client bas niveau de boto3 (partageable entre threads)."""
+
+    name = 'dynamodb'
+
+    def __init__(self, client=None, endpoint_url=None):
+        if client is None:
+            import boto3
+            client = boto3.client('dynamodb', endpoint_url=endpoint_url) if endpoint_url else boto3.client('dynamodb')
+        # Capacité consommée, items et latence de chaque appel, par handler (voir capacity_metrics.py)
+        from capacity_metrics import instrument_client
+        self.client = instrument_client(client)
+
+    @staticmethod
+    def _names(attributes, prefix):
+        return {f'#{prefix}{i}': attr for i, attr in enumerate(attributes)}
+
+    def get_item(self, table, key, attributes=None, decoder=None):
+        params = {'TableName': table, 'Key': serialize_item(key), 'ConsistentRead': True}
+        if attributes:
+            names = self._names(attributes, 'p')
+            params['ProjectionExpression'] = ', '.join(names)
+            params['ExpressionAttributeNames'] = names
+        item = self.client.get_item(**params).get('Item')
+        return (decoder or deserialize_item)(item) if item else None
+
+    # Limites de BatchGetItem : 100 clés par appel ; les clés non traitées (throttling) sont relues
+    BATCH_GET_MAX_KEYS = 100
+    BATCH_GET_MAX_RETRIES = 8
+
+    def batch_get(self, table, keys, attributes=None):
+        items = []
+        for start in range(0, len(keys), self.BATCH_GET_MAX_KEYS):
+            request = {'Keys': [serialize_item(key) for key in keys[start:start + self.BATCH_GET_MAX_KEYS]],
+                       'ConsistentRead': True}
+            if attributes:
+                names = self._names(list(dict.fromkeys(['PK', 'SK'] + list(attributes))), 'p')
+                request['ProjectionExpression'] = ', '.join(names)
+                request['ExpressionAttributeNames'] = names
+            pending = {table: request}
+            for attempt in range(self.BATCH_GET_MAX_RETRIES + 1):
+                response = self.client.batch_get_item(RequestItems=pending)
+                items.extend(deserialize_item(item) for item in response.get('Responses', {}).get(table, []))
+                pending = response.get('UnprocessedKeys') or {}
+                if not pending:
+                    break
+                if attempt == self.BATCH_GET_MAX_RETRIES:
+                    raise RuntimeError(f"BatchGetItem : {len(pending[table]['Keys'])} clés non traitées après "
+                                       f"{self.BATCH_GET_MAX_RETRIES} tentatives")
+                time.sleep(min(1.0, 0.05 * 2 ** attempt))
+        return items
+
+    def _paginate(self, operation, params, decoder=None):
+        decoder = decoder or deserialize_item
+        items = []
+        while True:
+            response = operation(**params)
+            items.extend(decoder(item) for item in response.get('Items', []))
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                return items
+            params['ExclusiveStartKey'] = last_key
+
+    def query(self, table, pk, sk_prefix=None, decoder=None):
+        params = {
+            'TableName': table,
+            'KeyConditionExpression': '#pk = :pk',
+            'ExpressionAttributeNames': {'#pk': 'PK'},
+            'ExpressionAttributeValues': {':pk': {'S': pk}},
+        }
+        if sk_prefix is not None:
+            params['KeyConditionExpression'] += ' AND begins_with(#sk, :sk)'
+            params['ExpressionAttributeNames']['#sk'] = 'SK'
+            params['ExpressionAttributeValues'][':sk'] = {'S': sk_prefix}
+        return self._paginate(self.client.query, params, decoder)
+
+    def scan(self, table, filters=None, decoder=None):
+        params = {'TableName': table}
+        if filters:
+            names = self._names(filters, 'f')
+            params['FilterExpression'] = ' AND '.join(f'{n} = :{n[1:]}' for n in names)
+            params['ExpressionAttributeNames'] = names
+            params['ExpressionAttributeValues'] = {
+                f':{n[1:]}': serialize_value(filters[attr]) for n, attr in names.items()}
+        return self._paginate(self.client.scan, params, decoder)
+
+    def scan_pages(self, table, filters=None, attributes=None, segment=0, total_segments=1, page_size=1000):
+        # Scan parallèle natif (Segment/TotalSegments) ; la projection réduit les octets transférés,
+        # pas la capacité lue (facturée sur la taille des items avant filtre et projection)
+        params = {'TableName': table, 'Limit': page_size}
+        if total_segments > 1:
+            params.update(Segment=segment, TotalSegments=total_segments)
+        names, values = {}, {}
+        if filters:
+            filter_names = self._names(filters, 'f')
+            params['FilterExpression'] = ' AND '.join(f'{n} = :{n[1:]}' for n in filter_names)
+            names.update(filter_names)
+            values.update({f':{n[1:]}': serialize_value(filters[attr]) for n, attr in filter_names.items()})
+        if attributes:
+            projection = self._names(attributes, 'p')
+            params['ProjectionExpression'] = ', '.join(projection)
+            names.update(projection)
+        if names:
+            params['ExpressionAttributeNames'] = names
+        if values:
+            params['ExpressionAttributeValues'] = values
+        while True:
+            response = self.client.scan(**params)
+            items = response.get('Items', [])
+            if items:
+                yield [deserialize_item(item) for item in items]
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                return
+            params['ExclusiveStartKey'] = last_key
+
+    @staticmethod
+    def _build_update(body):
+        names, values, set_parts, add_parts, conditions = {}, {}, [], [], []
+        for i, (attr, value) in enumerate(body['set'].items()):
+            names[f'#s{i}'] = attr
+            values[f':s{i}'] = serialize_value(value)
+            set_parts.append(f'#s{i} = :s{i}')
+        for i, (attr, values_to_append) in enumerate(body['append'].items()):
+            names[f'#a{i}'] = attr
+            values[f':a{i}'] = serialize_value(list(values_to_append))
+            values[':empty_list'] = {'L': []}
+            set_parts.append(f'#a{i} = list_append(if_not_exists(#a{i}, :empty_list), :a{i})')
+        for i, (attr, delta) in enumerate(body['increment'].items()):
+            names[f'#i{i}'] = attr
+            values[f':i{i}'] = serialize_value(delta)
+            add_parts.append(f'#i{i} :i{i}')
+        condition = body['condition']
+        if condition.get('exists'):
+            conditions.append('attribute_exists(PK)')
+        for i, (attr, minimum) in enumerate(condition.get('min', {}).items()):
+            names[f'#m{i}'] = attr
+            values[f':m{i}'] = serialize_value(minimum)
+            conditions.append(f'#m{i} >= :m{i}')
+        for i, (attr, maximum) in enumerate(condition.get('max', {}).items()):
+            names[f'#x{i}'] = attr
+            values[f':x{i}'] = serialize_value(maximum)
+            conditions.append(f'(attribute_not_exists(#x{i}) OR #x{i} <= :x{i})')
+        expression = []
+        if set_parts:
+            expression.append('SET ' + ', '.join(set_parts))
+        if add_parts:
+            expression.append('ADD ' + ', '.join(add_parts))
+        update = {
+            'TableName': body['table'],
+            'Key': serialize_item(body['key']),
+            'UpdateExpression': ' '.join(expression),
+        }
+        if names:
+            update['ExpressionAttributeNames'] = names
+        if values:
+            update['ExpressionAttributeValues'] = values
+        if conditions:
+            update['ConditionExpression'] = ' AND '.join(conditions)
+            # L'item est renvoyé dans CancellationReasons : distingue compte absent et solde insuffisant
+            update['ReturnValuesOnConditionCheckFailure'] = 'ALL_OLD'
+        return {'Update': update}
+
+    @staticmethod
+    def _build_put(body):
+        put = {'TableName': body['table'], 'Item': serialize_item(body['item'])}
+        if body['condition'].get('absent'):
+            put['ConditionExpression'] = 'attribute_not_exists(PK)'
+            put['ReturnValuesOnConditionCheckFailure'] = 'ALL_OLD'
+        return {'Put': put}
+
+    @staticmethod
+    def _build_delete(body):
+        delete = {'TableName': body['table'], 'Key': serialize_item(body['key'])}
+        if body['condition'].get('exists'):
+            delete['ConditionExpression'] = 'attribute_exists(PK)'
+        return {'Delete': delete}
+
+    def transact_write(self, ops):
+        builders = {'Update': self._build_update, 'Put': self._build_put, 'Delete': self._build_delete}
+        transact_items = []
+        for op in ops:
+            (op_kind, body), = op.items()
+            transact_items.append(builders[op_kind](body))
+        try:
+            self.client.transact_write_items(TransactItems=transact_items)
+        except self.client.exceptions.TransactionCanceledException as e:
+            reasons = []
+            items = {}
+            for index, reason in enumerate(e.response.get('CancellationReasons', [])):
+                code = reason.get('Code')
+                reasons.append(None if code in (None, 'None') else code)
+                if code == CONDITIONAL_CHECK_FAILED:
+                    items[index] = deserialize_item(reason['Item']) if reason.get('Item') else None
+            raise TransactionCancelled(reasons, str(e), items) from e
+        except self.client.exceptions.ClientError as e:
+            # Throttling après épuisement des retries du SDK, ou transaction idempotente encore en cours
+            code = e.response.get('Error', {}).get('Code')
+            if code in THROTTLING_CODES:
+                raise TransactionCancelled([THROTTLING_ERROR] * len(ops), str(e)) from e
+            if code == 'TransactionInProgressException':
+                raise TransactionCancelled([TRANSACTION_CONFLICT] * len(ops), str(e)) from e
+            raise
+
+
+class LocalStream:
+    """Substitut local de DynamoDB Streams (vue NEW_AND_OLD_IMAGES) pour un backend local.
+
+    Les enregistrements ont la forme de ceux reçus par une Lambda branchée sur le flux,
+    si bien que le même consommateur tourne en local et en production :
+
+        stream = LocalStream(storage, 'TelcoData')
+        ...écritures...
+        for batch in stream.batches(100):
+            consumer.lambda_handler(batch, None)
+    """
+
+    def __init__(self, storage, table):
+        self.table = table
+        self._records = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+        storage.add_change_listener(self._on_change)
+
+    def _on_change(self, table, old_item, new_item):
+        if table != self.table:
+            return
+        item = new_item if new_item is not None else old_item
+        with self._lock:
+            self._sequence += 1
+            dynamodb = {
+                'ApproximateCreationDateTime': time.time(),
+                'Keys': serialize_item({'PK': item['PK'], 'SK': item['SK']}),
+                'SequenceNumber': f'{self._sequence:021d}',
+                'StreamViewType': 'NEW_AND_OLD_IMAGES',
+            }
+            if new_item is not None:
+                dynamodb['NewImage'] = serialize_item(new_item)
+            if old_item is not None:
+                dynamodb['OldImage'] = serialize_item(old_item)
+            self._records.append({
+                'eventID': f'local-{self._sequence}',
+                'eventName': 'REMOVE' if new_item is None else ('INSERT' if old_item is None else 'MODIFY'),
+                'eventSource': 'aws:dynamodb',
+                'dynamodb': dynamodb,
+            })
+
+    def pending(self):
+        with self._lock:
+            return len(self._records)
+
+    def read_batch(self, max_records=100):
+        """Retire et retourne jusqu'à max_records enregistrements sous forme d'événement Lambda."""
+        with self._lock:
+            batch, self._records = self._records[:max_records], self._records[max_records:]
+        return {'Records': batch}
+
+    def batches(self, max_records=100):
+        """Itère sur les lots jusqu'à épuisement (y compris les écritures faites entre deux lots)."""
+        while True:
+            batch = self.read_batch(max_records)
+            if not batch['Records']:
+                return
+            yield batch
+
+
+def create_storage(kind=None):
+    """Instancie le backend demandé (par défaut : variable STORAGE_BACKEND, sinon dynamodb)."""
+    kind = (kind or os.environ.get('STORAGE_BACKEND', 'dynamodb')).lower()
+    if kind == 'memory':
+        return InMemoryStorage()
+    if kind == 'sqlite':
+        return SQLiteStorage(os.environ.get('SQLITE_PATH', 'telco.db'))
+    if kind == 'dynamodb':
+        return DynamoDBStorage(endpoint_url=os.environ.get('DYNAMODB_ENDPOINT_URL'))
+    raise ValueError(f"Backend de stockage inconnu : {kind}")
+
+
+# ---------------------------------------------------------------------------
+# Chargement des fichiers d'exemple de database/
+# ---------------------------------------------------------------------------
+
+NUMERIC_ATTRIBUTES = {'amount', 'balance_credit', 'balance_mobile_money', 'price', 'duration_days'}
+
+
+def _parse_csv_value(attr, raw):
+    # Les exports de la console préfixent parfois les valeurs d'une apostrophe
+    raw = raw[1:] if raw.startswith("'") else raw
+    if attr in NUMERIC_ATTRIBUTES:
+        return Decimal(raw)
+    if raw.startswith('[') or raw.startswith('{'):
+        parsed = json_codec.loads(raw)
+        if isinstance(parsed, list):
+            return [deserialize_value(v) for v in parsed]
+        return deserialize_value(parsed)
+    return raw
+
+
+def read_seed_csv(path):
+    """Itère sur les items d'un fichier CSV de database/ (export DynamoDB), sans tout charger en mémoire."""
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield {attr: _parse_csv_value(attr, raw) for attr, raw in row.items() if raw != ''}
+
+
+def load_seed_csv(storage, table, path):
+    """Charge un fichier CSV de database/ (export DynamoDB) dans le backend ; retourne le nombre d'items."""
+    count = 0
+    for item in read_seed_csv(path):
+        storage.put_item(table, item)
+        count += 1
+    return count
@@ -0,0 +1,290 @@
+"""Archivage des transactions anciennes vers un stockage froid compressé.
+
+Les items TRANS# s'accumulent sans fin sous chaque partition USER# : les
+partitions des gros utilisateurs grossissent, et l'historique comme les exports
+coûtent de plus en plus cher. Le job d'archivage déplace les transactions plus
+anciennes que ARCHIVE_AFTER_DAYS jours vers des fichiers compressés, rangés par mois :
+
+  transactions/{AAAA-MM}/{run_id}-{n}.jsonl.gz
+      Une ligne JSON par transaction, au format d'export DynamoDB ({"Item": ...}) :
+      tools/transaction_report.py --export lit ces fichiers tels quels.
+      Chaque utilisateur forme un membre gzip distinct du fichier.
+  index/{téléphone}/{AAAA-MM}.json
+      Segments de l'utilisateur pour ce mois : fichier, position et longueur du
+      membre gzip, nombre de transactions, première et dernière SK. L'historique
+      lit uniquement ces octets (lecture par plage), jamais le fichier entier.
+
+Ordre des écritures : fichier de données, puis index, puis suppression des items
+chauds. Un job interrompu laisse au pire des transactions à la fois chaudes et
+archivées ; transaction_history() les dédoublonne par SK (l'item chaud l'emporte),
+et relancer le job est sans risque.
+
+Le stockage objet est enfichable (ARCHIVE_STORE, voir common/object_store.py) :
+  * local : répertoire ARCHIVE_ROOT (défaut, et tests)
+  * s3    : bucket ARCHIVE_BUCKET (boto3, préfixe ARCHIVE_PREFIX)
+
+En local :
+    python transaction_archive.py --seed ../database --cutoff 2025-11-19T00:00:00
+"""
+import argparse
+import gzip
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from capacity_metrics import capacity_scope
+from error_codes import backoff_delay
+from handler_profiler import profile_handler
+import json_codec
+from metrics import emit_metrics
+from object_store import LocalObjectStore, S3ObjectStore
+from shared_resources import DYNAMO_TABLE_DATA, storage
+from storage import TransactionCancelled, delete_op, deserialize_item, serialize_item
+
+ARCHIVE_STORE = os.environ.get('ARCHIVE_STORE', 'local')
+ARCHIVE_ROOT = os.environ.get('ARCHIVE_ROOT', 'archive')
+ARCHIVE_BUCKET = os.environ.get('ARCHIVE_BUCKET', '')
+ARCHIVE_PREFIX = os.environ.get('ARCHIVE_PREFIX', '')
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '180'))
+# Transactions gardées en mémoire avant écriture d'un lot de fichiers
+ARCHIVE_BUFFER_ITEMS = int(os.environ.get('ARCHIVE_BUFFER_ITEMS', '50000'))
+# Suppressions par transaction (TransactWriteItems accepte 100 opérations)
+ARCHIVE_DELETE_BATCH = int(os.environ.get('ARCHIVE_DELETE_BATCH', '25'))
+ARCHIVE_MAX_ATTEMPTS = int(os.environ.get('ARCHIVE_MAX_ATTEMPTS', '5'))
+ARCHIVE_SAFETY_MARGIN_MS = int(os.environ.get('ARCHIVE_SAFETY_MARGIN_MS', '30000'))
+
+TRANSACTION_PREFIX = 'TRANS#'
+
+
+# ---------------------------------------------------------------------------
+# Stockage objet
+# ---------------------------------------------------------------------------
+
+def create_object_store(kind=None):
+    """Instancie le stockage objet demandé (par défaut : variable ARCHIVE_STORE)."""
+    kind = (kind or ARCHIVE_STORE).lower()
+    if kind == 'local':
+        return LocalObjectStore(ARCHIVE_ROOT)
+    if kind == 's3':
+        return S3ObjectStore(ARCHIVE_BUCKET, ARCHIVE_PREFIX)
+    raise ValueError(f"Stockage d'archives inconnu : {kind}")
+
+
+# ---------------------------------------------------------------------------
+# Format des archives
+# ---------------------------------------------------------------------------
+
+def _phone(pk):
+    return pk.split('#', 1)[1]
+
+
+def _month(sk):
+    """Mois (AAAA-MM) d'une SK TRANS#{horodatage ISO}."""
+    return sk[len(TRANSACTION_PREFIX):len(TRANSACTION_PREFIX) + 7]
+
+
+def _index_key(phone_number, month):
+    return f'index/{phone_number}/{month}.json'
+
+
+def encode_segment(items):
+    """Membre gzip des transactions d'un utilisateur (lignes JSON, triées par SK)."""
+    lines = ''.join(json_codec.dumps({'Item': serialize_item(item)}) + '\n' for item in items)
+    return gzip.compress(lines.encode('utf-8'))
+
+
+def decode_segment(data):
+    return [deserialize_item(json_codec.loads(line)['Item']) for line in gzip.decompress(data).decode('utf-8').splitlines()
+            if line]
+
+
+def read_index(store, phone_number, month):
+    data = store.get(_index_key(phone_number, month))
+    return json_codec.loads(data)['segments'] if data else []
+
+
+def write_month(store, month, name, users):
+    """Écrit le fichier d'un mois (users : {téléphone: [items]}) puis met à jour les index.
+
+    Retourne le nombre de transactions écrites.
+    """
+    key = f'transactions/{month}/{name}.jsonl.gz'
+    chunks, segments, offset = [], {}, 0
+    for phone_number, items in sorted(users.items()):
+        items.sort(key=lambda item: item['SK'])
+        chunk = encode_segment(items)
+        segments[phone_number] = {'key': key, 'offset': offset, 'length': len(chunk), 'count': len(items),
+                                  'first_sk': items[0]['SK'], 'last_sk': items[-1]['SK']}
+        chunks.append(chunk)
+        offset += len(chunk)
+    # Les membres gzip concaténés forment un fichier gzip valide
+    store.put(key, b''.join(chunks))
+    for phone_number, segment in segments.items():
+        entries = [s for s in read_index(store, phone_number, month)
+                   if (s['key'], s['offset']) != (key, segment['offset'])]
+        entries.append(segment)
+        store.put(_index_key(phone_number, month),
+                  json_codec.dumps_bytes({'segments': entries}))
+    return sum(s['count'] for s in segments.values())
+
+
+# ---------------------------------------------------------------------------
+# Job d'archivage
+# ---------------------------------------------------------------------------
+
+def delete_hot_items(keys):
+    """Supprime les items archivés par transactions de ARCHIVE_DELETE_BATCH ; retourne le nombre d'échecs."""
+    failed = 0
+    for start in range(0, len(keys), ARCHIVE_DELETE_BATCH):
+        batch = keys[start:start + ARCHIVE_DELETE_BATCH]
+        for attempt in range(1, ARCHIVE_MAX_ATTEMPTS + 1):
+            try:
+                storage.transact_write([delete_op(DYNAMO_TABLE_DATA, key) for key in batch])
+                break
+            except TransactionCancelled as e:
+                if not (e.conflict or e.throttled) or attempt == ARCHIVE_MAX_ATTEMPTS:
+                    # Les items restent chauds et archivés : un prochain run les supprimera
+                    print(f"Suppression de {len(batch)} transactions archivées impossible: {e}")
+                    failed += len(batch)
+                    break
+                time.sleep(backoff_delay(attempt))
+    return failed
+
+
+def run_archive(cutoff=None, store=None, run_id=None, remaining_ms=lambda: float('inf'), dry_run=False):
+    """Archive les transactions dont la SK précède TRANS#{cutoff} ; retourne le rapport du run."""
+    store = store or create_object_store()
+    cutoff = cutoff or datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    cutoff_sk = f'{TRANSACTION_PREFIX}{cutoff.isoformat()}'
+    run_id = run_id or datetime.utcnow().strftime('%Y%m%dT%H%M%S') + '-' + uuid.uuid4().hex[:6]
+    started = time.monotonic()
+    report = {'run_id': run_id, 'cutoff': cutoff.isoformat(), 'scanned': 0, 'archived': 0,
+              'delete_failures': 0, 'files': 0, 'complete': True}
+    buffer, buffered, sequence = {}, 0, 0
+
+    def flush():
+        nonlocal buffer, buffered, sequence
+        if not buffered:
+            return
+        keys = []
+        for month, users in sorted(buffer.items()):
+            if not dry_run:
+                write_month(store, month, f'{run_id}-{sequence:05d}', users)
+            report['files'] += 1
+            keys.extend({'PK': item['PK'], 'SK': item['SK']} for items in users.values() for item in items)
+        report['archived'] += len(keys)
+        if not dry_run:
+            # Les items chauds ne sont supprimés qu'une fois le fichier et les index écrits
+            report['delete_failures'] += delete_hot_items(keys)
+        buffer, buffered, sequence = {}, 0, sequence + 1
+
+    for page in storage.scan_pages(DYNAMO_TABLE_DATA, filters={'Type': 'TRANSACTION'}):
+        for item in page:
+            report['scanned'] += 1
+            sk = item.get('SK', '')
+            if not sk.startswith(TRANSACTION_PREFIX) or sk >= cutoff_sk:
+                continue
+            buffer.setdefault(_month(sk), {}).setdefault(_phone(item['PK']), []).append(item)
+            buffered += 1
+        if buffered >= ARCHIVE_BUFFER_ITEMS:
+            flush()
+            if remaining_ms() < ARCHIVE_SAFETY_MARGIN_MS:
+                # Le reste sera archivé par le prochain run planifié
+                report['complete'] = False
+                break
+    else:
+        flush()
+
+    report['duration_seconds'] = round(time.monotonic() - started, 3)
+    if not dry_run:
+        emit_metrics(
+            {'TransactionsArchived': report['archived'],
+             'ArchiveDeleteFailures': report['delete_failures'],
+             'ArchiveRunSeconds': (report['duration_seconds'], 'Seconds')},
+            dimensions={'Service': 'TransactionArchive'},
+            properties={'runId': run_id, 'complete': report['complete']},
+        )
+    return report
+
+
+# ---------------------------------------------------------------------------
+# Historique : transactions chaudes et archivées
+# ---------------------------------------------------------------------------
+
+def _archived_months(store, phone_number):
+    prefix = f'index/{phone_number}/'
+    return [key[len(prefix):-len('.json')] for key in store.list(prefix) if key.endswith('.json')]
+
+
+def transaction_history(phone_number, since=None, until=None, limit=50, store=None):
+    """Transactions de l'utilisateur (plus récentes d'abord), chaudes et archivées confondues.
+
+    since et until sont des horodatages ISO (bornes incluses). Les mois archivés sont
+    lus du plus récent au plus ancien et la lecture s'arrête dès que limit est atteint ;
+    seuls les segments qui recoupent l'intervalle sont lus, par plage d'octets.
+    """
+    store = store or create_object_store()
+    low = f'{TRANSACTION_PREFIX}{since}' if since else TRANSACTION_PREFIX
+    high = f'{TRANSACTION_PREFIX}{until}\uffff' if until else f'{TRANSACTION_PREFIX}\uffff'
+
+    def in_range(sk):
+        return low <= sk <= high
+
+    records = {item['SK']: item
+               for item in storage.query(DYNAMO_TABLE_DATA, f'USER#{phone_number}', sk_prefix=TRANSACTION_PREFIX)
+               if in_range(item['SK'])}
+    for month in sorted(_archived_months(store, phone_number), reverse=True):
+        if limit and records and len(records) >= limit and min(records) > f'{TRANSACTION_PREFIX}{month}\uffff':
+            break
+        if f'{TRANSACTION_PREFIX}{month}' > high or f'{TRANSACTION_PREFIX}{month}\uffff' < low:
+            continue
+        for segment in read_index(store, phone_number, month):
+            if segment['last_sk'] < low or segment['first_sk'] > high:
+                continue
+            data = store.get(segment['key'], (segment['offset'], segment['offset'] + segment['length']))
+            if data is None:
+                print(f"Segment d'archive manquant : {segment['key']}@{segment['offset']}")
+                continue
+            for item in decode_segment(data):
+                # Un item encore chaud (suppression interrompue) l'emporte sur sa copie archivée
+                if in_range(item['SK']):
+                    records.setdefault(item['SK'], item)
+    history = [records[sk] for sk in sorted(records, reverse=True)]
+    return history[:limit] if limit else history
+
+
+@capacity_scope('transactionArchive')
+@profile_handler('transactionArchive')
+def lambda_handler(event, context):
+    """Point d'entrée planifié ; l'événement peut fixer run_id, cutoff (ISO), dry_run."""
+    event = event or {}
+    remaining = (context.get_remaining_time_in_millis if context is not None and
+                 hasattr(context, 'get_remaining_time_in_millis') else lambda: float('inf'))
+    return run_archive(
+        cutoff=datetime.fromisoformat(event['cutoff']) if event.get('cutoff') else None,
+        run_id=event.get('run_id'),
+        remaining_ms=remaining,
+        dry_run=bool(event.get('dry_run', False)),
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archivage des transactions anciennes')
+    parser.add_argument('--seed', metavar='DIR', help='charge TelcoData.csv (stockage local)')
+    parser.add_argument('--cutoff', help=f'date ISO limite (défaut : il y a {ARCHIVE_AFTER_DAYS} jours)')
+    parser.add_argument('--run-id')
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--history', metavar='PHONE', help="affiche ensuite l'historique de ce numéro")
+    args = parser.parse_args()
+
+    if args.seed:
+        from storage import load_seed_csv
+        load_seed_csv(storage, DYNAMO_TABLE_DATA, os.path.join(args.seed, 'TelcoData.csv'))
+    result = run_archive(cutoff=datetime.fromisoformat(args.cutoff) if args.cutoff else None,
+                         run_id=args.run_id, dry_run=args.dry_run)
+    for key, value in result.items():
+        print(f'{key:>20}: {value}')
+    if args.history:
+        for item in transaction_history(args.history, limit=0):
+            print(f"{item['SK']:<45} {item.get('amount', ''):>10}  {item.get('details', '')}")
@@ -0,0 +1,107 @@
+"""Limites de vélocité des transferts Mobile Money, par émetteur.
+
+Pour chaque fenêtre (minute, jour), un compteur par émetteur et par tranche de temps
+(PK=USER#{phone}, SK=VELOCITY#{fenêtre}#{numéro de tranche}) cumule le nombre et le
+montant des transferts. Le compteur est incrémenté dans la transaction du transfert,
+sous condition de ne pas dépasser le plafond : la vérification ne coûte aucune lecture
+supplémentaire, et deux transferts concurrents ne peuvent pas dépasser la limite ensemble.
+
+Une seule grille de tranches alignées sur l'horloge laisserait passer deux fois le
+plafond en quelques secondes, de part et d'autre d'une frontière. Chaque fenêtre a donc
+`phases` grilles décalées d'une fraction de fenêtre (SK=VELOCITY#{fenêtre}#P{phase}#{tranche}
+pour les grilles décalées), et le transfert incrémente sous condition une tranche de
+chacune. Deux plafonds complets sont alors séparés d'au moins (1 - 1/phases) fenêtre :
+18 heures pour le jour avec 4 phases, au lieu de quelques secondes. C'est une
+approximation de fenêtre glissante sans lecture préalable ; chaque phase ajoute une
+écriture à la transaction. Les compteurs expirent via le TTL de la table (expires_at).
+
+Configuration (0 désactive une limite) :
+  VELOCITY_MAX_TRANSFERS_PER_MINUTE, VELOCITY_MAX_AMOUNT_PER_MINUTE, VELOCITY_MINUTE_PHASES
+  VELOCITY_MAX_TRANSFERS_PER_DAY,    VELOCITY_MAX_AMOUNT_PER_DAY,    VELOCITY_DAY_PHASES
+"""
+import os
+from collections import namedtuple
+from decimal import Decimal
+
+from storage import CONDITIONAL_CHECK_FAILED, update_op
+
+DYNAMO_TABLE_DATA = os.environ.get('DYNAMO_TABLE_DATA_NAME', 'TelcoData')
+
+# phase : grille d'une vérification (0 = alignée sur l'horloge), fixée par velocity_ops
+Window = namedtuple('Window', ['name', 'label', 'seconds', 'max_count', 'max_amount', 'phases', 'phase'],
+                    defaults=(1, 0))
+
+WINDOWS = [
+    Window('MINUTE', 'par minute', 60,
+           int(os.environ.get('VELOCITY_MAX_TRANSFERS_PER_MINUTE', '5')),
+           Decimal(os.environ.get('VELOCITY_MAX_AMOUNT_PER_MINUTE', '100000')),
+           int(os.environ.get('VELOCITY_MINUTE_PHASES', '1'))),
+    Window('DAY', 'par jour', 86400,
+           int(os.environ.get('VELOCITY_MAX_TRANSFERS_PER_DAY', '50')),
+           Decimal(os.environ.get('VELOCITY_MAX_AMOUNT_PER_DAY', '1000000')),
+           int(os.environ.get('VELOCITY_DAY_PHASES', '4'))),
+]
+
+
+def oversized_window(amount, windows=None):
+    """Fenêtre dont le plafond de montant est dépassé par ce seul transfert, ou None."""
+    for window in WINDOWS if windows is None else windows:
+        if window.max_amount and amount > window.max_amount:
+            return window
+    return None
+
+
+def _offset(window):
+    """Décalage en secondes de la grille de tranches de window.phase."""
+    return window.seconds * window.phase // max(1, window.phases)
+
+
+def _bucket(window, now_ts):
+    return int((now_ts - _offset(window)) // window.seconds)
+
+
+def velocity_ops(phone_number, amount, now_ts, windows=None):
+    """Opérations d'incrément conditionnel des compteurs, sous forme de paires (fenêtre, opération).
+
+    Une paire par phase de chaque fenêtre ; la fenêtre de la paire porte sa phase.
+    """
+    checks = []
+    for window in WINDOWS if windows is None else windows:
+        if not window.max_count and not window.max_amount:
+            continue
+        require_max = {}
+        if window.max_count:
+            require_max['transfer_count'] = window.max_count - 1
+        if window.max_amount:
+            require_max['transfer_amount'] = window.max_amount - amount
+        for phase in range(max(1, window.phases)):
+            check = window._replace(phase=phase)
+            bucket = _bucket(check, now_ts)
+            # La grille alignée garde les clés d'origine
+            sk = f'VELOCITY#{window.name}#{bucket}' if phase == 0 else f'VELOCITY#{window.name}#P{phase}#{bucket}'
+            checks.append((check, update_op(
+                DYNAMO_TABLE_DATA,
+                {'PK': f'USER#{phone_number}', 'SK': sk},
+                set={'Type': 'VELOCITY_COUNTER', 'expires_at': (bucket + 2) * window.seconds + _offset(check)},
+                increment={'transfer_count': 1, 'transfer_amount': amount},
+                require_max=require_max
+            )))
+    return checks
+
+
+def exceeded_window(reasons, offset, checks, now_ts):
+    """Première fenêtre dont une condition a échoué ; offset est l'index de la première opération de checks.
+
+    Parmi les phases refusées de cette fenêtre, retourne celle dont la tranche se termine le plus tard.
+    """
+    failed = [window for index, (window, _) in enumerate(checks)
+              if offset + index < len(reasons) and reasons[offset + index] == CONDITIONAL_CHECK_FAILED]
+    if not failed:
+        return None
+    return max((window for window in failed if window.name == failed[0].name),
+               key=lambda window: retry_after_seconds(window, now_ts))
+
+
+def retry_after_seconds(window, now_ts):
+    """Secondes avant le début de la tranche suivante de window (dans la grille de sa phase)."""
+    return int((_bucket(window, now_ts) + 1) * window.seconds + _offset(window) - now_ts) + 1
@@ -1,5 +1,9 @@
 // Configuration
 const API_ENDPOINT = 'https://w3kd6p93v8.execute-api.us-east-1.amazonaws.com/'; // Update with your actual endpoint
+const USE_ASYNC_JOBS = false; // Submit long agent turns as jobs and poll for the result (needs KV_STORE_BACKEND=dynamodb on the Lambda)
+const POLL_INITIAL_DELAY_MS = 500;
+const POLL_MAX_DELAY_MS = 4000;
+const POLL_TIMEOUT_MS = 5 * 60 * 1000;
 let sessionId = generateSessionId();
 let isLoading = false;
 
@@ -64,17 +68,25 @@ async function sendMessage() {
             body: JSON.stringify({
                 prompt: message,
                 sessionId: sessionId,
-                phoneNumber: phoneNumber
+                phoneNumber: phoneNumber,
+                async: USE_ASYNC_JOBS
             })
         });
         
-        const data = await response.json();
+        let data = await response.json();
+        let ok = response.ok;
+        
+        // Async mode: the turn runs as a job, poll until it completes
+        if (response.status === 202 && data.jobId) {
+            data = await pollJob(data.jobId, data.pollAfterMs);
+            ok = true;
+        }
         
         // Remove loading indicator
         removeLoadingIndicator();
         isLoading = false;
         
-        if (response.ok && data.status === 'success') {
+        if (ok && data.status === 'success') {
             // Add agent response
             addMessage(data.message, 'assistant');
             
@@ -95,6 +107,44 @@ async function sendMessage() {
     }
 }
 
+/**
+ * Poll an agent job until it finishes, with exponential backoff
+ * @param {string} jobId - The job returned by the submission
+ * @param {number} firstDelayMs - Suggested delay before the first poll
+ * @returns {Promise<object>} The final job response
+ */
+async function pollJob(jobId, firstDelayMs) {
+    const deadline = Date.now() + POLL_TIMEOUT_MS;
+    let delay = firstDelayMs || POLL_INITIAL_DELAY_MS;
+    
+    while (Date.now() < deadline) {
+        await sleep(delay);
+        const response = await fetch(`${API_ENDPOINT}jobs/${encodeURIComponent(jobId)}`);
+        
+        if (response.status === 429) {
+            // Honor the server's Retry-After hint
+            const retryAfter = parseFloat(response.headers.get('Retry-After')) || 1;
+            delay = Math.max(delay, retryAfter * 1000);
+            continue;
+        }
+        
+        const data = await response.json();
+        if (response.status !== 202) {
+            return data;
+        }
+        delay = Math.min(delay * 1.5, POLL_MAX_DELAY_MS);
+    }
+    return { status: 'error', message: 'The agent is taking too long to answer, please try again' };
+}
+
+/**
+ * Wait for the given number of milliseconds
+ * @param {number} ms - Delay in milliseconds
+ */
+function sleep(ms) {
+    return new Promise(resolve => setTimeout(resolve, ms));
+}
+
 /**
  * Add a message to the chat
  * @param {string} message - The message text
@@ -0,0 +1,104 @@
+"""Machine-readable error codes shared by the business API and the action-group adapters.
+
+The business handlers put one of these codes in the ``code`` field of their
+error bodies. The adapters decide whether to retry from the code alone. Only
+transient failures are retried: a transaction conflict or a throttle leaves
+nothing written, so replaying it is safe. Everything else (insufficient funds,
+unknown account, invalid request) fails the same way every time, and a retry
+only adds load.
+
+A 503 without a code is ambiguous: the gateway or the backend may have given
+up after the transaction committed. It is retried only on idempotent routes;
+on the routes that debit an account (NON_IDEMPOTENT_PATHS) it becomes
+OUTCOME_UNKNOWN, which is not retried, so a transfer is never debited twice.
+
+Retries use capped exponential backoff with full jitter, so that callers which
+collided once do not collide again on the next attempt.
+"""
+import random
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+INSUFFICIENT_FUNDS = "INSUFFICIENT_FUNDS"
+UNKNOWN_SUBSCRIBER = "UNKNOWN_SUBSCRIBER"
+UNKNOWN_RECIPIENT = "UNKNOWN_RECIPIENT"
+UNKNOWN_PLAN = "UNKNOWN_PLAN"
+INVALID_REQUEST = "INVALID_REQUEST"
+VELOCITY_LIMIT_EXCEEDED = "VELOCITY_LIMIT_EXCEEDED"
+TRANSACTION_CONFLICT = "TRANSACTION_CONFLICT"
+THROTTLED = "THROTTLED"
+INTERNAL_ERROR = "INTERNAL_ERROR"
+# Adapter side only: the call may or may not have been applied (check before trying again)
+OUTCOME_UNKNOWN = "OUTCOME_UNKNOWN"
+
+# Routes whose replay after an applied call would debit the account a second time
+NON_IDEMPOTENT_PATHS = frozenset({"/transferMoney", "/activateSubscription"})
+
+RETRYABLE_CODES = frozenset({TRANSACTION_CONFLICT, THROTTLED})
+
+# HTTP status used by the business API for each code
+HTTP_STATUS = {
+    INSUFFICIENT_FUNDS: 400,
+    UNKNOWN_SUBSCRIBER: 404,
+    UNKNOWN_RECIPIENT: 404,
+    UNKNOWN_PLAN: 404,
+    INVALID_REQUEST: 400,
+    # Not retryable: the sender must wait for the window to pass (retry_after_seconds in the body)
+    VELOCITY_LIMIT_EXCEEDED: 429,
+    TRANSACTION_CONFLICT: 409,
+    THROTTLED: 429,
+    INTERNAL_ERROR: 500,
+}
+
+
+def is_retryable(code: Optional[str]) -> bool:
+    return code in RETRYABLE_CODES
+
+
+def is_idempotent(api_path: Optional[str]) -> bool:
+    return not api_path or "/" + api_path.strip("/") not in NON_IDEMPOTENT_PATHS
+
+
+def code_from_http_status(status: int, idempotent: bool = True) -> Optional[str]:
+    """Best-effort code for responses that carry none (older backends, API Gateway throttling)."""
+    if status == 429:
+        return THROTTLED
+    if status == 503:
+        return THROTTLED if idempotent else OUTCOME_UNKNOWN
+    if status == 409:
+        return TRANSACTION_CONFLICT
+    return None
+
+
+def api_result_code(api_result: Dict[str, Any], api_path: Optional[str] = None) -> Optional[str]:
+    """Code of an adapter API call result ({"statusCode", "body"}): the body's code, else one from the status.
+
+    api_path decides how an uncoded 503 is read (see NON_IDEMPOTENT_PATHS).
+    """
+    body = api_result.get("body")
+    if isinstance(body, dict) and body.get("code"):
+        return body["code"]
+    return code_from_http_status(int(api_result.get("statusCode") or 500), is_idempotent(api_path))
+
+
+def backoff_delay(attempt: int, base: float = 0.1, cap: float = 2.0,
+                  rng: Callable[[float, float], float] = random.uniform) -> float:
+    """Full-jitter delay in seconds before retry number attempt (1-based)."""
+    return rng(0.0, min(cap, base * (2 ** (attempt - 1))))
+
+
+def call_with_retries(call: Callable[[], Any], classify: Callable[[Any], Optional[str]],
+                      max_attempts: int = 3, base: float = 0.1, cap: float = 2.0,
+                      sleep: Callable[[float], None] = time.sleep) -> Tuple[Any, Optional[str], int]:
+    """Run call() until classify(result) is not a retryable code or attempts run out.
+
+    Returns (last result, its code, attempts made).
+    """
+    attempt = 1
+    while True:
+        result = call()
+        code = classify(result)
+        if not is_retryable(code) or attempt >= max_attempts:
+            return result, code, attempt
+        sleep(backoff_delay(attempt, base, cap))
+        attempt += 1
@@ -0,0 +1,356 @@
+"""On-demand profiling of live handler invocations.
+
+Every lambda_handler is wrapped with profile_handler(name). An invocation is
+profiled when:
+  * its HTTP request carries the HANDLER_PROFILE_HEADER header (default
+    ``X-Profile``) with the value of HANDLER_PROFILE_TOKEN. Without a token the
+    header is ignored, so callers cannot switch profiling on by themselves;
+  * or it is drawn by HANDLER_PROFILE_SAMPLE_RATE (0..1, default 0; 1 profiles
+    every invocation), limited to the handlers listed in HANDLER_PROFILE_HANDLERS
+    (comma-separated, empty for all).
+
+HANDLER_PROFILE_MODE picks the profiler:
+  * sampling (default): a thread records the handler thread's stack every
+    HANDLER_PROFILE_INTERVAL_MS (5 ms), each sample weighing the time since the
+    previous one. Overhead is low and I/O waits are included, which is where
+    most handlers spend their time;
+  * cprofile: every call is traced, with exact call counts, at a higher overhead.
+    Stacks are rebuilt from the caller graph, splitting each function's time
+    between its callers in proportion.
+Both record wall-clock time in microseconds per folded stack (``a;b;c``), so
+tools/profile_report.py can merge samples of either mode into one flame graph.
+
+tracemalloc runs during the invocation. The record keeps the peak traced memory
+above the level at the start, the memory still held at the end, and the
+HANDLER_PROFILE_ALLOCATIONS (10) sites holding the most of it.
+
+Only the thread that runs the handler is profiled, and only one invocation at a
+time per process: a concurrent or nested invocation runs unprofiled.
+
+Records are JSON documents written to HANDLER_PROFILE_SINK:
+  * ``dir:/path``: one file per record under that directory (default
+    ``dir:/tmp/handler-profiles``);
+  * ``s3://bucket/prefix``: one object per record;
+  * ``memory:``: kept in the process (local runs);
+  * any scheme added with register_sink().
+The built-in sinks are the stores of common/object_store.py.
+Keys are ``{handler}/{YYYY-MM-DD}/{timestamp}-{id}.json``. Profiling is
+diagnostic: a failure to profile or to write never fails the invocation.
+"""
+import cProfile
+import functools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import json_codec
+from object_store import LocalObjectStore, MemoryObjectStore, S3ObjectStore
+
+logger = logging.getLogger()
+
+HANDLER_PROFILE_SAMPLE_RATE = float(os.getenv("HANDLER_PROFILE_SAMPLE_RATE", "0"))
+HANDLER_PROFILE_HANDLERS = frozenset(name.strip() for name in os.getenv("HANDLER_PROFILE_HANDLERS", "").split(",")
+                                     if name.strip())
+HANDLER_PROFILE_HEADER = os.getenv("HANDLER_PROFILE_HEADER", "X-Profile").lower()
+HANDLER_PROFILE_TOKEN = os.getenv("HANDLER_PROFILE_TOKEN", "")
+HANDLER_PROFILE_MODE = os.getenv("HANDLER_PROFILE_MODE", "sampling").lower()
+HANDLER_PROFILE_INTERVAL_MS = float(os.getenv("HANDLER_PROFILE_INTERVAL_MS", "5"))
+HANDLER_PROFILE_ALLOCATIONS = int(os.getenv("HANDLER_PROFILE_ALLOCATIONS", "10"))
+HANDLER_PROFILE_SINK = os.getenv("HANDLER_PROFILE_SINK", "dir:/tmp/handler-profiles")
+
+# cProfile functions kept in a record, by cumulative time
+MAX_FUNCTIONS = 200
+# Stacks rebuilt from cProfile below this share of the total time are dropped
+MIN_STACK_SHARE = 1e-4
+MAX_STACK_DEPTH = 128
+
+# One profiled invocation at a time: cProfile and tracemalloc are process-wide
+_profile_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+# Sinks
+# ---------------------------------------------------------------------------
+
+def _s3_sink(spec: str) -> S3ObjectStore:
+    bucket, _, prefix = spec.lstrip("/").partition("/")
+    return S3ObjectStore(bucket, prefix.rstrip("/") + "/" if prefix else "", content_type="application/json")
+
+
+# Sink factories by scheme: "dir:/tmp/profiles" calls SINKS["dir"]("/tmp/profiles")
+SINKS: Dict[str, Callable[[str], Any]] = {
+    "dir": LocalObjectStore,
+    "s3": _s3_sink,
+    "memory": lambda _spec: MemoryObjectStore(),
+}
+_sink = None
+
+
+def register_sink(scheme: str, factory: Callable[[str], Any]) -> None:
+    """Make HANDLER_PROFILE_SINK=<scheme>:<spec> build factory(spec), an object with put(key, data)."""
+    SINKS[scheme] = factory
+
+
+def create_sink(spec: Optional[str] = None) -> Any:
+    """The sink described by spec (default: HANDLER_PROFILE_SINK)."""
+    scheme, _, rest = (spec or HANDLER_PROFILE_SINK).partition(":")
+    if scheme not in SINKS:
+        raise ValueError(f"Unknown profile sink: {scheme}")
+    return SINKS[scheme](rest)
+
+
+def get_sink() -> Any:
+    """The process-wide sink, created on first use."""
+    global _sink
+    if _sink is None:
+        _sink = create_sink()
+    return _sink
+
+
+def set_sink(sink: Any) -> None:
+    """Replace the process-wide sink (any object with put(key, data))."""
+    global _sink
+    _sink = sink
+
+
+# ---------------------------------------------------------------------------
+# Profilers
+# ---------------------------------------------------------------------------
+
+def _frame_name(filename: str, line: int, function: str) -> str:
+    # ";" separates frames in folded stacks
+    return f"{function} ({os.path.basename(filename)}:{line})".replace(";", ",")
+
+
+def _run(function: Callable, event: Any, context: Any) -> Any:
+    """Calls the handler: the root of every recorded stack, left out of them."""
+    return function(event, context)
+
+
+_RUN_KEY = (_run.__code__.co_filename, _run.__code__.co_firstlineno, _run.__code__.co_name)
+
+
+class _Sampler(threading.Thread):
+    """Records the stack of the calling thread every HANDLER_PROFILE_INTERVAL_MS, down to _run()."""
+
+    mode = "sampling"
+
+    def __init__(self):
+        super().__init__(name="handler-profiler", daemon=True)
+        self.thread_id = threading.get_ident()
+        self.interval = HANDLER_PROFILE_INTERVAL_MS / 1000
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        last = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            # CPU-bound code holds the GIL past the interval: a sample weighs the time since the previous one
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            frames = []
+            while frame is not None and frame.f_code is not _run.__code__:
+                code = frame.f_code
+                frames.append(_frame_name(code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if frame is not None and frames:
+                self.samples += 1
+                self.stacks[";".join(reversed(frames))] += elapsed
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+    def results(self) -> Dict[str, Any]:
+        return {
+            "interval_ms": HANDLER_PROFILE_INTERVAL_MS,
+            "samples": self.samples,
+            "stacks": {stack: round(seconds * 1e6) for stack, seconds in self.stacks.items()},
+        }
+
+
+def pstats_stacks(stats: Dict[tuple, tuple]) -> Dict[str, int]:
+    """Folded stacks (microseconds of self time) rebuilt from cProfile stats.
+
+    cProfile only keeps caller -> callee edges, so a function's time is split
+    between its callers in proportion to the time each call accounted for.
+    Recursive calls are cut at the first repetition.
+    """
+    callees: Dict[tuple, List[Tuple[tuple, float]]] = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, _ in callees.get(_RUN_KEY, ())]
+    threshold = sum(stats[root][3] for root in roots) * MIN_STACK_SHARE
+    stacks: Counter = Counter()
+
+    def walk(func: tuple, path: str, on_path: frozenset, share: float, depth: int) -> None:
+        self_time = stats[func][2] * share
+        if self_time > 0:
+            stacks[path] += self_time
+        if depth >= MAX_STACK_DEPTH:
+            return
+        for callee, time_from_func in callees.get(func, ()):
+            callee_time = stats[callee][3]
+            if callee in on_path or callee_time <= 0 or time_from_func * share < threshold:
+                continue
+            walk(callee, f"{path};{_frame_name(*callee)}", on_path | {callee},
+                 share * time_from_func / callee_time, depth + 1)
+
+    for root in roots:
+        walk(root, _frame_name(*root), frozenset({root}), 1.0, 1)
+    return {stack: round(seconds * 1e6) for stack, seconds in stacks.items() if round(seconds * 1e6)}
+
+
+class _CProfiler:
+    """cProfile on the calling thread; stacks are rebuilt from the caller graph."""
+
+    mode = "cprofile"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self.profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+
+    def results(self) -> Dict[str, Any]:
+        self.profile.create_stats()
+        stats = self.profile.stats
+        top = sorted(((func, entry) for func, entry in stats.items() if func != _RUN_KEY),
+                     key=lambda item: item[1][3], reverse=True)[:MAX_FUNCTIONS]
+        return {
+            "stacks": pstats_stacks(stats),
+            # name -> [calls, self µs, cumulative µs]
+            "functions": {_frame_name(*func): [nc, round(tt * 1e6), round(ct * 1e6)]
+                          for func, (_, nc, tt, ct, _) in top},
+        }
+
+
+PROFILERS = {
+    "sampling": _Sampler,
+    "cprofile": _CProfiler,
+}
+
+
+def _top_allocations(limit: int) -> List[Dict[str, Any]]:
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    return [{"site": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+             "size_bytes": stat.size, "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:limit]]
+
+
+# ---------------------------------------------------------------------------
+# Decorator
+# ---------------------------------------------------------------------------
+
+def _header_requested(event: Any) -> bool:
+    if not HANDLER_PROFILE_TOKEN or not isinstance(event, dict):
+        return False
+    for name, value in (event.get("headers") or {}).items():
+        if name.lower() == HANDLER_PROFILE_HEADER:
+            return value == HANDLER_PROFILE_TOKEN
+    return False
+
+
+def profile_trigger(handler: str, event: Any) -> Optional[str]:
+    """Why this invocation should be profiled ("header" or "sample"), or None."""
+    if _header_requested(event):
+        return "header"
+    if HANDLER_PROFILE_SAMPLE_RATE > 0 and (not HANDLER_PROFILE_HANDLERS or handler in HANDLER_PROFILE_HANDLERS) \
+            and random.random() < HANDLER_PROFILE_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+def _route(event: Any) -> Optional[str]:
+    if not isinstance(event, dict):
+        return None
+    return (event.get("apiPath") or event.get("rawPath") or event.get("path")
+            or (event.get("requestContext") or {}).get("resourcePath"))
+
+
+def profile_invocation(handler: str, function: Callable, event: Any, context: Any, trigger: str) -> Any:
+    """Run function(event, context) under the profiler and write the record to the sink."""
+    profiler = PROFILERS.get(HANDLER_PROFILE_MODE, _Sampler)()
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    else:
+        tracemalloc.reset_peak()
+    base_memory = tracemalloc.get_traced_memory()[0]
+    started_at = datetime.utcnow()
+    error = None
+    started = time.perf_counter()
+    profiler.start()
+    try:
+        return _run(function, event, context)
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        profiler.stop()
+        duration_ms = (time.perf_counter() - started) * 1000
+        try:
+            # Memory is read before the profile is processed, which allocates too
+            current_memory, peak_memory = tracemalloc.get_traced_memory()
+            allocations = _top_allocations(HANDLER_PROFILE_ALLOCATIONS) if HANDLER_PROFILE_ALLOCATIONS else []
+            if started_tracing:
+                tracemalloc.stop()
+            _write(handler, started_at, {
+                "handler": handler,
+                "route": _route(event),
+                "request_id": getattr(context, "aws_request_id", None),
+                "started_at": started_at.isoformat() + "Z",
+                "trigger": trigger,
+                "mode": profiler.mode,
+                "duration_ms": round(duration_ms, 3),
+                "error": error,
+                "peak_memory_bytes": peak_memory - base_memory,
+                "retained_memory_bytes": current_memory - base_memory,
+                "top_allocations": allocations,
+                **profiler.results(),
+            })
+        except Exception as e:
+            logger.warning("Could not record the profile of %s: %s", handler, e)
+        finally:
+            if started_tracing and tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+
+def _write(handler: str, started_at: datetime, record: Dict[str, Any]) -> None:
+    key = f"{handler}/{started_at:%Y-%m-%d}/{started_at:%H%M%S%f}-{uuid.uuid4().hex[:8]}.json"
+    get_sink().put(key, json_codec.dumps_bytes(record))
+    logger.info("Profiled %s (%s, %.1f ms, peak %d bytes): %s", handler, record["trigger"],
+                record["duration_ms"], record["peak_memory_bytes"], key)
+
+
+def profile_handler(handler: str) -> Callable[[Callable], Callable]:
+    """Decorator for a lambda_handler: profiles the invocations the header, the sample rate or the env select."""
+    def decorate(function: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+        @functools.wraps(function)
+        def wrapper(event: Any, context: Any) -> Any:
+            trigger = profile_trigger(handler, event)
+            if trigger is None or not _profile_lock.acquire(blocking=False):
+                return function(event, context)
+            try:
+                return profile_invocation(handler, function, event, context, trigger)
+            finally:
+                _profile_lock.release()
+        return wrapper
+    return decorate
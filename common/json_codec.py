@@ -0,0 +1,75 @@
+"""JSON codec shared by the handlers.
+
+Every request goes through JSON several times: the API Gateway body, the
+business API call of the action groups, the tool text, the response and the
+logs. With ``default=str`` the stdlib encoder falls back to its pure-Python
+path as soon as a Decimal or a datetime shows up.
+
+dumps()/dumps_bytes()/loads() use orjson when it is installed (add it to the
+layer's requirements) and the stdlib json module otherwise, with the same output:
+  * compact separators, non-ASCII text written as is;
+  * Decimal as a JSON number (float, as the handlers already converted amounts and prices);
+  * datetime and date in ISO 8601, sets and tuples as arrays;
+  * any other type as its str(), like ``default=str`` did.
+
+JSON_CODEC=stdlib forces the fallback (auto by default).
+"""
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the deployment
+    orjson = None
+
+JSON_CODEC_ENV = "JSON_CODEC"
+
+CODEC = "orjson" if orjson is not None and os.getenv(JSON_CODEC_ENV, "auto").lower() != "stdlib" else "stdlib"
+
+
+def _default(value: Any) -> Any:
+    """Types neither encoder handles natively."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return str(value)
+
+
+if CODEC == "orjson":
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(value: Any, sort_keys: bool = False) -> bytes:
+        """value as UTF-8 JSON bytes."""
+        return orjson.dumps(value, default=_default,
+                            option=_OPTIONS | orjson.OPT_SORT_KEYS if sort_keys else _OPTIONS)
+
+    def dumps(value: Any, sort_keys: bool = False) -> str:
+        """value as a JSON string."""
+        return dumps_bytes(value, sort_keys).decode("utf-8")
+
+    def loads(data: Union[str, bytes, bytearray]) -> Any:
+        return orjson.loads(data)
+else:
+    _encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_default)
+    _sorted_encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_default, sort_keys=True)
+
+    def dumps(value: Any, sort_keys: bool = False) -> str:
+        """value as a JSON string."""
+        return (_sorted_encoder if sort_keys else _encoder).encode(value)
+
+    def dumps_bytes(value: Any, sort_keys: bool = False) -> bytes:
+        """value as UTF-8 JSON bytes."""
+        return dumps(value, sort_keys).encode("utf-8")
+
+    def loads(data: Union[str, bytes, bytearray]) -> Any:
+        return json.loads(data)
+
+
+# Raised by loads() with either codec (orjson's error subclasses it)
+JSONDecodeError = json.JSONDecodeError
@@ -0,0 +1,179 @@
+"""Small shared key/value store for cross-invocation state.
+
+Holds short-lived JSON records (rate-limiter buckets, leases, job state, ...)
+that must be shared by every Lambda container. Each record has a version
+used for optimistic concurrency (compare-and-set) and an optional TTL.
+
+Implementations:
+  * InMemoryKVStore: process-local stand-in for tests and local runs
+  * DynamoDBKVStore: table with a string hash key ``pk`` and TTL on ``expires_at``
+  * RedisKVStore: Redis/ElastiCache at REDIS_URL (optional ``redis`` package)
+
+create_kv_store() picks one from KV_STORE_BACKEND (memory | dynamodb | redis).
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import json_codec
+
+KV_STORE_BACKEND_ENV = "KV_STORE_BACKEND"
+KV_TABLE_NAME_ENV = "KV_TABLE_NAME"
+DEFAULT_KV_TABLE_NAME = "AgentState"
+REDIS_URL_ENV = "REDIS_URL"
+DEFAULT_REDIS_URL = "redis://localhost:6379/0"
+
+# Version to pass as expected_version when the key must not exist yet
+ABSENT = 0
+
+
+class KeyValueStore:
+    """Common interface of the shared stores."""
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], int]:
+        """Return (value, version); (None, ABSENT) when missing or expired."""
+        raise NotImplementedError
+
+    def put(self, key: str, value: Dict[str, Any], ttl_seconds: Optional[float] = None,
+            expected_version: Optional[int] = None) -> bool:
+        """Store value; with expected_version, only if the current version matches. Returns success."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class InMemoryKVStore(KeyValueStore):
+    """Thread-safe, process-local stand-in for the shared store."""
+
+    def __init__(self) -> None:
+        self._records: Dict[str, Tuple[Dict[str, Any], int, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str):
+        record = self._records.get(key)
+        if record and record[2] is not None and record[2] <= time.time():
+            del self._records[key]
+            return None
+        return record
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], int]:
+        with self._lock:
+            record = self._live(key)
+            if record is None:
+                return None, ABSENT
+            return json_codec.loads(json_codec.dumps_bytes(record[0])), record[1]
+
+    def put(self, key: str, value: Dict[str, Any], ttl_seconds: Optional[float] = None,
+            expected_version: Optional[int] = None) -> bool:
+        with self._lock:
+            record = self._live(key)
+            current_version = record[1] if record else ABSENT
+            if expected_version is not None and expected_version != current_version:
+                return False
+            expires_at = time.time() + ttl_seconds if ttl_seconds else None
+            self._records[key] = (json_codec.loads(json_codec.dumps_bytes(value)), current_version + 1, expires_at)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._records.pop(key, None)
+
+
+class DynamoDBKVStore(KeyValueStore):
+    """DynamoDB-backed store; conditional writes implement compare-and-set."""
+
+    def __init__(self, table_name: Optional[str] = None, client: Any = None) -> None:
+        if client is None:
+            import boto3
+            client = boto3.client("dynamodb")
+        self.client = client
+        self.table_name = table_name or os.getenv(KV_TABLE_NAME_ENV, DEFAULT_KV_TABLE_NAME)
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], int]:
+        item = self.client.get_item(
+            TableName=self.table_name, Key={"pk": {"S": key}}, ConsistentRead=True
+        ).get("Item")
+        # DynamoDB TTL deletion is lazy: treat expired records as missing
+        if not item or ("expires_at" in item and float(item["expires_at"]["N"]) <= time.time()):
+            return None, ABSENT if not item else int(item["version"]["N"])
+        return json_codec.loads(item["value"]["S"]), int(item["version"]["N"])
+
+    def put(self, key: str, value: Dict[str, Any], ttl_seconds: Optional[float] = None,
+            expected_version: Optional[int] = None) -> bool:
+        params: Dict[str, Any] = {
+            "TableName": self.table_name,
+            "Key": {"pk": {"S": key}},
+            "UpdateExpression": "SET #v = :value ADD version :one",
+            "ExpressionAttributeNames": {"#v": "value"},
+            "ExpressionAttributeValues": {":value": {"S": json_codec.dumps(value)}, ":one": {"N": "1"}},
+        }
+        if ttl_seconds:
+            params["UpdateExpression"] = "SET #v = :value, expires_at = :exp ADD version :one"
+            params["ExpressionAttributeValues"][":exp"] = {"N": str(int(time.time() + ttl_seconds))}
+        else:
+            params["UpdateExpression"] += " REMOVE expires_at"
+        if expected_version is not None:
+            if expected_version == ABSENT:
+                params["ConditionExpression"] = "attribute_not_exists(version) OR version = :expected"
+            else:
+                params["ConditionExpression"] = "version = :expected"
+            params["ExpressionAttributeValues"][":expected"] = {"N": str(expected_version)}
+        try:
+            self.client.update_item(**params)
+            return True
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+
+    def delete(self, key: str) -> None:
+        self.client.delete_item(TableName=self.table_name, Key={"pk": {"S": key}})
+
+
+class RedisKVStore(KeyValueStore):
+    """Redis-backed store; WATCH/MULTI implements compare-and-set, native key expiry the TTL."""
+
+    def __init__(self, url: Optional[str] = None, client: Any = None) -> None:
+        import redis
+        self._watch_error = redis.WatchError
+        self.client = client or redis.Redis.from_url(url or os.getenv(REDIS_URL_ENV, DEFAULT_REDIS_URL))
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], int]:
+        raw = self.client.get(key)
+        if raw is None:
+            return None, ABSENT
+        record = json_codec.loads(raw)
+        return record["value"], record["version"]
+
+    def put(self, key: str, value: Dict[str, Any], ttl_seconds: Optional[float] = None,
+            expected_version: Optional[int] = None) -> bool:
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                raw = pipe.get(key)
+                current_version = json_codec.loads(raw)["version"] if raw is not None else ABSENT
+                if expected_version is not None and expected_version != current_version:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                record = json_codec.dumps({"value": value, "version": current_version + 1})
+                pipe.set(key, record, px=int(ttl_seconds * 1000) if ttl_seconds else None)
+                pipe.execute()
+                return True
+            except self._watch_error:
+                return False
+
+    def delete(self, key: str) -> None:
+        self.client.delete(key)
+
+
+def create_kv_store(kind: Optional[str] = None) -> KeyValueStore:
+    """Instantiate the store selected by kind or KV_STORE_BACKEND (default: memory)."""
+    kind = (kind or os.getenv(KV_STORE_BACKEND_ENV, "memory")).lower()
+    if kind == "memory":
+        return InMemoryKVStore()
+    if kind == "dynamodb":
+        return DynamoDBKVStore()
+    if kind == "redis":
+        return RedisKVStore()
+    raise ValueError(f"Unknown key/value store backend: {kind}")
@@ -0,0 +1,59 @@
+"""CloudWatch metrics in Embedded Metric Format (EMF).
+
+Lambda forwards every stdout line to CloudWatch Logs; lines in EMF are
+turned into metrics without any API call or extra dependency. Outside
+Lambda the same lines are simply logged, and tests or local tools can
+capture them with set_sink().
+"""
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+import json_codec
+
+METRICS_NAMESPACE_ENV = "METRICS_NAMESPACE"
+METRICS_ENABLED_ENV = "METRICS_ENABLED"
+DEFAULT_NAMESPACE = "TelcoAssistant"
+
+MetricValue = Union[float, int, Tuple[float, str]]
+
+_sink: Callable[[str], None] = print
+
+
+def set_sink(sink: Callable[[str], None]) -> None:
+    """Redirect EMF lines (default: print to stdout)."""
+    global _sink
+    _sink = sink
+
+
+def emit_metrics(metrics: Dict[str, MetricValue],
+                 dimensions: Optional[Dict[str, str]] = None,
+                 properties: Optional[Dict[str, Any]] = None,
+                 namespace: Optional[str] = None) -> None:
+    """Emit one EMF record.
+
+    metrics maps a metric name to a value, or to a (value, unit) tuple
+    (units: Count, Milliseconds, Bytes, ...). Values without a unit are Count.
+    properties are attached to the log line but not turned into metrics.
+    """
+    if os.getenv(METRICS_ENABLED_ENV, "true").lower() in ("0", "false", "no"):
+        return
+    dimensions = dimensions or {}
+    record: Dict[str, Any] = dict(properties or {})
+    definitions = []
+    for name, value in metrics.items():
+        unit = "Count"
+        if isinstance(value, tuple):
+            value, unit = value
+        record[name] = value
+        definitions.append({"Name": name, "Unit": unit})
+    record.update(dimensions)
+    record["_aws"] = {
+        "Timestamp": int(time.time() * 1000),
+        "CloudWatchMetrics": [{
+            "Namespace": namespace or os.getenv(METRICS_NAMESPACE_ENV, DEFAULT_NAMESPACE),
+            "Dimensions": [list(dimensions.keys())],
+            "Metrics": definitions,
+        }],
+    }
+    _sink(json_codec.dumps(record))
@@ -0,0 +1,115 @@
+"""Minimal object stores for blobs addressed by ``/``-separated keys.
+
+Used by the transaction archive (business backend) and the handler profiler.
+Every store has the same interface:
+  * put(key, data): write the bytes, replacing any previous object;
+  * get(key, byte_range=None): the bytes, or only [start, end) of them, or
+    None when the key does not exist;
+  * list(prefix): the keys starting with prefix, sorted.
+
+Implementations:
+  * LocalObjectStore: files under a root directory (atomic writes)
+  * S3ObjectStore: objects under a key prefix in a bucket (ranged GETs)
+  * MemoryObjectStore: kept in the process (tests and local runs)
+"""
+import os
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+ByteRange = Tuple[int, int]
+
+
+class LocalObjectStore:
+    """Objects as files under root: a key is a path relative to root."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Atomic write: a reader never sees half a file
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key: str, byte_range: Optional[ByteRange] = None) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                if byte_range is None:
+                    return f.read()
+                f.seek(byte_range[0])
+                return f.read(byte_range[1] - byte_range[0])
+        except FileNotFoundError:
+            return None
+
+    def list(self, prefix: str = "") -> List[str]:
+        # Only the directory holding the prefix is walked
+        directory = self._path(prefix.rsplit("/", 1)[0]) if "/" in prefix else self.root
+        keys = []
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                key = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+
+class S3ObjectStore:
+    """Objects under prefix in an S3 bucket (byte ranges through the Range header)."""
+
+    def __init__(self, bucket: str, prefix: str = "", client: Any = None, content_type: Optional[str] = None):
+        if client is None:
+            import boto3
+            client = boto3.client("s3")
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.content_type = content_type
+
+    def put(self, key: str, data: bytes) -> None:
+        params = {"Bucket": self.bucket, "Key": self.prefix + key, "Body": data}
+        if self.content_type:
+            params["ContentType"] = self.content_type
+        self.client.put_object(**params)
+
+    def get(self, key: str, byte_range: Optional[ByteRange] = None) -> Optional[bytes]:
+        params = {"Bucket": self.bucket, "Key": self.prefix + key}
+        if byte_range is not None:
+            params["Range"] = f"bytes={byte_range[0]}-{byte_range[1] - 1}"
+        try:
+            return self.client.get_object(**params)["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def list(self, prefix: str = "") -> List[str]:
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            keys.extend(obj["Key"][len(self.prefix):] for obj in page.get("Contents", []))
+        return sorted(keys)
+
+
+class MemoryObjectStore:
+    """Objects kept in the process."""
+
+    def __init__(self):
+        self.objects: Dict[str, bytes] = {}
+
+    def put(self, key: str, data: bytes) -> None:
+        self.objects[key] = data
+
+    def get(self, key: str, byte_range: Optional[ByteRange] = None) -> Optional[bytes]:
+        data = self.objects.get(key)
+        if data is None or byte_range is None:
+            return data
+        return data[byte_range[0]:byte_range[1]]
+
+    def list(self, prefix: str = "") -> List[str]:
+        return sorted(key for key in self.objects if key.startswith(prefix))
@@ -0,0 +1,214 @@
+"""Request validation for Bedrock action groups, compiled from their OpenAPI files.
+
+Each action-group Lambda loads its OpenAPI document once per container
+(load_validators at import time). Every operation's request-body schema is
+compiled into a list of per-parameter checks — regexes compiled, enums turned
+into sets, bounds resolved — so validating a tool call is a few dictionary
+lookups and comparisons.
+
+Bedrock passes parameter values as strings; validation coerces them to the
+declared type (number, integer, boolean) and returns the coerced parameters,
+or a list of errors precise enough for the agent to fix its call (parameter,
+problem, received value) without a round trip to the business API. Numbers
+with a thousands separator ("1,000") are rejected, never reinterpreted.
+
+Supported schema keywords: type, required (and anyOf of required lists),
+enum, pattern, minLength, maxLength, minimum, maximum, exclusiveMinimum,
+exclusiveMaximum (3.0 boolean and 3.1 numeric forms), and format "e164",
+which normalizes phone numbers before the other string checks. Unknown
+keywords and undeclared parameters are ignored.
+"""
+import math
+import re
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import json_codec
+from phone_numbers import normalize_phone
+
+ValidationError = Dict[str, Any]
+# A check returns (coerced value, None) or (None, error message)
+Check = Callable[[Any], Tuple[Any, Optional[str]]]
+
+_TRUE = {"true", "1", "yes"}
+# Numbers spelled without ambiguity: "1000", "1000.5", or a decimal comma with 1-2 digits ("1000,50").
+# "1,000" or "1 000" (grouping separators) are refused rather than guessed: these are amounts of money.
+_PLAIN_NUMBER = re.compile(r"[+-]?(?:\d+(?:\.\d*)?|\.\d+)")
+_DECIMAL_COMMA = re.compile(r"[+-]?\d+,\d{1,2}")
+NUMBER_FORMAT_HINT = "must be written with digits only, e.g. 1000 or 1000.50 (no thousands separator)"
+_FALSE = {"false", "0", "no"}
+
+
+def _coerce_number(value: Any, integer: bool) -> Tuple[Any, Optional[str]]:
+    if isinstance(value, bool):
+        return None, "must be a number"
+    if isinstance(value, str):
+        text = value.strip()
+        if _PLAIN_NUMBER.fullmatch(text):
+            value = float(text)
+        elif _DECIMAL_COMMA.fullmatch(text):
+            value = float(text.replace(",", "."))
+        else:
+            return None, NUMBER_FORMAT_HINT
+    if not isinstance(value, (int, float)) or math.isnan(value) or math.isinf(value):
+        return None, "must be an integer" if integer else "must be a number"
+    if float(value).is_integer():
+        return int(value), None
+    if integer:
+        return None, "must be an integer"
+    return value, None
+
+
+def _compile_property(schema: Dict[str, Any]) -> List[Check]:
+    checks: List[Check] = []
+    kind = schema.get("type", "string")
+
+    if kind in ("number", "integer"):
+        integer = kind == "integer"
+        checks.append(lambda v: _coerce_number(v, integer))
+        minimum, maximum = schema.get("minimum"), schema.get("maximum")
+        exclusive_min, exclusive_max = schema.get("exclusiveMinimum"), schema.get("exclusiveMaximum")
+        # OpenAPI 3.1 / JSON Schema: exclusiveMinimum is the bound itself
+        if not isinstance(exclusive_min, bool) and exclusive_min is not None:
+            minimum, exclusive_min = exclusive_min, True
+        if not isinstance(exclusive_max, bool) and exclusive_max is not None:
+            maximum, exclusive_max = exclusive_max, True
+        if minimum is not None:
+            if exclusive_min:
+                checks.append(lambda v: (v, None) if v > minimum else (None, f"must be greater than {minimum}"))
+            else:
+                checks.append(lambda v: (v, None) if v >= minimum else (None, f"must be at least {minimum}"))
+        if maximum is not None:
+            if exclusive_max:
+                checks.append(lambda v: (v, None) if v < maximum else (None, f"must be less than {maximum}"))
+            else:
+                checks.append(lambda v: (v, None) if v <= maximum else (None, f"must be at most {maximum}"))
+    elif kind == "boolean":
+        def to_bool(v: Any) -> Tuple[Any, Optional[str]]:
+            if isinstance(v, bool):
+                return v, None
+            text = str(v).strip().lower()
+            if text in _TRUE or text in _FALSE:
+                return text in _TRUE, None
+            return None, "must be true or false"
+        checks.append(to_bool)
+    elif kind == "string":
+        checks.append(lambda v: (v, None) if isinstance(v, str) else (str(v), None))
+        checks.append(lambda v: (v.strip(), None))
+        if schema.get("format") == "e164":
+            # Local spellings (0891234567, 243 89 ...) are rewritten, not rejected
+            checks.append(lambda v: (normalize_phone(v) or v, None))
+        if "minLength" in schema:
+            min_length = schema["minLength"]
+            checks.append(lambda v: (v, None) if len(v) >= min_length
+                          else (None, f"must be at least {min_length} characters long"))
+        if "maxLength" in schema:
+            max_length = schema["maxLength"]
+            checks.append(lambda v: (v, None) if len(v) <= max_length
+                          else (None, f"must be at most {max_length} characters long"))
+        if "pattern" in schema:
+            pattern = re.compile(schema["pattern"])
+            hint = schema.get("x-pattern-hint") or f"must match {schema['pattern']}"
+            checks.append(lambda v: (v, None) if pattern.search(v) else (None, hint))
+
+    if "enum" in schema:
+        allowed = set(schema["enum"])
+        listed = ", ".join(str(a) for a in schema["enum"])
+        checks.append(lambda v: (v, None) if v in allowed else (None, f"must be one of: {listed}"))
+    return checks
+
+
+class OperationValidator:
+    """Compiled request-body schema of one operation."""
+
+    def __init__(self, schema: Dict[str, Any]) -> None:
+        self.required = list(schema.get("required", []))
+        # anyOf: [{"required": [...]}, ...] -- at least one of the alternatives must be present
+        self.required_any = [list(option.get("required", [])) for option in schema.get("anyOf") or []
+                             if option.get("required")]
+        self.properties = {name: _compile_property(prop or {})
+                           for name, prop in (schema.get("properties") or {}).items()}
+
+    def validate(self, params: Dict[str, Any]) -> Tuple[Dict[str, Any], List[ValidationError]]:
+        errors: List[ValidationError] = []
+        result = dict(params)
+        for name in self.required:
+            if params.get(name) in (None, ""):
+                errors.append({"parameter": name, "error": "is required"})
+        if self.required_any and not any(all(params.get(name) not in (None, "") for name in option)
+                                         for option in self.required_any):
+            names = [name for option in self.required_any for name in option]
+            errors.append({"parameter": " or ".join(names), "error": "is required"})
+        for name, checks in self.properties.items():
+            value = params.get(name)
+            if value in (None, ""):
+                continue
+            coerced = value
+            for check in checks:
+                coerced, message = check(coerced)
+                if message:
+                    errors.append({"parameter": name, "error": message, "received": value})
+                    break
+            else:
+                result[name] = coerced
+        return result, errors
+
+
+class ApiValidators:
+    """Validators of every operation of an OpenAPI document, keyed by (path, method)."""
+
+    def __init__(self, spec: Dict[str, Any]) -> None:
+        self.operations: Dict[Tuple[str, str], OperationValidator] = {}
+        for path, methods in (spec.get("paths") or {}).items():
+            for method, operation in methods.items():
+                if not isinstance(operation, dict):
+                    continue
+                content = (operation.get("requestBody") or {}).get("content") or {}
+                schema = (content.get("application/json") or {}).get("schema") or {"type": "object"}
+                # Query/path parameters are validated like body properties
+                for parameter in operation.get("parameters") or []:
+                    schema = dict(schema, properties=dict(schema.get("properties") or {},
+                                                          **{parameter["name"]: parameter.get("schema", {})}))
+                    if parameter.get("required"):
+                        schema["required"] = list(schema.get("required", [])) + [parameter["name"]]
+                self.operations[(path.rstrip("/"), method.upper())] = OperationValidator(schema)
+
+    def validate(self, api_path: str, http_method: str,
+                 params: Dict[str, Any]) -> Tuple[Dict[str, Any], List[ValidationError]]:
+        """Return (coerced params, errors); operations missing from the spec pass through unchanged."""
+        validator = self.operations.get((api_path.rstrip("/"), http_method.upper()))
+        if validator is None:
+            return params, []
+        return validator.validate(params)
+
+
+def load_validators(spec_path: str) -> ApiValidators:
+    with open(spec_path, encoding="utf-8") as f:
+        return ApiValidators(json_codec.loads(f.read()))
+
+
+def describe_errors(errors: List[ValidationError]) -> str:
+    return "; ".join(f"{e['parameter']} {e['error']}" + (f" (received {e['received']!r})" if "received" in e else "")
+                     for e in errors)
+
+
+def validation_error_response(event: Dict[str, Any], errors: List[ValidationError]) -> Dict[str, Any]:
+    """Action-group response rejecting a tool call, in the same envelope as the API results."""
+    tool_text = json_codec.dumps({
+        "actionStatus": "FAILED",
+        "shouldRetry": False,
+        "httpStatusCode": HTTPStatus.BAD_REQUEST,
+        "validationErrors": errors,
+        "error": f"Invalid parameters: {describe_errors(errors)}",
+        "hint": "Correct these parameters (ask the user if a value is unknown) before calling this action again.",
+    })
+    return {
+        "messageVersion": event.get("messageVersion", 1),
+        "response": {
+            "actionGroup": event.get("actionGroup"),
+            "apiPath": event.get("apiPath"),
+            "httpMethod": event.get("httpMethod", "POST"),
+            "httpStatusCode": HTTPStatus.BAD_REQUEST,
+            "responseBody": {"TEXT": {"body": tool_text}},
+        },
+    }
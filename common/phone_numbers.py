@@ -0,0 +1,45 @@
+"""E.164 normalization of subscriber phone numbers.
+
+Users type the same number in many ways (``0891234567``, ``+243 89 123 4567``,
+``243891234567``, ``00243891234567``). Records are keyed by the E.164 form
+(``USER#+243891234567``), so every entry point normalizes first.
+
+Numbers without a country code are read as national numbers of
+DEFAULT_COUNTRY_CODE (243, DR Congo): with the trunk prefix ``0`` or as the
+bare NATIONAL_NUMBER_LENGTH-digit subscriber number.
+"""
+import os
+import re
+from typing import Any, Optional
+
+DEFAULT_COUNTRY_CODE = os.getenv("DEFAULT_COUNTRY_CODE", "243")
+NATIONAL_NUMBER_LENGTH = int(os.getenv("NATIONAL_NUMBER_LENGTH", "9"))
+
+_SEPARATORS = re.compile(r"[\s\-.()/]")
+_E164 = re.compile(r"^\+[1-9]\d{7,14}$")
+
+
+def normalize_phone(raw: Any, country_code: str = DEFAULT_COUNTRY_CODE,
+                    national_length: int = NATIONAL_NUMBER_LENGTH) -> Optional[str]:
+    """Return raw as an E.164 string (``+243891234567``), or None if it cannot be a phone number."""
+    if raw is None or isinstance(raw, bool):
+        return None
+    digits = _SEPARATORS.sub("", str(raw).strip())
+    if digits.startswith("00"):
+        digits = "+" + digits[2:]
+    if digits.startswith("+"):
+        candidate = digits
+    elif digits.startswith(country_code) and len(digits) == len(country_code) + national_length:
+        candidate = "+" + digits
+    elif digits.startswith("0") and len(digits) == national_length + 1:
+        candidate = "+" + country_code + digits[1:]
+    elif len(digits) == national_length:
+        candidate = "+" + country_code + digits
+    else:
+        candidate = "+" + digits
+    return candidate if _E164.match(candidate) else None
+
+
+def normalize_phone_or_raw(raw: Any) -> Any:
+    """E.164 form of raw when it is a phone number, raw unchanged otherwise."""
+    return normalize_phone(raw) or raw
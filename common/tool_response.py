@@ -0,0 +1,150 @@
+"""Compact tool-response text for Bedrock action groups.
+
+The action-group Lambdas build a verbose result for every tool call:
+actionStatus, shouldRetry, httpStatusCode, details (including the raw backend
+body) and the backend body again in responseBody. The model reads the
+serialized result on every turn, so each duplicated field costs input tokens.
+
+build_tool_text() turns that result into the text the agent reads. In
+"compact" mode (the default):
+
+  * the backend body appears once, reduced to the fields whitelisted for the
+    route (RouteFormat.fields), with list items reduced the same way;
+  * lists longer than the route's limit are truncated and the total count is
+    kept (``active_subscriptions_total``), and long strings are shortened;
+  * details entries already present in the body, rawBody, empty values and
+    the HTTP status of successful calls are dropped;
+  * JSON is written without spaces and without \\u escapes for accented text.
+
+TOOL_RESPONSE_FORMAT=full restores the previous verbose text. Routes can be
+overridden with TOOL_RESPONSE_ROUTES, a JSON object such as
+``{"/checkBalance": {"list_limit": 3}}``.
+"""
+import os
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Optional, Tuple
+
+import json_codec
+
+TOOL_RESPONSE_FORMAT = os.getenv("TOOL_RESPONSE_FORMAT", "compact")
+MAX_STRING_CHARS = int(os.getenv("TOOL_RESPONSE_MAX_STRING_CHARS", "240"))
+
+_COMMON_FIELDS = ("status", "code", "message")
+
+
+@dataclass(frozen=True)
+class RouteFormat:
+    """What the agent needs to see from one route's backend body."""
+
+    fields: Tuple[str, ...] = _COMMON_FIELDS
+    # {list or object field: fields kept in each item}
+    item_fields: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+    list_limit: int = 5
+
+
+ROUTE_FORMATS: Dict[str, RouteFormat] = {
+    "/checkBalance": RouteFormat(
+        fields=_COMMON_FIELDS + ("balance_credit", "balance_mobile_money", "active_subscriptions"),
+        item_fields={"active_subscriptions": ("id", "name", "expiration_date", "auto_renew")},
+    ),
+    "/activateSubscription": RouteFormat(
+        fields=_COMMON_FIELDS + ("total_price", "plans"),
+        item_fields={"plans": ("id", "status", "code", "expiration_date")},
+    ),
+    "/transferMoney": RouteFormat(fields=_COMMON_FIELDS + ("retry_after_seconds", "velocity_limit_exceeded")),
+    "/getSubscriptionRecommendation": RouteFormat(
+        fields=_COMMON_FIELDS + ("recommendation",),
+        item_fields={"recommendation": ("id", "name", "price", "description")},
+    ),
+}
+
+
+def _load_overrides(raw: Optional[str]) -> None:
+    if not raw:
+        return
+    for route, options in json_codec.loads(raw).items():
+        options = dict(options)
+        if "fields" in options:
+            options["fields"] = tuple(options["fields"])
+        if "item_fields" in options:
+            options["item_fields"] = {k: tuple(v) for k, v in options["item_fields"].items()}
+        ROUTE_FORMATS[route] = replace(ROUTE_FORMATS.get(route, RouteFormat()), **options)
+
+
+_load_overrides(os.getenv("TOOL_RESPONSE_ROUTES"))
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _shorten(value: Any) -> Any:
+    if isinstance(value, str) and len(value) > MAX_STRING_CHARS:
+        return value[:MAX_STRING_CHARS - 1] + "…"
+    return value
+
+
+def _pick(item: Any, keep: Optional[Tuple[str, ...]]) -> Any:
+    if not isinstance(item, dict) or keep is None:
+        return _shorten(item)
+    return {k: _shorten(item[k]) for k in keep if k in item and not _is_empty(item[k])}
+
+
+def compact_body(api_path: str, body: Any) -> Any:
+    """Whitelisted, truncated view of a backend body for api_path."""
+    if not isinstance(body, dict):
+        return _shorten(body)
+    route = ROUTE_FORMATS.get(api_path.rstrip("/") or "/", RouteFormat())
+    result: Dict[str, Any] = {}
+    for name in route.fields:
+        value = body.get(name)
+        if _is_empty(value):
+            continue
+        keep = route.item_fields.get(name)
+        if isinstance(value, list):
+            result[name] = [_pick(item, keep) for item in value[:route.list_limit]]
+            if len(value) > route.list_limit:
+                result[f"{name}_total"] = len(value)
+        else:
+            result[name] = _pick(value, keep)
+    return result
+
+
+def _compact_details(details: Dict[str, Any], body: Any) -> Dict[str, Any]:
+    body_values = list(body.values()) if isinstance(body, dict) else [body]
+    nested = [v for value in body_values if isinstance(value, dict) for v in value.values()]
+    kept = {}
+    for name, value in details.items():
+        if name == "rawBody" or _is_empty(value):
+            continue
+        if isinstance(body, dict) and name in body:
+            continue
+        # Same value already visible in the body (e.g. transfer_message == message)
+        if not isinstance(value, bool) and (value in body_values or value in nested):
+            continue
+        kept[name] = _shorten(value)
+    return kept
+
+
+def build_tool_text(api_path: str, result: Dict[str, Any], mode: Optional[str] = None) -> str:
+    """Text returned to the agent for a tool call.
+
+    result holds the adapter's verbose fields: actionStatus, shouldRetry,
+    httpStatusCode, details, responseBody and error.
+    """
+    if (mode or TOOL_RESPONSE_FORMAT) == "full":
+        return json_codec.dumps(result)
+
+    body = compact_body(api_path, result.get("responseBody"))
+    text: Dict[str, Any] = {"actionStatus": result.get("actionStatus"), "shouldRetry": result.get("shouldRetry")}
+    status_code = result.get("httpStatusCode")
+    if status_code is not None and not 200 <= int(status_code) < 300:
+        text["httpStatusCode"] = int(status_code)
+    if not _is_empty(body):
+        text["responseBody"] = body
+    details = _compact_details(result.get("details") or {}, body)
+    if details:
+        text["details"] = details
+    if result.get("error"):
+        text["error"] = _shorten(str(result["error"]))
+    return json_codec.dumps(text)
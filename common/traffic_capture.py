@@ -0,0 +1,135 @@
+"""Opt-in capture of action-group traffic for offline replay.
+
+Synthetic tool events miss the shapes Bedrock really sends (requestBody
+properties vs top-level parameters, camelCase vs snake_case names, numbers
+typed in every national format). With ACTION_CAPTURE_PATH set, the action-group
+handlers append each event and its response to that JSONL file, one record per
+line, for tools/replay_action_traffic.py to feed to any handler version.
+
+Records are sanitized before they are written:
+  * phone numbers are tokenized: the last TOKEN_DIGITS digits are replaced by
+    digits derived from a keyed hash (ACTION_CAPTURE_SALT) of the E.164 number.
+    The format is kept (``0891234567`` stays ``089xxxxxxx``), and a number gets the
+    same token everywhere, so replays keep who-pays-whom relationships;
+  * session ids are replaced by a hash;
+  * amounts are left alone, even when they look like phone numbers.
+
+ACTION_CAPTURE_SAMPLE_RATE (0..1, default 1) captures only a fraction of the calls.
+"""
+import functools
+import hashlib
+import hmac
+import logging
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+import json_codec
+from phone_numbers import DEFAULT_COUNTRY_CODE, normalize_phone
+
+logger = logging.getLogger()
+
+CAPTURE_PATH_ENV = "ACTION_CAPTURE_PATH"
+CAPTURE_SAMPLE_RATE_ENV = "ACTION_CAPTURE_SAMPLE_RATE"
+CAPTURE_SALT_ENV = "ACTION_CAPTURE_SALT"
+
+# Digits of the subscriber number that are replaced (the operator prefix is kept)
+TOKEN_DIGITS = 7
+
+_PHONE_CANDIDATE = re.compile(r"(?<![\w+])(?:\+|00)?\d[\d\s\-.()]{6,}\d(?!\w)")
+_write_lock = threading.Lock()
+
+
+def _salt() -> bytes:
+    return os.getenv(CAPTURE_SALT_ENV, "capture").encode("utf-8")
+
+
+def tokenize_phone(raw: str) -> Optional[str]:
+    """raw with its last TOKEN_DIGITS digits replaced by a stable token, or None if raw is not a phone number."""
+    e164 = normalize_phone(raw)
+    # A bare run of digits is only a phone number in the default country (not an amount or an id)
+    if not e164 or (not e164.startswith("+" + DEFAULT_COUNTRY_CODE) and not raw.lstrip().startswith(("+", "00"))):
+        return None
+    digest = hmac.new(_salt(), e164.encode("utf-8"), hashlib.sha256).hexdigest()
+    token = f"{int(digest, 16) % 10 ** TOKEN_DIGITS:0{TOKEN_DIGITS}d}"
+    chars = list(raw)
+    positions = [i for i, c in enumerate(chars) if c.isdigit()][-TOKEN_DIGITS:]
+    for position, digit in zip(positions, token[-len(positions):]):
+        chars[position] = digit
+    return "".join(chars)
+
+
+def tokenize_text(text: str) -> str:
+    """Tokenize every phone number found in text."""
+    return _PHONE_CANDIDATE.sub(lambda m: tokenize_phone(m.group(0)) or m.group(0), text)
+
+
+def _hash_id(value: Any) -> str:
+    return "session-" + hmac.new(_salt(), str(value).encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+
+def sanitize(value: Any, key: Optional[str] = None) -> Any:
+    """Copy of value with phone numbers tokenized and session ids hashed."""
+    if isinstance(value, dict):
+        # Bedrock parameters: {"name": "amount", "type": "number", "value": "250000000"}
+        if "name" in value and "value" in value and "amount" in str(value["name"]).lower():
+            return dict(value)
+        return {k: sanitize(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [sanitize(v, key) for v in value]
+    if isinstance(value, str):
+        if key == "sessionId":
+            return _hash_id(value)
+        if key and "amount" in key.lower():
+            return value
+        # Tool texts carry JSON: sanitize its structure, not just the raw string
+        if value[:1] in ("{", "["):
+            try:
+                return json_codec.dumps(sanitize(json_codec.loads(value)))
+            except ValueError:
+                pass
+        return tokenize_text(value)
+    return value
+
+
+def capture_enabled() -> bool:
+    return bool(os.getenv(CAPTURE_PATH_ENV))
+
+
+def record(handler: str, event: Dict[str, Any], response: Any, duration_ms: float,
+           path: Optional[str] = None) -> None:
+    """Append one sanitized capture record to path (default: ACTION_CAPTURE_PATH)."""
+    path = path or os.getenv(CAPTURE_PATH_ENV)
+    line = json_codec.dumps({
+        "captured_at": datetime.utcnow().isoformat() + "Z",
+        "handler": handler,
+        "duration_ms": round(duration_ms, 3),
+        "event": sanitize(event),
+        "response": sanitize(response),
+    })
+    with _write_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def capture_handler(handler: str) -> Callable[[Callable], Callable]:
+    """Decorator for an action-group lambda_handler: captures its calls when ACTION_CAPTURE_PATH is set."""
+    def decorate(function: Callable[[Dict[str, Any], Any], Any]) -> Callable[[Dict[str, Any], Any], Any]:
+        @functools.wraps(function)
+        def wrapper(event: Dict[str, Any], context: Any) -> Any:
+            if not capture_enabled() or random.random() >= float(os.getenv(CAPTURE_SAMPLE_RATE_ENV, "1")):
+                return function(event, context)
+            started = time.perf_counter()
+            response = function(event, context)
+            try:
+                record(handler, event, response, (time.perf_counter() - started) * 1000)
+            except Exception as e:
+                # Capture is diagnostic: it must never fail the tool call
+                logger.warning("Could not capture %s call: %s", handler, e)
+            return response
+        return wrapper
+    return decorate
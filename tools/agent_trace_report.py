@@ -0,0 +1,55 @@
+"""Offline report of recorded Bedrock Agent traces.
+
+Reads a file written with AGENT_TRACE_RECORD_PATH (or a JSONL export of raw
+``trace`` events) and prints, for each turn, where the time went: model
+invocations, action groups, collaborator hand-offs and guardrails, per agent.
+
+Usage:
+    python tools/agent_trace_report.py traces.jsonl
+    python tools/agent_trace_report.py traces.jsonl --timeline
+    python tools/agent_trace_report.py traces.jsonl --json
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'agent-api-gateway-deployement'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from agent_trace import replay_trace_file  # noqa: E402
+
+
+def print_turn(index, summary, timeline):
+    print(f"Turn {index} (session {summary.get('sessionId') or '-'}): "
+          f"{summary['totalMs']:.0f} ms, {summary['events']} trace events")
+    print(f"  {'agent':<24} {'model ms':>9} {'calls':>5} {'tool ms':>9} {'calls':>5} "
+          f"{'collab ms':>9} {'guard ms':>8} {'tok in':>7} {'tok out':>7}")
+    for agent, t in summary['agents'].items():
+        print(f"  {agent:<24} {t['modelMs']:>9.0f} {t['modelCalls']:>5} {t['toolMs']:>9.0f} {t['toolCalls']:>5} "
+              f"{t['collaboratorMs']:>9.0f} {t['guardrailMs']:>8.0f} {t['inputTokens']:>7} {t['outputTokens']:>7}")
+    if timeline:
+        for step in summary['timeline']:
+            duration = step['durationMs']
+            print(f"    +{step['startMs']:>8.0f} ms  {step['agent']:<20} {step['kind']:<18} "
+                  f"{'' if duration is None else f'{duration:.0f} ms':>9}  {step['name']}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='JSONL trace file')
+    parser.add_argument('--timeline', action='store_true', help='also print every step')
+    parser.add_argument('--json', action='store_true', help='print the summaries as JSON')
+    args = parser.parse_args()
+
+    summaries = replay_trace_file(args.path)
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+        return
+    for index, summary in enumerate(summaries, 1):
+        print_turn(index, summary, args.timeline)
+
+
+if __name__ == '__main__':
+    main()
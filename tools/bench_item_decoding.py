@@ -0,0 +1,140 @@
+"""Benchmark du décodage des items lus sur le chemin critique (METADATA, forfait du catalogue).
+
+Compare, pour un même item au format typé DynamoDB :
+  * resource   : TypeDeserializer de boto3 (couche resource), puis conversion des
+                 soldes en float comme le faisait /checkBalance (si boto3 est installé) ;
+  * generique  : storage.deserialize_item + projection + conversion en float
+                 (l'ancien chemin du client bas niveau) ;
+  * specialise : storage.decode_balance_projection / decode_catalog_plan.
+
+Le benchmark mesure aussi get_item de bout en bout sur SQLiteStorage (items stockés
+au format typé), avec et sans décodeur. Les résultats des trois décodages sont
+comparés avant la mesure.
+
+Usage :
+    python tools/bench_item_decoding.py
+    python tools/bench_item_decoding.py --subs 15 --iterations 50000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'business-api-gateway-backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from storage import (BALANCE_PROJECTION, SQLiteStorage, _project, decode_balance_projection,  # noqa: E402
+                     decode_catalog_plan, deserialize_item, serialize_item)
+
+try:
+    from boto3.dynamodb.types import TypeDeserializer
+except ImportError:
+    TypeDeserializer = None
+
+
+def metadata_item(subs):
+    """Profil METADATA avec subs forfaits actifs et les attributs non projetés d'un vrai profil."""
+    return {
+        'PK': 'USER#+243891234567', 'SK': 'METADATA', 'Type': 'USER_PROFILE', 'phone': '+243891234567',
+        'balance_credit': Decimal('15.75'), 'balance_mobile_money': Decimal('25000.5'),
+        'active_subs': [
+            {'id': f'F_D_{i}GB', 'name': f'Forfait Data {i}GB', 'activation_date': '2025-11-15T10:00:00',
+             'expiration_date': '2025-11-22T10:00:00', 'auto_renew': i % 2 == 0}
+            for i in range(subs)
+        ],
+    }
+
+
+PLAN_ITEM = {
+    'PK': 'DATA', 'SK': 'F_D_1GB', 'Type': 'SUBSCRIPTION', 'name': 'Forfait Data 1GB',
+    'description': '1 GB de données internet, valable 7 jours.', 'price': Decimal('5'), 'duration_days': Decimal('7'),
+}
+
+
+def to_response(item):
+    """Conversion faite par les handlers après un décodage en Decimal."""
+    return dict(item, **{k: float(item[k]) for k in ('balance_credit', 'balance_mobile_money') if k in item})
+
+
+def generic_balance(raw):
+    return to_response(_project(deserialize_item(raw), BALANCE_PROJECTION))
+
+
+def resource_balance(deserializer):
+    def decode(raw):
+        item = {k: deserializer.deserialize(v) for k, v in raw.items()}
+        return to_response(_project(item, BALANCE_PROJECTION))
+    return decode
+
+
+def resource_plan(deserializer):
+    return lambda raw: {k: deserializer.deserialize(v) for k, v in raw.items()}
+
+
+def measure(function, arg, iterations):
+    """Microsecondes par appel (meilleur de 3 séries)."""
+    best = float('inf')
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            function(arg)
+        best = min(best, (time.perf_counter() - started) / iterations)
+    return best * 1e6
+
+
+def print_rows(title, rows):
+    print(f'\n{title}')
+    baseline = rows[0][1]
+    for name, micros in rows:
+        print(f'  {name:<12} {micros:>9.2f} µs/item   x{baseline / micros:.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subs', type=int, default=5, help='forfaits actifs du profil METADATA')
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    raw_metadata = serialize_item(metadata_item(args.subs))
+    raw_plan = serialize_item(PLAN_ITEM)
+
+    balance_decoders = [('generique', generic_balance), ('specialise', decode_balance_projection)]
+    plan_decoders = [('generique', deserialize_item), ('specialise', decode_catalog_plan)]
+    if TypeDeserializer is not None:
+        deserializer = TypeDeserializer()
+        balance_decoders.insert(0, ('resource', resource_balance(deserializer)))
+        plan_decoders.insert(0, ('resource', resource_plan(deserializer)))
+    else:
+        print('boto3 absent : la couche resource n\'est pas mesurée (le chemin generique en est l\'équivalent)')
+
+    # Mêmes valeurs de réponse quel que soit le décodage
+    expected = decode_balance_projection(raw_metadata)
+    for name, decoder in balance_decoders:
+        assert decoder(raw_metadata) == expected, name
+    for name, decoder in plan_decoders:
+        plan = decoder(raw_plan)
+        assert (plan['name'], Decimal(plan['price']), int(plan['duration_days'])) == ('Forfait Data 1GB', 5, 7), name
+
+    print(f'Décodage seul ({args.iterations} items, METADATA avec {args.subs} forfaits)')
+    print_rows('METADATA projeté', [(name, measure(decoder, raw_metadata, args.iterations))
+                                    for name, decoder in balance_decoders])
+    print_rows('Forfait du catalogue', [(name, measure(decoder, raw_plan, args.iterations))
+                                        for name, decoder in plan_decoders])
+
+    storage = SQLiteStorage(os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    storage.put_item('TelcoData', metadata_item(args.subs))
+    key = {'PK': 'USER#+243891234567', 'SK': 'METADATA'}
+    attributes = list(BALANCE_PROJECTION)
+    print_rows('get_item METADATA sur SQLite (lecture, projection et décodage)', [
+        ('generique', measure(lambda _: to_response(storage.get_item('TelcoData', key, attributes)),
+                              None, args.iterations)),
+        ('specialise', measure(lambda _: storage.get_item('TelcoData', key, attributes,
+                                                          decoder=decode_balance_projection),
+                               None, args.iterations)),
+    ])
+
+
+if __name__ == '__main__':
+    main()
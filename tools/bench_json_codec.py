@@ -0,0 +1,146 @@
+"""Benchmark of common/json_codec.py on the JSON the handlers encode and decode.
+
+For each payload type, compares:
+  * json       : the stdlib calls the handlers made before (``default=str`` where they used it);
+  * stdlib     : json_codec with JSON_CODEC=stdlib (fallback when orjson is missing);
+  * orjson     : json_codec with orjson (when it is installed).
+
+Every codec is checked to decode back to the same value as the old call first
+(Decimal compared as numbers, since ``default=str`` wrote them as strings).
+
+Usage:
+    python tools/bench_json_codec.py
+    python tools/bench_json_codec.py --iterations 20000
+"""
+import argparse
+import importlib.util
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+CODEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common', 'json_codec.py')
+
+
+def load_codec(mode):
+    """A separate instance of json_codec with JSON_CODEC=mode."""
+    previous = os.environ.get('JSON_CODEC')
+    os.environ['JSON_CODEC'] = mode
+    try:
+        spec = importlib.util.spec_from_file_location(f'json_codec_{mode}', CODEC_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if previous is None:
+            os.environ.pop('JSON_CODEC', None)
+        else:
+            os.environ['JSON_CODEC'] = previous
+    return module if module.CODEC == mode else None
+
+
+def subscriptions(count):
+    start = datetime(2025, 11, 15, 10, 0, 0)
+    return [{'id': f'F_D_{i}GB', 'name': f'Forfait Data {i}GB', 'activation_date': start.isoformat() + 'Z',
+             'expiration_date': (start + timedelta(days=7)).isoformat() + 'Z', 'auto_renew': i % 2 == 0}
+            for i in range(count)]
+
+
+def payloads():
+    """(name, operation, value, old stdlib call) per payload type the handlers serialize."""
+    check_balance = {'status': 'success', 'balance_credit': 15.75, 'balance_mobile_money': 25000.5,
+                     'active_subscriptions': subscriptions(5)}
+    history = {'status': 'success', 'transactions': [
+        {'type': 'TRANSFER_OUT', 'amount': Decimal('1500.50'), 'target': '+243859876543', 'status': 'COMPLETED',
+         'timestamp': (datetime(2025, 11, 1) + timedelta(minutes=37 * i)).isoformat()}
+        for i in range(50)]}
+    bulk_job = {'job_id': 'c0ffee00-1234', 'status': 'running', 'total': 5000, 'done': 1234,
+                'amount_debited': Decimal('61700.00'), 'running_seconds': Decimal('42.317'),
+                'updated_at': datetime(2025, 11, 15, 10, 0, 0), 'failures': [
+                    {'phone_number': f'+24389{i:07d}', 'code': 'INSUFFICIENT_FUNDS'} for i in range(20)]}
+    action_event = {
+        'messageVersion': '1.0', 'agent': {'name': 'SubscriptionAgent', 'id': 'ABCDEFGHIJ', 'alias': 'TSTALIASID',
+                                           'version': 'DRAFT'},
+        'sessionId': '123456789012345', 'sessionAttributes': {}, 'promptSessionAttributes': {},
+        'inputText': 'Active le forfait F_D_1GB pour +243891234567', 'actionGroup': 'SubscriptionActions',
+        'apiPath': '/activateSubscription', 'httpMethod': 'POST',
+        'requestBody': {'content': {'application/json': {'properties': [
+            {'name': 'phone_number', 'type': 'string', 'value': '+243891234567'},
+            {'name': 'subscription_id', 'type': 'string', 'value': 'F_D_1GB'}]}}},
+    }
+    tool_text = {'actionStatus': 'COMPLETED', 'shouldRetry': False, 'responseBody': dict(
+        check_balance, active_subscriptions_total=5, message='Solde récupéré avec succès')}
+    agent_answer = {'status': 'success', 'sessionId': 'b4c1f7e2-0a53-4c4e-9d61-2f5c1a7d9e30',
+                    'message': 'Votre solde est de 15,75 FC de crédit et 25 000,50 FC en mobile money. '
+                               'Vous avez 5 forfaits actifs, dont Forfait Data 1GB qui expire le 22/11/2025. ' * 3,
+                    'timestamp': datetime(2025, 11, 15, 10, 0, 0).isoformat()}
+    gateway_body = json.dumps({'phone_number': '+243891234567', 'subscription_id': 'F_D_1GB'})
+    backend_response = json.dumps(check_balance).encode('utf-8')
+    return [
+        ('API Gateway body (loads)', 'loads', gateway_body, lambda v: json.loads(v)),
+        ('backend response (loads)', 'loads', backend_response, lambda v: json.loads(v.decode('utf-8'))),
+        ('checkBalance response', 'dumps', check_balance, lambda v: json.dumps(v)),
+        ('history, 50 Decimal amounts', 'dumps', history, lambda v: json.dumps(v, default=str)),
+        ('bulk job, Decimal + datetime', 'dumps', bulk_job, lambda v: json.dumps(v, default=str)),
+        ('action-group event log', 'dumps', action_event, lambda v: json.dumps(v, default=str)),
+        ('compact tool text', 'dumps', tool_text,
+         lambda v: json.dumps(v, default=str, ensure_ascii=False, separators=(',', ':'))),
+        ('ask-agent response', 'dumps', agent_answer, lambda v: json.dumps(v)),
+    ]
+
+
+def comparable(value):
+    """Decoded value with numbers written as strings by default=str turned back into numbers."""
+    if isinstance(value, dict):
+        return {k: comparable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [comparable(v) for v in value]
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value.replace(' ', 'T')
+    return value
+
+
+def measure(function, arg, iterations):
+    """Microseconds per call (best of 3 runs)."""
+    best = float('inf')
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            function(arg)
+        best = min(best, (time.perf_counter() - started) / iterations)
+    return best * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=10000)
+    args = parser.parse_args()
+
+    codecs = [(mode, load_codec(mode)) for mode in ('stdlib', 'orjson')]
+    codecs = [(mode, codec) for mode, codec in codecs if codec is not None]
+    if len(codecs) == 1:
+        print('orjson is not installed: only the stdlib fallback is measured')
+
+    header = f"{'payload':<32} {'bytes':>6} {'json µs':>9}"
+    for mode, _ in codecs:
+        header += f" {mode + ' µs':>10} {'x':>5}"
+    print(header)
+    for name, operation, value, old_call in payloads():
+        expected = comparable(old_call(value) if operation == 'loads' else json.loads(old_call(value)))
+        size = len(value) if operation == 'loads' else len(old_call(value).encode('utf-8'))
+        baseline = measure(old_call, value, args.iterations)
+        row = f"{name:<32} {size:>6} {baseline:>9.2f}"
+        for mode, codec in codecs:
+            function = codec.loads if operation == 'loads' else codec.dumps
+            result = function(value) if operation == 'loads' else json.loads(function(value))
+            assert comparable(result) == expected, (name, mode)
+            micros = measure(function, value, args.iterations)
+            row += f" {micros:>10.2f} {baseline / micros:>5.1f}"
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
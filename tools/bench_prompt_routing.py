@@ -0,0 +1,163 @@
+"""Routing regression benchmark for compacted agent prompts.
+
+Compacting the router instructions must not change which collaborator a
+request is routed to. For each prompt variant (original, then every level of
+prompt_profiler.py), this benchmark replays a fixed labelled set of user
+requests (tools/prompt_routing_cases.jsonl) and compares:
+
+  * offline (default): the routing rules the variant still states — the
+    per-agent "Keywords:" lists, the ROUTING LOGIC lines and the routing
+    decision matrix — applied to each request as a keyword router;
+  * live (--live): the collaborators the deployed router actually invoked,
+    read from the orchestration trace, for one agent alias per variant
+    (deploy each variant to its own alias first).
+
+A variant passes when every decision matches the original's and its token
+total is lower. The exit status is non-zero when a variant fails.
+
+Usage:
+    python tools/bench_prompt_routing.py
+    python tools/bench_prompt_routing.py --live --agent-id ROUTER_ID \\
+        --alias original=ALIAS1 --alias aggressive=ALIAS2
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'agent-api-gateway-deployement'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from prompt_profiler import CONTEXT_GROUPS, LEVELS, compact_prompts, estimate_tokens, read_prompts  # noqa: E402
+
+CASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prompt_routing_cases.jsonl')
+
+_AGENT_HEADER_RE = re.compile(r'^\s*\d+\.\s*(?:\*\*)?([A-Za-z ]+Agent)(?:\*\*)?\s+-')
+_KEYWORDS_RE = re.compile(r'^\s*-?\s*Keywords:\s*(.+)$')
+_LOGIC_RE = re.compile(r'If request mentions (.+?)→\s*Route to ([A-Za-z ]+Agent)')
+_MATRIX_RE = re.compile(r'^\|\s*([^|]+?)\s*\|\s*([A-Za-z]+Agent)\s*\|')
+
+
+def canonical_agent(name):
+    return name.replace(' ', '')
+
+
+def extract_routing_rules(text):
+    """Map every routing keyword stated in text to the agent it routes to."""
+    rules = {}
+    current_agent = None
+    for line in text.splitlines():
+        header = _AGENT_HEADER_RE.match(line)
+        if header:
+            current_agent = canonical_agent(header.group(1))
+        keywords = _KEYWORDS_RE.match(line)
+        if keywords and current_agent:
+            for keyword in keywords.group(1).split(','):
+                rules.setdefault(keyword.strip().lower(), current_agent)
+        logic = _LOGIC_RE.search(line)
+        if logic:
+            for keyword in re.findall(r'"([^"]+)"', logic.group(1)):
+                rules.setdefault(keyword.lower(), canonical_agent(logic.group(2)))
+        matrix = _MATRIX_RE.match(line.strip())
+        if matrix and 'Keywords' not in matrix.group(1):
+            for keyword in matrix.group(1).split(','):
+                rules.setdefault(keyword.strip().lower(), matrix.group(2))
+    return {keyword: agent for keyword, agent in rules.items() if keyword}
+
+
+def route(rules, prompt):
+    """Agents a request is routed to, in the order their first keyword appears."""
+    text = prompt.lower()
+    first_seen = {}
+    for keyword, agent in rules.items():
+        match = re.search(r'(?<!\w)' + re.escape(keyword), text)
+        if match and match.start() < first_seen.get(agent, len(text) + 1):
+            first_seen[agent] = match.start()
+    return sorted(first_seen, key=first_seen.get)
+
+
+def router_context(prompts):
+    return '\n'.join(prompts[rel] for rel in CONTEXT_GROUPS['router'] if rel in prompts)
+
+
+def offline_decisions(prompts, cases):
+    rules = extract_routing_rules(router_context(prompts))
+    return [route(rules, case['prompt']) for case in cases]
+
+
+def live_decisions(agent_id, alias_id, cases):
+    """Collaborators invoked by a deployed router alias, read from the orchestration trace."""
+    import boto3
+    from agent_trace import TraceCollector
+
+    client = boto3.client('bedrock-agent-runtime')
+    decisions = []
+    for case in cases:
+        collector = TraceCollector()
+        response = client.invoke_agent(agentId=agent_id, agentAliasId=alias_id, sessionId=str(uuid.uuid4()),
+                                       inputText=case['prompt'], enableTrace=True)
+        for event in response['completion']:
+            if 'trace' in event:
+                collector.add(event['trace'])
+        routed = []
+        for step in collector.summary()['timeline']:
+            if step['kind'] == 'collaborator' and step['name'] not in routed:
+                routed.append(step['name'])
+        decisions.append(routed)
+    return decisions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', default=CASES_PATH)
+    parser.add_argument('--live', action='store_true', help='query deployed aliases instead of the offline router')
+    parser.add_argument('--agent-id', help='router agent id (--live)')
+    parser.add_argument('--alias', action='append', default=[], metavar='VARIANT=ALIAS_ID',
+                        help='alias serving each variant (--live); "original" is the reference')
+    parser.add_argument('--verbose', action='store_true', help='print every decision')
+    args = parser.parse_args()
+
+    with open(args.cases, encoding='utf-8') as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    original = read_prompts()
+    variants = {'original': original}
+    variants.update((level, compact_prompts(original, level)) for level in LEVELS)
+    aliases = dict(item.split('=', 1) for item in args.alias)
+    if args.live:
+        if not args.agent_id or 'original' not in aliases:
+            parser.error('--live needs --agent-id and --alias original=...')
+        variants = {name: prompts for name, prompts in variants.items() if name in aliases}
+
+    results = {}
+    for name, prompts in variants.items():
+        decisions = (live_decisions(args.agent_id, aliases[name], cases) if args.live
+                     else offline_decisions(prompts, cases))
+        results[name] = {
+            'decisions': decisions,
+            'tokens': sum(estimate_tokens(text) for text in prompts.values()),
+            'router_tokens': estimate_tokens(router_context(prompts)),
+            'correct': sum(d == case['expected'] for d, case in zip(decisions, cases)),
+        }
+
+    reference = results['original']
+    failed = False
+    print(f"{len(cases)} labelled requests, {'live' if args.live else 'offline'} routing\n")
+    print(f"{'variant':<12} {'tokens':>7} {'router':>7} {'saved':>7} {'labels ok':>10} {'same as original':>17}")
+    for name, result in results.items():
+        same = sum(a == b for a, b in zip(result['decisions'], reference['decisions']))
+        saved = 1 - result['tokens'] / reference['tokens']
+        ok = name == 'original' or (same == len(cases) and result['tokens'] < reference['tokens'])
+        failed = failed or not ok
+        print(f"{name:<12} {result['tokens']:>7} {result['router_tokens']:>7} {saved:>7.1%} "
+              f"{result['correct']:>5}/{len(cases):<4} {same:>10}/{len(cases):<4} {'' if ok else ' REGRESSION'}")
+        for decision, expected, case in zip(result['decisions'], reference['decisions'], cases):
+            if decision != expected or (args.verbose and name == 'original'):
+                print(f"    {case['prompt'][:60]!r}: {decision} (original: {expected}, label: {case['expected']})")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
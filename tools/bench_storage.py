@@ -0,0 +1,171 @@
+"""Benchmark du stockage : compare les backends sur les opérations des handlers.
+
+Mesure get_item (METADATA projeté), query et scan du catalogue, et les deux
+transactions du hot path (activation de forfait et transfert d'argent). Le
+transfert est aussi mesuré avec ses compteurs de vélocité (velocity_limits.py,
+plafonds hors d'atteinte) pour chiffrer le surcoût des limites.
+
+Usage :
+    python tools/bench_storage.py --backends memory sqlite --iterations 2000 --threads 4
+    python tools/bench_storage.py --backends dynamodb --endpoint-url http://localhost:8000
+
+Le backend dynamodb suppose que les tables TelcoData et Catalog existent
+(DynamoDB Local ou un compte de test) ; les utilisateurs créés sont préfixés BENCH.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'business-api-gateway-backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from storage import (DynamoDBStorage, InMemoryStorage, SQLiteStorage,  # noqa: E402
+                     TransactionCancelled, put_op, update_op)
+from velocity_limits import WINDOWS, velocity_ops  # noqa: E402
+
+DATA_TABLE = os.environ.get('DYNAMO_TABLE_DATA_NAME', 'TelcoData')
+CATALOG_TABLE = os.environ.get('DYNAMO_TABLE_CATALOG_NAME', 'Catalog')
+
+PLANS = [
+    ('DATA', 'F_D_1GB', 'Forfait Data 1GB', 5, 7),
+    ('DATA', 'F_D_5GB', 'Forfait Data 5GB', 18, 30),
+    ('PACK', 'F_P_MINI', 'Pack Mini Hebdo', 8, 7),
+    ('VOIX_SMS', 'F_V_200M', 'Pack Voix & SMS 200', 10, 7),
+]
+
+# Mêmes fenêtres et conditions qu'en production, avec des plafonds jamais atteints
+BENCH_WINDOWS = [window._replace(max_count=10 ** 9, max_amount=Decimal(10 ** 12)) for window in WINDOWS]
+
+
+def make_backend(name, args):
+    if name == 'memory':
+        return InMemoryStorage()
+    if name == 'sqlite':
+        return SQLiteStorage(args.sqlite_path or os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    if name == 'dynamodb':
+        return DynamoDBStorage(endpoint_url=args.endpoint_url)
+    raise ValueError(name)
+
+
+def user_key(i):
+    return {'PK': f'USER#BENCH{i:07d}', 'SK': 'METADATA'}
+
+
+def seed(storage, users):
+    for category, plan_id, name, price, days in PLANS:
+        storage.put_item(CATALOG_TABLE, {
+            'PK': category, 'SK': plan_id, 'Type': 'SUBSCRIPTION', 'name': name,
+            'description': name, 'price': Decimal(price), 'duration_days': Decimal(days)})
+    for i in range(users):
+        storage.put_item(DATA_TABLE, dict(user_key(i), **{
+            'Type': 'USER_PROFILE', 'balance_credit': Decimal('1000000'),
+            'balance_mobile_money': Decimal('1000000'), 'active_subs': []}))
+
+
+def build_operations(storage, users):
+    counter = iter(range(10 ** 12))
+
+    def get_item():
+        storage.get_item(DATA_TABLE, user_key(next(counter) % users),
+                         attributes=['balance_credit', 'balance_mobile_money', 'active_subs'])
+
+    def query_catalog():
+        storage.query(CATALOG_TABLE, 'DATA')
+
+    def scan_catalog():
+        storage.scan(CATALOG_TABLE, filters={'SK': 'F_P_MINI'})
+
+    def activate():
+        n = next(counter)
+        key = user_key(n % users)
+        storage.transact_write([
+            update_op(DATA_TABLE, key, increment={'balance_credit': Decimal(-5)},
+                      append={'active_subs': [{'id': 'F_D_1GB', 'name': 'Forfait Data 1GB'}]},
+                      require_exists=True, require_min={'balance_credit': Decimal(5)}),
+            put_op(DATA_TABLE, {'PK': key['PK'], 'SK': f'TRANS#BENCH{n:012d}', 'Type': 'TRANSACTION',
+                                'amount': Decimal(-5), 'transaction_type': 'SUBSCRIPTION_ACTIVATION'}),
+        ])
+
+    def transfer_ops():
+        n = next(counter)
+        source, target = user_key(n % users), user_key((n + 1) % users)
+        return source, [
+            update_op(DATA_TABLE, source, increment={'balance_mobile_money': Decimal(-1)},
+                      require_exists=True, require_min={'balance_mobile_money': Decimal(1)}),
+            update_op(DATA_TABLE, target, increment={'balance_mobile_money': Decimal(1)}, require_exists=True),
+            put_op(DATA_TABLE, {'PK': source['PK'], 'SK': f'TRANS#BENCH{n:012d}', 'Type': 'TRANSACTION',
+                                'amount': Decimal(-1), 'transaction_type': 'MOBILE_MONEY_TRANSFER_SENT'}),
+        ]
+
+    def transfer():
+        storage.transact_write(transfer_ops()[1])
+
+    def transfer_velocity():
+        source, ops = transfer_ops()
+        checks = velocity_ops(source['PK'][len('USER#'):], Decimal(1), time.time(), BENCH_WINDOWS)
+        storage.transact_write(ops + [op for _, op in checks])
+
+    return {'get_item': get_item, 'query': query_catalog, 'scan': scan_catalog,
+            'transact_activate': activate, 'transact_transfer': transfer,
+            'transfer_velocity': transfer_velocity}
+
+
+def run(operation, iterations, threads):
+    """Exécute operation iterations fois ; retourne (latences en ms, durée totale, échecs)."""
+    def timed(_):
+        start = time.perf_counter()
+        try:
+            operation()
+            failed = False
+        except TransactionCancelled:
+            failed = True
+        return (time.perf_counter() - start) * 1000, failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(timed, range(iterations)))
+    elapsed = time.perf_counter() - started
+    return [r[0] for r in results], elapsed, sum(1 for r in results if r[1])
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', default=['memory', 'sqlite'],
+                        choices=['memory', 'sqlite', 'dynamodb'])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--sqlite-path', help='Fichier SQLite (par défaut : répertoire temporaire)')
+    parser.add_argument('--endpoint-url', help='Endpoint DynamoDB (ex. DynamoDB Local)')
+    args = parser.parse_args()
+
+    print(f"{'backend':<10} {'operation':<18} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'cancel':>7}")
+    overheads = []
+    for name in args.backends:
+        storage = make_backend(name, args)
+        seed(storage, args.users)
+        p50 = {}
+        for op_name, operation in build_operations(storage, args.users).items():
+            latencies, elapsed, failures = run(operation, args.iterations, args.threads)
+            p50[op_name] = percentile(latencies, 50)
+            print(f"{name:<10} {op_name:<18} {len(latencies) / elapsed:>10.0f} "
+                  f"{percentile(latencies, 50):>9.3f} {percentile(latencies, 95):>9.3f} "
+                  f"{percentile(latencies, 99):>9.3f} {statistics.fmean(latencies):>9.3f} {failures:>7}")
+        overheads.append((name, p50['transfer_velocity'] - p50['transact_transfer'], p50['transact_transfer']))
+    print()
+    for name, overhead, base in overheads:
+        print(f"{name:<10} surcoût des limites de vélocité (p50) : {overhead:+.3f} ms ({overhead / base:+.1%})")
+
+
+if __name__ == '__main__':
+    main()
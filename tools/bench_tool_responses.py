@@ -0,0 +1,139 @@
+"""Tokens and latency per tool call: verbose vs compact tool-response text.
+
+Runs each action-group Lambda end to end against the business handlers,
+served in-process by dispatch_app from the in-memory backend and the seed
+data. The run is repeated in every TOOL_RESPONSE_FORMAT mode (full = previous
+verbose text, compact = common/tool_response.py). For each tool call it
+reports:
+
+  * the characters and estimated tokens of the text the agent reads;
+  * the adapter latency (median and p95 of --iterations calls);
+  * the estimated model prefill time for that text at --prefill-tps tokens/s
+    (an estimate, not a measurement: prefill speed depends on the model).
+
+Usage:
+    python tools/bench_tool_responses.py
+    python tools/bench_tool_responses.py --iterations 500 --show-text
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('METRICS_ENABLED', 'false')
+for relative in ('common', 'business-api-gateway-backend', 'agents/money-transfer',
+                 'agents/subscriptions', 'agents/recommandation-agent', 'tools'):
+    sys.path.insert(0, os.path.join(ROOT, relative))
+
+import dispatch_app  # noqa: E402
+import moneyTransfer_agent_action_group_function_correct as transfer_action  # noqa: E402
+import recommandation_agent_action_group_function as recommendation_action  # noqa: E402
+import shared_resources  # noqa: E402
+import subscription_agent_action_group_function as subscription_action  # noqa: E402
+import tool_response  # noqa: E402
+from prompt_profiler import estimate_tokens  # noqa: E402
+from storage import load_seed_csv  # noqa: E402
+
+HEAVY_USER = '+243800000001'
+HEAVY_PLANS = ['F_D_1GB', 'F_D_5GB', 'F_P_MINI', 'F_V_50M', 'F_V_200M'] * 3
+
+SCENARIOS = [
+    ('checkBalance', subscription_action, '/checkBalance', {'customerId': '+243891234567'}),
+    ('checkBalance (15 subs)', subscription_action, '/checkBalance', {'customerId': HEAVY_USER}),
+    ('activateSubscription (error)', subscription_action, '/activateSubscription',
+     {'phoneNumber': '+243891234567', 'customerId': '+243891234567', 'planId': 'F_D_UNL'}),
+    ('getSubscriptionRecommendation', recommendation_action, '/getSubscriptionRecommendation',
+     {'customerId': '+243891234567'}),
+    ('transferMoney', transfer_action, '/transferMoney',
+     {'sourcePhone': HEAVY_USER, 'targetPhone': '+243851112229', 'amount': '1'}),
+    ('transferMoney (insufficient)', transfer_action, '/transferMoney',
+     {'sourcePhone': '+243851112229', 'targetPhone': '+243891234567', 'amount': '99999999'}),
+]
+
+
+def in_process_api_call(path, method='POST', body=None, timeout=10):
+    """Stand-in for the adapters' HTTP call: same event shape, served by dispatch_app."""
+    event = {'rawPath': path, 'requestContext': {'http': {'method': method}}, 'body': json.dumps(body or {})}
+    status, _, raw = dispatch_app.to_http_response(dispatch_app.lambda_handler(event, None))
+    return {'statusCode': status, 'body': json.loads(raw) if raw else None}
+
+
+def seed():
+    database = os.path.join(ROOT, 'database')
+    load_seed_csv(shared_resources.storage, shared_resources.DYNAMO_TABLE_DATA, os.path.join(database, 'TelcoData.csv'))
+    load_seed_csv(shared_resources.storage, shared_resources.DYNAMO_TABLE_CATALOG, os.path.join(database, 'Catalog.csv'))
+    shared_resources.storage.put_item(shared_resources.DYNAMO_TABLE_DATA, {
+        'PK': f'USER#{HEAVY_USER}', 'SK': 'METADATA', 'Type': 'USER_PROFILE',
+        'balance_credit': Decimal(100000), 'balance_mobile_money': Decimal(100000), 'active_subs': [],
+    })
+    for plan in HEAVY_PLANS:
+        in_process_api_call('/activateSubscription', body={'phone_number': HEAVY_USER, 'planId': plan})
+
+
+def tool_event(api_path, params):
+    return {
+        'messageVersion': '1.0', 'actionGroup': 'bench', 'apiPath': api_path, 'httpMethod': 'POST',
+        'requestBody': {'content': {'application/json': {
+            'properties': [{'name': k, 'type': 'string', 'value': v} for k, v in params.items()]}}},
+    }
+
+
+def measure(module, api_path, params, iterations):
+    event = tool_event(api_path, params)
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = module.lambda_handler(event, None)
+        timings.append((time.perf_counter() - started) * 1000)
+    text = response['response']['responseBody']['TEXT']['body']
+    timings.sort()
+    return {
+        'text': text,
+        'chars': len(text),
+        'tokens': estimate_tokens(text),
+        'p50_ms': statistics.median(timings),
+        'p95_ms': timings[int(0.95 * (len(timings) - 1))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--prefill-tps', type=float, default=2000.0,
+                        help='model prefill speed used for the latency estimate (tokens/s)')
+    parser.add_argument('--show-text', action='store_true', help='print the text of each mode')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    for module in (transfer_action, subscription_action, recommendation_action):
+        module._make_api_call = in_process_api_call
+    seed()
+
+    print(f"{'tool call':<32} {'mode':<8} {'chars':>6} {'tokens':>7} {'p50 ms':>8} {'p95 ms':>8} {'prefill ms':>11}")
+    totals = {}
+    for name, module, api_path, params in SCENARIOS:
+        for mode in ('full', 'compact'):
+            tool_response.TOOL_RESPONSE_FORMAT = mode
+            result = measure(module, api_path, params, args.iterations)
+            prefill_ms = result['tokens'] / args.prefill_tps * 1000
+            totals.setdefault(mode, [0, 0.0])
+            totals[mode][0] += result['tokens']
+            totals[mode][1] += result['p50_ms'] + prefill_ms
+            print(f"{name:<32} {mode:<8} {result['chars']:>6} {result['tokens']:>7} "
+                  f"{result['p50_ms']:>8.3f} {result['p95_ms']:>8.3f} {prefill_ms:>11.1f}")
+            if args.show_text:
+                print(f"    {result['text']}")
+    full_tokens, compact_tokens = totals['full'][0], totals['compact'][0]
+    print(f"\nTotal tokens per {len(SCENARIOS)} calls: {full_tokens} -> {compact_tokens} "
+          f"({1 - compact_tokens / full_tokens:.1%} fewer); "
+          f"adapter p50 + estimated prefill: {totals['full'][1]:.1f} ms -> {totals['compact'][1]:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
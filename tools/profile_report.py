@@ -0,0 +1,165 @@
+"""Merge handler profiles (common/handler_profiler.py) into one report and flame graph.
+
+Reads the profile records of a sink (a directory, an S3 prefix or JSON files)
+and prints, for the selected records:
+  * the number of profiles, the duration and peak-memory distribution per handler and route;
+  * the functions with the most self and inclusive time, over all stacks;
+  * call counts from cProfile records, and the allocation sites holding the most memory.
+
+--folded writes the merged stacks in the folded format (``a;b;c <µs>``) read by
+flamegraph.pl, inferno or speedscope. Sampling and cProfile records both count
+microseconds, so they can be merged.
+
+Usage:
+    python tools/profile_report.py --source dir:/tmp/handler-profiles
+    python tools/profile_report.py --source s3://my-bucket/profiles --handler transferMoney \\
+        --since 2025-11-15 --folded transfer.folded
+    flamegraph.pl transfer.folded > transfer.svg
+    python tools/profile_report.py record1.json record2.json --by-handler --folded all.folded
+"""
+import argparse
+import os
+import sys
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+import json_codec  # noqa: E402
+from handler_profiler import HANDLER_PROFILE_SINK, create_sink  # noqa: E402
+
+
+def load_records(source, files, handler=None, since=None):
+    """Profile records from files, or from the sink source (keys under handler/ if given)."""
+    if files:
+        for path in files:
+            with open(path, 'rb') as f:
+                yield json_codec.loads(f.read())
+        return
+    sink = create_sink(source)
+    for key in sink.list(f'{handler}/' if handler else ''):
+        # Keys are {handler}/{YYYY-MM-DD}/...: skip older days without reading them
+        parts = key.split('/')
+        if since and len(parts) > 2 and parts[1] < since[:10]:
+            continue
+        data = sink.get(key)
+        if data is not None:
+            yield json_codec.loads(data)
+
+
+def select(records, handler=None, route=None, mode=None, since=None):
+    for record in records:
+        if handler and record.get('handler') != handler:
+            continue
+        if route and record.get('route') != route:
+            continue
+        if mode and record.get('mode') != mode:
+            continue
+        if since and record.get('started_at', '') < since:
+            continue
+        yield record
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0
+
+
+def merge(records, by_handler=False):
+    """Merged stacks, cProfile functions and allocations, and the records' summaries per (handler, route)."""
+    stacks = Counter()
+    functions = defaultdict(lambda: [0, 0, 0])
+    allocations = defaultdict(lambda: [0, 0])
+    groups = defaultdict(list)
+    for record in records:
+        groups[(record.get('handler'), record.get('route'))].append(record)
+        prefix = f"{record.get('handler')};" if by_handler else ''
+        for stack, micros in record.get('stacks', {}).items():
+            stacks[prefix + stack] += micros
+        for name, values in record.get('functions', {}).items():
+            total = functions[name]
+            for i, value in enumerate(values):
+                total[i] += value
+        for allocation in record.get('top_allocations', []):
+            allocations[allocation['site']][0] += allocation['size_bytes']
+            allocations[allocation['site']][1] += allocation['count']
+    return stacks, functions, allocations, groups
+
+
+def function_times(stacks):
+    """{frame: (self µs, inclusive µs)} over folded stacks (a recursive frame counts once per stack)."""
+    self_time, inclusive = Counter(), Counter()
+    for stack, micros in stacks.items():
+        frames = stack.split(';')
+        self_time[frames[-1]] += micros
+        for frame in set(frames):
+            inclusive[frame] += micros
+    return self_time, inclusive
+
+
+def write_folded(stacks, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, micros in sorted(stacks.items()):
+            if micros > 0:
+                f.write(f'{stack} {micros}\n')
+
+
+def print_report(stacks, functions, allocations, groups, top):
+    total = sum(stacks.values())
+    print(f"{'handler':<30} {'route':<28} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} "
+          f"{'peak p50 KiB':>13} {'peak max KiB':>13} {'errors':>6}")
+    for (handler, route), records in sorted(groups.items(), key=lambda item: (str(item[0][0]), str(item[0][1]))):
+        durations = [r['duration_ms'] for r in records]
+        peaks = [r.get('peak_memory_bytes', 0) / 1024 for r in records]
+        errors = sum(1 for r in records if r.get('error'))
+        print(f"{str(handler):<30} {str(route or '-'):<28} {len(records):>4} {percentile(durations, 0.5):>9.1f} "
+              f"{percentile(durations, 0.95):>9.1f} {max(durations):>9.1f} {percentile(peaks, 0.5):>13.1f} "
+              f"{max(peaks):>13.1f} {errors:>6}")
+
+    self_time, inclusive = function_times(stacks)
+    print(f"\nTop {top} by self time ({total / 1000:.1f} ms profiled)")
+    for frame, micros in self_time.most_common(top):
+        print(f"  {micros / 1000:>10.1f} ms {100 * micros / total:>5.1f}%  {frame}")
+    print(f"\nTop {top} by inclusive time")
+    for frame, micros in inclusive.most_common(top):
+        print(f"  {micros / 1000:>10.1f} ms {100 * micros / total:>5.1f}%  {frame}")
+
+    if functions:
+        print(f"\nTop {top} cProfile functions by cumulative time (calls, self ms, cumulative ms)")
+        for name, (calls, self_us, cumulative_us) in sorted(functions.items(), key=lambda item: item[1][2],
+                                                            reverse=True)[:top]:
+            print(f"  {calls:>8} {self_us / 1000:>10.1f} {cumulative_us / 1000:>10.1f}  {name}")
+    if allocations:
+        print(f"\nTop {top} allocation sites still held at the end of the invocation (summed)")
+        for site, (size, count) in sorted(allocations.items(), key=lambda item: item[1][0], reverse=True)[:top]:
+            print(f"  {size / 1024:>10.1f} KiB {count:>8} blocks  {site}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='profile records (JSON files) instead of a sink')
+    parser.add_argument('--source', default=HANDLER_PROFILE_SINK,
+                        help=f'sink to read, e.g. dir:/path or s3://bucket/prefix (default {HANDLER_PROFILE_SINK})')
+    parser.add_argument('--handler', help='only this handler')
+    parser.add_argument('--route', help='only this route (apiPath or path)')
+    parser.add_argument('--mode', choices=('sampling', 'cprofile'), help='only records of this mode')
+    parser.add_argument('--since', help='only records started at or after this ISO date/time (UTC)')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--by-handler', action='store_true', help='root the merged stacks at the handler name')
+    parser.add_argument('--folded', help='write the merged folded stacks to this file')
+    args = parser.parse_args()
+
+    records = select(load_records(args.source, args.files, args.handler, args.since),
+                     args.handler, args.route, args.mode, args.since)
+    stacks, functions, allocations, groups = merge(records, args.by_handler)
+    if not groups:
+        print('No profile records found')
+        return 1
+    print_report(stacks, functions, allocations, groups, args.top)
+    if args.folded:
+        write_folded(stacks, args.folded)
+        print(f'\nFolded stacks written to {args.folded} ({len(stacks)} stacks)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
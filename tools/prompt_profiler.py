@@ -0,0 +1,313 @@
+"""Token profile, duplicate finder and compactor for the agent prompts.
+
+Every model call of an agent resends its instructions, so their size weighs
+on input tokens and time to first token. This tool:
+
+  * profile: estimates the tokens of each prompt file (by section too),
+  * dupes:   finds blocks of lines repeated within or across files, with the
+             tokens they cost,
+  * compact: writes compacted variants of the prompts, one directory per level:
+      - light:      trailing spaces, blank-line runs, separators and
+                    "End of prompt." removed; repeated rule lines outside
+                    examples kept only once per file,
+      - aggressive: light, plus markdown emphasis removed, at most
+                    MAX_GOOD_EXAMPLES / MAX_BAD_EXAMPLES <answer> examples per
+                    file, and lines already given to the same model by an
+                    earlier file of its context group dropped.
+
+Token counts are estimates (word pieces of ~4 characters, punctuation and
+line breaks), good for comparing variants, not for billing.
+tools/bench_prompt_routing.py checks that compacted variants keep the
+router's decisions on a labelled prompt set.
+
+Usage:
+    python tools/prompt_profiler.py profile
+    python tools/prompt_profiler.py dupes --min-chars 25
+    python tools/prompt_profiler.py compact --out build/prompts
+"""
+import argparse
+import math
+import os
+import re
+from collections import defaultdict
+from itertools import combinations
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+AGENTS_DIR = os.path.join(ROOT, 'agents')
+
+# Files read by the same model call: later files need not repeat earlier ones
+CONTEXT_GROUPS = {
+    'router': ['router_agent_prompt.txt', 'collaborator_instructions.txt'],
+}
+LEVELS = ('light', 'aggressive')
+MAX_GOOD_EXAMPLES = 3
+MAX_BAD_EXAMPLES = 1
+MIN_DUPLICATE_CHARS = 20
+
+_TOKEN_RE = re.compile(r'\w+|[^\w\s]', re.UNICODE)
+_LIST_MARKER_RE = re.compile(r'^(?:[-*•→]|\d+[.)]|#+)\s*')
+_SEPARATOR_RE = re.compile(r'^\s*[-=_*]{3,}\s*$')
+_EXAMPLE_HEADER_RE = re.compile(r'^\s*(✅|❌)')
+
+
+def prompt_files():
+    """Relative paths of the prompt files: agents/*.txt and agents/*/*prompt*.txt."""
+    found = []
+    for dirpath, _, filenames in os.walk(AGENTS_DIR):
+        for name in filenames:
+            if name.endswith('.txt') and (dirpath == AGENTS_DIR or 'prompt' in name):
+                found.append(os.path.relpath(os.path.join(dirpath, name), AGENTS_DIR))
+    return sorted(found)
+
+
+def read_prompts(directory=AGENTS_DIR):
+    return {rel: open(os.path.join(directory, rel), encoding='utf-8').read()
+            for rel in prompt_files() if os.path.exists(os.path.join(directory, rel))}
+
+
+def estimate_tokens(text):
+    """Approximate token count of text."""
+    count = len(re.findall(r'\n+', text))
+    for piece in _TOKEN_RE.findall(text):
+        if piece[0].isalnum() or piece[0] == '_':
+            count += max(1, math.ceil(len(piece) / 4))
+        else:
+            # Emojis and other symbols outside the basic planes take several byte-level tokens
+            count += 1 if ord(piece) < 0x2000 else 2
+    return count
+
+
+def normalize_line(line):
+    """Comparison key of a line: case, list markers, emphasis and spacing are ignored."""
+    line = _LIST_MARKER_RE.sub('', line.strip()).replace('**', '')
+    return re.sub(r'\s+', ' ', line).lower().strip()
+
+
+def sections(text):
+    """Split a prompt on its headings (markdown # lines or CAPITALIZED: lines)."""
+    current, lines, result = '(preamble)', [], []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('#') or re.match(r'^[A-Z][A-Z /&()-]{3,}:', stripped):
+            if lines:
+                result.append((current, '\n'.join(lines)))
+            current, lines = stripped.lstrip('# ')[:60], []
+        lines.append(line)
+    if lines:
+        result.append((current, '\n'.join(lines)))
+    return result
+
+
+# -- duplicates ---------------------------------------------------------------
+
+def find_duplicate_blocks(prompts, min_chars=MIN_DUPLICATE_CHARS):
+    """Return repeated blocks as dicts {lines, tokens, locations: [(file, first_line)], wasted}.
+
+    A block is a maximal run of consecutive lines that is identical (after
+    normalize_line) at two or more places; short lines only extend blocks.
+    """
+    keys = {}
+    occurrences = defaultdict(list)
+    for rel, text in prompts.items():
+        lines = text.splitlines()
+        keys[rel] = [normalize_line(line) for line in lines]
+        for index, key in enumerate(keys[rel]):
+            if len(key) >= min_chars:
+                occurrences[key].append((rel, index))
+
+    blocks = {}
+    for places in occurrences.values():
+        for (fa, ia), (fb, ib) in combinations(places, 2):
+            # Start only at the beginning of a run
+            if ia > 0 and ib > 0 and keys[fa][ia - 1] and keys[fa][ia - 1] == keys[fb][ib - 1] \
+                    and (fa, ia - 1) != (fb, ib):
+                continue
+            length = 0
+            while (ia + length < len(keys[fa]) and ib + length < len(keys[fb])
+                   and keys[fa][ia + length] == keys[fb][ib + length]
+                   and (fa != fb or ia + length < ib)):
+                length += 1
+            while length and not keys[fa][ia + length - 1]:
+                length -= 1
+            block = tuple(keys[fa][ia:ia + length])
+            entry = blocks.setdefault(block, {'lines': length, 'locations': set(),
+                                              'text': '\n'.join(prompts[fa].splitlines()[ia:ia + length])})
+            entry['locations'].update({(fa, ia + 1), (fb, ib + 1)})
+
+    result = []
+    for entry in blocks.values():
+        tokens = estimate_tokens(entry['text'])
+        locations = sorted(entry['locations'])
+        result.append(dict(entry, tokens=tokens, locations=locations,
+                           wasted=tokens * (len(locations) - 1)))
+    # Drop blocks that only repeat inside a larger repeated block
+    def covered(small, large):
+        return large is not small and len(large['locations']) >= len(small['locations']) and all(
+            any(f == lf and lf_line <= line and line + small['lines'] <= lf_line + large['lines']
+                for lf, lf_line in large['locations'])
+            for f, line in small['locations'])
+    result = [b for b in result if not any(covered(b, other) for other in result)]
+    result.sort(key=lambda b: (-b['wasted'], -b['lines']))
+    return result
+
+
+# -- compaction ---------------------------------------------------------------
+
+def _example_spans(lines):
+    """Yield (start, end, kind) of '✅/❌ ...' headers followed by an <answer> block."""
+    index = 0
+    while index < len(lines):
+        match = _EXAMPLE_HEADER_RE.match(lines[index])
+        if match and index + 1 < len(lines) and lines[index + 1].strip() == '<answer>':
+            end = index + 1
+            while end < len(lines) and lines[end].strip() != '</answer>':
+                end += 1
+            yield index, end + 1, match.group(1)
+            index = end + 1
+        else:
+            index += 1
+
+
+def _in_examples(lines):
+    flags = [False] * len(lines)
+    for start, end, _ in _example_spans(lines):
+        for index in range(start, min(end, len(lines))):
+            flags[index] = True
+    in_answer = False
+    for index, line in enumerate(lines):
+        if line.strip() == '<answer>':
+            in_answer = True
+        flags[index] = flags[index] or in_answer
+        if line.strip() == '</answer>':
+            in_answer = False
+    return flags
+
+
+def compact_text(text, level, already_seen=frozenset()):
+    """Compact one prompt; already_seen holds normalized lines given earlier to the same model."""
+    lines = [line.rstrip() for line in text.splitlines()]
+
+    if level == 'aggressive':
+        kept, counts = [], {'✅': 0, '❌': 0}
+        drop = set()
+        for start, end, kind in _example_spans(lines):
+            counts[kind] += 1
+            if counts[kind] > (MAX_GOOD_EXAMPLES if kind == '✅' else MAX_BAD_EXAMPLES):
+                drop.update(range(start, end))
+        lines = [line for index, line in enumerate(lines) if index not in drop]
+        lines = [line.replace('**', '') for line in lines]
+
+    examples = _in_examples(lines)
+    seen = set()
+    out = []
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if _SEPARATOR_RE.match(line) or stripped == 'End of prompt.':
+            continue
+        if not stripped:
+            if out and out[-1]:
+                out.append('')
+            continue
+        key = normalize_line(line)
+        # Headings are structure, not content: repeating them is how sections are told apart
+        heading = stripped.startswith('#') or stripped.endswith(':')
+        if not examples[index] and not heading and len(key) >= MIN_DUPLICATE_CHARS:
+            if key in seen or (level == 'aggressive' and key in already_seen):
+                continue
+            seen.add(key)
+        out.append(line)
+    while out and not out[-1]:
+        out.pop()
+    return '\n'.join(out) + '\n'
+
+
+def compact_prompts(prompts, level):
+    """Compacted variant of every prompt for a level."""
+    result = {}
+    for group in CONTEXT_GROUPS.values():
+        seen = set()
+        for rel in group:
+            if rel in prompts:
+                result[rel] = compact_text(prompts[rel], level, frozenset(seen))
+                seen.update(normalize_line(line) for line in prompts[rel].splitlines())
+    for rel, text in prompts.items():
+        if rel not in result:
+            result[rel] = compact_text(text, level)
+    return result
+
+
+def write_variants(prompts, out_dir, levels=LEVELS):
+    """Write out_dir/<level>/<relative path> for every level; return {level: {file: text}}."""
+    variants = {}
+    for level in levels:
+        variants[level] = compact_prompts(prompts, level)
+        for rel, text in variants[level].items():
+            path = os.path.join(out_dir, level, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+    return variants
+
+
+# -- commands -----------------------------------------------------------------
+
+def cmd_profile(args):
+    prompts = read_prompts()
+    total = 0
+    print(f"{'file':<52} {'chars':>7} {'lines':>6} {'tokens':>7}")
+    for rel, text in prompts.items():
+        tokens = estimate_tokens(text)
+        total += tokens
+        print(f"{rel:<52} {len(text):>7} {len(text.splitlines()):>6} {tokens:>7}")
+        if args.sections:
+            for title, body in sections(text):
+                print(f"    {title:<48} {'':>7} {len(body.splitlines()):>6} {estimate_tokens(body):>7}")
+    print(f"{'total':<52} {'':>7} {'':>6} {total:>7}")
+
+
+def cmd_dupes(args):
+    blocks = find_duplicate_blocks(read_prompts(), min_chars=args.min_chars)
+    print(f"{len(blocks)} repeated blocks, ~{sum(b['wasted'] for b in blocks)} tokens repeated\n")
+    for block in blocks[:args.top]:
+        where = ', '.join(f'{rel}:{line}' for rel, line in block['locations'])
+        first = block['text'].strip().splitlines()[0][:90]
+        print(f"~{block['wasted']:>4} tokens  {block['lines']:>2} line(s) x{len(block['locations'])}  {where}")
+        print(f"           {first}")
+
+
+def cmd_compact(args):
+    prompts = read_prompts()
+    variants = write_variants(prompts, args.out)
+    print(f"{'file':<52} {'original':>8} " + ' '.join(f'{level:>10}' for level in LEVELS))
+    totals = defaultdict(int)
+    for rel, text in prompts.items():
+        totals['original'] += estimate_tokens(text)
+        row = f"{rel:<52} {estimate_tokens(text):>8} "
+        for level in LEVELS:
+            tokens = estimate_tokens(variants[level][rel])
+            totals[level] += tokens
+            row += f'{tokens:>10} '
+        print(row)
+    print(f"{'total':<52} {totals['original']:>8} " + ' '.join(f'{totals[level]:>10}' for level in LEVELS))
+    print(f"\nVariants written to {os.path.abspath(args.out)}/<level>/")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    profile = commands.add_parser('profile', help='estimated tokens per prompt file')
+    profile.add_argument('--sections', action='store_true', help='also break each file down by section')
+    profile.set_defaults(func=cmd_profile)
+    dupes = commands.add_parser('dupes', help='blocks repeated within or across prompt files')
+    dupes.add_argument('--min-chars', type=int, default=MIN_DUPLICATE_CHARS)
+    dupes.add_argument('--top', type=int, default=30)
+    dupes.set_defaults(func=cmd_dupes)
+    compact = commands.add_parser('compact', help='write compacted variants')
+    compact.add_argument('--out', default=os.path.join(ROOT, 'build', 'prompts'))
+    compact.set_defaults(func=cmd_compact)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""Replay captured action-group traffic against one or more handler versions.
+
+Reads JSONL files written by the action-group handlers with ACTION_CAPTURE_PATH
+(see common/traffic_capture.py) and feeds every captured event to the matching
+handler of each version. A version is a checkout of this repository. Each one
+runs in its own process with its own in-memory backend, seeded from its
+database/ files plus an account for every tokenized phone number of the
+captures. Versions run in parallel, and each replays with --concurrency threads.
+
+Reports:
+  * latency per version and apiPath (p50, p90, p99, max) of the handler call,
+    business API included;
+  * response diffs against the first version (or the captured production
+    responses with --against-capture). JSON bodies are compared in canonical
+    form, with timestamps and dates masked. Against the capture, balances and
+    subscriptions differ too: the replay backend does not hold production data.
+
+Concurrent replays can reorder calls that depend on each other (a transfer
+before or after a balance check). Use --concurrency 1 for exact diffs.
+
+Usage:
+    python tools/replay_action_traffic.py captures.jsonl
+    python tools/replay_action_traffic.py captures.jsonl --version base=../main --version new=. --show-diffs 5
+    python tools/replay_action_traffic.py captures.jsonl --against-capture --concurrency 8 --repeat 5
+"""
+import argparse
+import difflib
+import importlib.util
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Capture handler name (traffic_capture.capture_handler) -> handler file in a checkout
+HANDLER_FILES = {
+    'subscriptions': 'agents/subscriptions/subscription_agent_action_group_function.py',
+    'money-transfer': 'agents/money-transfer/moneyTransfer_agent_action_group_function_correct.py',
+    'recommendation': 'agents/recommandation-agent/recommandation_agent_action_group_function.py',
+}
+REPLAY_BALANCE = Decimal(os.environ.get('REPLAY_BALANCE', '1000000'))
+
+_VOLATILE = [
+    (re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?Z?'), '<timestamp>'),
+    (re.compile(r'\b\d{2}/\d{2}/\d{4}\b'), '<date>'),
+]
+
+
+def load_captures(paths):
+    captures = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    if record.get('handler') in HANDLER_FILES and 'event' in record:
+                        captures.append(record)
+    return captures
+
+
+def response_text(response):
+    """Text the agent reads (the tool body), or the whole response when it has another shape."""
+    try:
+        text = response['response']['responseBody']['TEXT']['body']
+    except (KeyError, TypeError):
+        text = json.dumps(response, sort_keys=True, default=str)
+    # Canonical JSON: capture sanitizing and the compact format change separators, not content
+    try:
+        text = json.dumps(json.loads(text), sort_keys=True, ensure_ascii=False)
+    except ValueError:
+        pass
+    for pattern, placeholder in _VOLATILE:
+        text = pattern.sub(placeholder, text)
+    return text
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+# ---------------------------------------------------------------------------
+# Worker: one version, in its own process
+# ---------------------------------------------------------------------------
+
+def run_worker(version_root, capture_paths, concurrency, repeat, live):
+    """Replay the captures against the checkout at version_root; one JSON result per line on stdout."""
+    os.environ.setdefault('STORAGE_BACKEND', 'memory')
+    os.environ.setdefault('METRICS_ENABLED', 'false')
+    # The replay must not capture itself
+    os.environ.pop('ACTION_CAPTURE_PATH', None)
+    for relative in ('common', 'business-api-gateway-backend'):
+        sys.path.insert(0, os.path.join(version_root, relative))
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    captures = load_captures(capture_paths)
+    handlers = {}
+    for name, relative in HANDLER_FILES.items():
+        spec = importlib.util.spec_from_file_location(f'replay_{name.replace("-", "_")}',
+                                                      os.path.join(version_root, relative))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        handlers[name] = module
+
+    if not live:
+        import dispatch_app
+        import shared_resources
+        from phone_numbers import normalize_phone
+        from storage import load_seed_csv
+        from traffic_capture import _PHONE_CANDIDATE
+
+        def in_process_api_call(path, method='POST', body=None, timeout=10):
+            event = {'rawPath': path, 'requestContext': {'http': {'method': method}}, 'body': json.dumps(body or {})}
+            status, _, raw = dispatch_app.to_http_response(dispatch_app.lambda_handler(event, None))
+            return {'statusCode': status, 'body': json.loads(raw) if raw else None}
+
+        for module in handlers.values():
+            module._make_api_call = in_process_api_call
+        storage, data_table = shared_resources.storage, shared_resources.DYNAMO_TABLE_DATA
+        database = os.path.join(version_root, 'database')
+        load_seed_csv(storage, data_table, os.path.join(database, 'TelcoData.csv'))
+        load_seed_csv(storage, shared_resources.DYNAMO_TABLE_CATALOG, os.path.join(database, 'Catalog.csv'))
+        # Tokenized numbers do not exist in the seed data: every number of the captures gets an account
+        phones = {normalize_phone(m.group(0)) for record in captures
+                  for m in _PHONE_CANDIDATE.finditer(json.dumps(record['event']))}
+        for phone in sorted(p for p in phones if p):
+            if not storage.get_item(data_table, {'PK': f'USER#{phone}', 'SK': 'METADATA'}):
+                storage.put_item(data_table, {
+                    'PK': f'USER#{phone}', 'SK': 'METADATA', 'Type': 'USER_PROFILE',
+                    'balance_credit': REPLAY_BALANCE, 'balance_mobile_money': REPLAY_BALANCE, 'active_subs': [],
+                })
+
+    def replay(task):
+        index, record, iteration = task
+        started = time.perf_counter()
+        try:
+            response = handlers[record['handler']].lambda_handler(record['event'], None)
+        except Exception as e:
+            response = {'exception': f'{type(e).__name__}: {e}'}
+        return {'index': index, 'iteration': iteration, 'handler': record['handler'],
+                'apiPath': record['event'].get('apiPath'), 'ms': (time.perf_counter() - started) * 1000,
+                'text': response_text(response)}
+
+    tasks = [(index, record, iteration) for iteration in range(repeat) for index, record in enumerate(captures)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for result in pool.map(replay, tasks):
+            sys.stdout.write(json.dumps(result) + '\n')
+
+
+# ---------------------------------------------------------------------------
+# Coordinator
+# ---------------------------------------------------------------------------
+
+def start_version(name, version_root, args):
+    command = [sys.executable, os.path.abspath(__file__), '--worker', os.path.abspath(version_root),
+               '--concurrency', str(args.concurrency), '--repeat', str(args.repeat)] + args.captures
+    if args.live:
+        command.append('--live')
+    return name, subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+
+
+def print_latencies(results):
+    print(f"{'version':<12} {'apiPath':<28} {'calls':>6} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, rows in results.items():
+        by_path = {}
+        for row in rows:
+            by_path.setdefault(row['apiPath'], []).append(row['ms'])
+        for api_path, timings in sorted(by_path.items(), key=lambda entry: str(entry[0])):
+            timings.sort()
+            print(f"{name:<12} {str(api_path):<28} {len(timings):>6} {percentile(timings, 0.5):>8.2f} "
+                  f"{percentile(timings, 0.9):>8.2f} {percentile(timings, 0.99):>8.2f} {timings[-1]:>8.2f}")
+
+
+def print_diffs(baseline_name, baseline, results, captures, show_diffs):
+    print()
+    for name, rows in results.items():
+        if name == baseline_name:
+            continue
+        texts = {row['index']: row['text'] for row in rows if row['iteration'] == 0}
+        differing = [index for index in sorted(texts) if texts[index] != baseline.get(index)]
+        print(f"{name} vs {baseline_name}: {len(texts) - len(differing)}/{len(texts)} identical responses")
+        for index in differing[:show_diffs]:
+            event = captures[index]['event']
+            print(f"  --- capture {index} ({captures[index]['handler']} {event.get('apiPath')})")
+            for line in difflib.unified_diff(str(baseline.get(index)).splitlines(), texts[index].splitlines(),
+                                             baseline_name, name, lineterm='', n=1):
+                print(f"    {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('captures', nargs='+', help='JSONL capture files')
+    parser.add_argument('--version', action='append', default=[], metavar='NAME=PATH',
+                        help='checkout to replay against (repeatable; default: this checkout)')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent calls per version')
+    parser.add_argument('--repeat', type=int, default=1, help='replay the captures this many times (latency)')
+    parser.add_argument('--against-capture', action='store_true',
+                        help='diff every version against the captured production responses')
+    parser.add_argument('--show-diffs', type=int, default=3, help='diffs printed per version')
+    parser.add_argument('--live', action='store_true', help='call the business API at API_BASE_URL instead')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.captures, args.concurrency, args.repeat, args.live)
+        return
+
+    captures = load_captures(args.captures)
+    if not captures:
+        sys.exit('No action-group captures found')
+    versions = [v.split('=', 1) if '=' in v else (os.path.basename(os.path.abspath(v)), v) for v in args.version]
+    versions = versions or [('current', ROOT)]
+    print(f"Replaying {len(captures)} captures x {args.repeat} against {len(versions)} version(s), "
+          f"{args.concurrency} concurrent calls each\n")
+
+    # Versions replay in parallel, each in its own process
+    processes = [start_version(name, path, args) for name, path in versions]
+    results = {}
+    for name, process in processes:
+        output, _ = process.communicate()
+        if process.returncode:
+            sys.exit(f"Replay against {name} failed (exit code {process.returncode})")
+        results[name] = [json.loads(line) for line in output.splitlines() if line.startswith('{')]
+
+    print_latencies(results)
+    if args.against_capture:
+        baseline_name = 'capture'
+        baseline = {index: response_text(record.get('response')) for index, record in enumerate(captures)}
+    else:
+        baseline_name = versions[0][0]
+        baseline = {row['index']: row['text'] for row in results[baseline_name] if row['iteration'] == 0}
+    if args.against_capture or len(versions) > 1:
+        print_diffs(baseline_name, baseline, results, captures, args.show_diffs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+"""Rapport journalier des transactions : totaux par type, forfaits les plus vendus, percentiles.
+
+Lit toutes les transactions de TelcoData (items Type = TRANSACTION) et produit :
+  * par jour et par transaction_type : nombre et montant net ;
+  * par transaction_type : nombre, montant net, percentiles p50/p90/p99 des montants (en valeur absolue) ;
+  * les forfaits les plus vendus (activations, paniers et renouvellements) : nombre et chiffre d'affaires.
+
+Sources :
+  * la table (STORAGE_BACKEND, DYNAMO_TABLE_DATA_NAME) : scan parallèle segmenté
+    (--segments), un worker par segment, projeté sur les seuls attributs lus ;
+  * --export FICHIER... : fichiers d'un export DynamoDB vers S3 (lignes DYNAMODB_JSON,
+    .json ou .json.gz) ou CSV au format de database/TelcoData.csv, un worker par fichier.
+
+Mémoire bornée quelle que soit la taille de la table : chaque worker décode les items
+par lots (--batch-size) en tableaux typés (groupe jour/type, forfait, montant en centimes)
+et réduit chaque lot d'un coup, avec numpy.bincount si numpy est installé, sinon par une
+boucle sur les tableaux. Seuls les agrégats survivent à un lot : un compteur par
+(jour, type) et par forfait, et un histogramme logarithmique de taille fixe par type.
+Les percentiles sont lus sur ces histogrammes, à 1 % près de la valeur exacte
+(PERCENTILE_ACCURACY). Les montants sont cumulés en centimes entiers : les totaux sont exacts.
+
+Usage :
+    STORAGE_BACKEND=dynamodb python tools/transaction_report.py --segments 16
+    python tools/transaction_report.py --export export/*.json.gz --since 2025-11-01 --top 20
+    python tools/transaction_report.py --export database/TelcoData.csv --json
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import re
+import sys
+import time
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'business-api-gateway-backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from storage import create_storage, deserialize_value, read_seed_csv  # noqa: E402
+
+try:
+    import numpy
+except ImportError:  # optionnel : la boucle Python donne les mêmes résultats, plus lentement
+    numpy = None
+
+DATA_TABLE = os.environ.get('DYNAMO_TABLE_DATA_NAME', 'TelcoData')
+SCAN_ATTRIBUTES = ['PK', 'SK', 'transaction_type', 'amount', 'subscription_id', 'cart', 'details']
+EXPORT_ATTRIBUTES = frozenset(SCAN_ATTRIBUTES + ['Type'])
+
+# Histogramme logarithmique : le seau i (>= 1) couvre ]gamma^(i-2), gamma^(i-1)] centimes,
+# le seau 0 les montants nuls. Représenter un seau par sa valeur centrale garantit
+# une erreur relative d'au plus PERCENTILE_ACCURACY.
+PERCENTILE_ACCURACY = 0.01
+GAMMA = (1 + PERCENTILE_ACCURACY) / (1 - PERCENTILE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+MAX_CENTS = 10 ** 15
+HISTOGRAM_BUCKETS = math.ceil(math.log(MAX_CENTS) / LOG_GAMMA) + 2
+PERCENTILES = (50, 90, 99)
+
+# Les transactions du jeu d'exemple n'ont pas de subscription_id : le forfait est dans details
+PLAN_IN_DETAILS = re.compile(r'\(([A-Z0-9_]+)\)\s*$')
+
+Options = namedtuple('Options', ['since', 'until', 'batch_size', 'use_numpy'])
+
+
+def bucket_of(cents):
+    if cents == 0:
+        return 0
+    return min(math.ceil(math.log(abs(cents)) / LOG_GAMMA) + 1, HISTOGRAM_BUCKETS - 1)
+
+
+def bucket_value(bucket):
+    """Valeur représentative (en centimes) d'un seau de l'histogramme."""
+    if bucket == 0:
+        return 0.0
+    return 2 * GAMMA ** (bucket - 1) / (GAMMA + 1)
+
+
+def _cents(amount):
+    return int((amount * 100).to_integral_value())
+
+
+def _grow(values, size):
+    if len(values) < size:
+        values.extend([0] * (size - len(values)))
+
+
+class Aggregates:
+    """Agrégats d'un worker ; fusionnables (merge) et de taille indépendante du nombre d'items."""
+
+    def __init__(self):
+        self.groups = {}   # (jour, type) -> index
+        self.types = {}    # type -> index
+        self.plans = {}    # forfait -> index
+        self.group_count = array('q')
+        self.group_cents = array('q')
+        self.plan_count = array('q')
+        self.plan_cents = array('q')
+        self.histograms = array('q')  # types x HISTOGRAM_BUCKETS, aplati
+        self.items = 0
+
+    def _index(self, table, key):
+        index = table.get(key)
+        if index is None:
+            index = table[key] = len(table)
+        return index
+
+    def batch(self):
+        # Une ligne par transaction (group, type, cents) ; une ligne par forfait vendu (plan, plan_cents)
+        return {'group': array('q'), 'type': array('q'), 'cents': array('q'),
+                'plan': array('q'), 'plan_cents': array('q')}
+
+    def add_to_batch(self, batch, item, options):
+        """Ajoute une transaction au lot ; False si l'item n'est pas une transaction retenue."""
+        sk = item.get('SK', '')
+        if item.get('Type', 'TRANSACTION') != 'TRANSACTION' or not sk.startswith('TRANS#'):
+            return False
+        day = sk[6:16]
+        if (options.since and day < options.since) or (options.until and day > options.until):
+            return False
+        transaction_type = item.get('transaction_type', 'UNKNOWN')
+        cents = _cents(item.get('amount', Decimal(0)))
+        batch['group'].append(self._index(self.groups, (day, transaction_type)))
+        batch['type'].append(self._index(self.types, transaction_type))
+        batch['cents'].append(cents)
+        if item.get('cart'):
+            # Panier : une seule transaction pour plusieurs forfaits, chacun à son prix
+            for entry in item['cart']:
+                batch['plan'].append(self._index(self.plans, entry['id']))
+                batch['plan_cents'].append(-_cents(entry['price']))
+            return True
+        plan = item.get('subscription_id')
+        if not plan:
+            match = PLAN_IN_DETAILS.search(item.get('details', ''))
+            plan = match.group(1) if match else None
+        if plan:
+            batch['plan'].append(self._index(self.plans, plan))
+            batch['plan_cents'].append(cents)
+        return True
+
+    def reduce(self, batch, use_numpy=True):
+        """Cumule un lot dans les agrégats (group-by vectorisé si numpy est disponible)."""
+        size = len(batch['cents'])
+        if not size:
+            return
+        self.items += size
+        for values, table in ((self.group_count, self.groups), (self.group_cents, self.groups),
+                              (self.plan_count, self.plans), (self.plan_cents, self.plans)):
+            _grow(values, len(table))
+        _grow(self.histograms, len(self.types) * HISTOGRAM_BUCKETS)
+        if numpy is not None and use_numpy:
+            self._reduce_numpy(batch)
+        else:
+            self._reduce_python(batch)
+
+    def _reduce_numpy(self, batch):
+        group = numpy.frombuffer(batch['group'], dtype=numpy.int64)
+        types = numpy.frombuffer(batch['type'], dtype=numpy.int64)
+        cents = numpy.frombuffer(batch['cents'], dtype=numpy.int64)
+        plan = numpy.frombuffer(batch['plan'], dtype=numpy.int64)
+        plan_cents = numpy.frombuffer(batch['plan_cents'], dtype=numpy.int64)
+        # Les poids de bincount sont des float64 : exacts tant que la somme d'un lot reste sous 2**53 centimes
+        self._accumulate(self.group_count, numpy.bincount(group, minlength=len(self.groups)))
+        self._accumulate(self.group_cents, numpy.bincount(group, weights=cents, minlength=len(self.groups)))
+        self._accumulate(self.plan_count, numpy.bincount(plan, minlength=len(self.plans)))
+        self._accumulate(self.plan_cents, numpy.bincount(plan, weights=plan_cents, minlength=len(self.plans)))
+        magnitude = numpy.abs(cents)
+        buckets = numpy.zeros(len(cents), dtype=numpy.int64)
+        nonzero = magnitude > 0
+        buckets[nonzero] = numpy.minimum(
+            numpy.ceil(numpy.log(magnitude[nonzero]) / LOG_GAMMA).astype(numpy.int64) + 1, HISTOGRAM_BUCKETS - 1)
+        self._accumulate(self.histograms, numpy.bincount(types * HISTOGRAM_BUCKETS + buckets,
+                                                         minlength=len(self.types) * HISTOGRAM_BUCKETS))
+
+    @staticmethod
+    def _accumulate(values, counts):
+        for index in numpy.flatnonzero(counts):
+            values[index] += int(round(counts[index]))
+
+    def _reduce_python(self, batch):
+        for group, type_index, cents in zip(batch['group'], batch['type'], batch['cents']):
+            self.group_count[group] += 1
+            self.group_cents[group] += cents
+            self.histograms[type_index * HISTOGRAM_BUCKETS + bucket_of(cents)] += 1
+        for plan, cents in zip(batch['plan'], batch['plan_cents']):
+            self.plan_count[plan] += 1
+            self.plan_cents[plan] += cents
+
+    def merge(self, other):
+        """Ajoute les agrégats d'un autre worker (index locaux remappés par nom)."""
+        for key, index in other.groups.items():
+            mine = self._index(self.groups, key)
+            _grow(self.group_count, mine + 1)
+            _grow(self.group_cents, mine + 1)
+            self.group_count[mine] += other.group_count[index]
+            self.group_cents[mine] += other.group_cents[index]
+        for key, index in other.plans.items():
+            mine = self._index(self.plans, key)
+            _grow(self.plan_count, mine + 1)
+            _grow(self.plan_cents, mine + 1)
+            self.plan_count[mine] += other.plan_count[index]
+            self.plan_cents[mine] += other.plan_cents[index]
+        for key, index in other.types.items():
+            mine = self._index(self.types, key)
+            _grow(self.histograms, (mine + 1) * HISTOGRAM_BUCKETS)
+            for bucket in range(HISTOGRAM_BUCKETS):
+                self.histograms[mine * HISTOGRAM_BUCKETS + bucket] += other.histograms[index * HISTOGRAM_BUCKETS + bucket]
+        self.items += other.items
+
+    def percentiles(self, transaction_type, percentiles=PERCENTILES):
+        """Percentiles (en unités monétaires, valeur absolue) d'un type, lus sur son histogramme."""
+        offset = self.types[transaction_type] * HISTOGRAM_BUCKETS
+        histogram = self.histograms[offset:offset + HISTOGRAM_BUCKETS]
+        total = sum(histogram)
+        result = {}
+        for p in percentiles:
+            rank, seen = max(1, math.ceil(p / 100 * total)), 0
+            for bucket, count in enumerate(histogram):
+                seen += count
+                if seen >= rank:
+                    result[f'p{p}'] = round(bucket_value(bucket) / 100, 2)
+                    break
+        return result
+
+
+def consume(items, options, aggregates=None):
+    """Agrège un flux d'items par lots de options.batch_size."""
+    aggregates = aggregates or Aggregates()
+    batch = aggregates.batch()
+    for item in items:
+        if aggregates.add_to_batch(batch, item, options) and len(batch['cents']) >= options.batch_size:
+            aggregates.reduce(batch, options.use_numpy)
+            batch = aggregates.batch()
+    aggregates.reduce(batch, options.use_numpy)
+    return aggregates
+
+
+def scan_segment(segment, total_segments, options, storage=None):
+    """Worker : agrège un segment du scan de la table.
+
+    Chaque processus crée son propre backend (STORAGE_BACKEND) ; storage permet d'agréger
+    un backend déjà ouvert dans le processus courant (memory).
+    """
+    storage = storage or create_storage()
+    pages = storage.scan_pages(DATA_TABLE, filters={'Type': 'TRANSACTION'}, attributes=SCAN_ATTRIBUTES,
+                               segment=segment, total_segments=total_segments, page_size=options.batch_size)
+    return consume((item for page in pages for item in page), options)
+
+
+def read_export_items(path):
+    """Itère sur les items d'un fichier d'export (DYNAMODB_JSON, éventuellement gzip, ou CSV)."""
+    if path.endswith('.csv'):
+        yield from read_seed_csv(path)
+        return
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                # Seuls les attributs lus par le rapport sont convertis (active_subs des profils, etc. ignorés)
+                yield {k: deserialize_value(v) for k, v in record.get('Item', record).items() if k in EXPORT_ATTRIBUTES}
+
+
+def read_export(path, options):
+    """Worker : agrège un fichier d'export."""
+    return consume(read_export_items(path), options)
+
+
+def build_report(aggregates, top):
+    daily = [
+        {'day': day, 'transaction_type': transaction_type,
+         'count': aggregates.group_count[index], 'net_amount': aggregates.group_cents[index] / 100}
+        for (day, transaction_type), index in sorted(aggregates.groups.items())
+    ]
+    by_type = {}
+    for (_, transaction_type), index in aggregates.groups.items():
+        totals = by_type.setdefault(transaction_type, {'count': 0, 'cents': 0})
+        totals['count'] += aggregates.group_count[index]
+        totals['cents'] += aggregates.group_cents[index]
+    types = [
+        dict({'transaction_type': t, 'count': v['count'], 'net_amount': v['cents'] / 100},
+             **aggregates.percentiles(t))
+        for t, v in sorted(by_type.items(), key=lambda entry: -entry[1]['count'])
+    ]
+    plans = sorted(aggregates.plans.items(), key=lambda entry: -aggregates.plan_count[entry[1]])[:top]
+    return {
+        'transactions': aggregates.items,
+        'daily': daily,
+        'types': types,
+        'top_plans': [{'plan': plan, 'count': aggregates.plan_count[index],
+                       'revenue': -aggregates.plan_cents[index] / 100} for plan, index in plans],
+    }
+
+
+def print_report(report):
+    print(f"{'jour':<12} {'transaction_type':<34} {'nombre':>10} {'montant net':>16}")
+    for row in report['daily']:
+        print(f"{row['day']:<12} {row['transaction_type']:<34} {row['count']:>10} {row['net_amount']:>16.2f}")
+    labels = ''.join(f" {f'p{p}':>10}" for p in PERCENTILES)
+    print(f"\n{'transaction_type':<34} {'nombre':>10} {'montant net':>16}{labels}")
+    for row in report['types']:
+        values = ''.join(f" {row.get(f'p{p}', 0):>10.2f}" for p in PERCENTILES)
+        print(f"{row['transaction_type']:<34} {row['count']:>10} {row['net_amount']:>16.2f}{values}")
+    print(f"\n{'forfait':<20} {'ventes':>10} {'chiffre d affaires':>20}")
+    for row in report['top_plans']:
+        print(f"{row['plan']:<20} {row['count']:>10} {row['revenue']:>20.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--export', nargs='+', metavar='FICHIER', help="fichiers d'export au lieu de la table")
+    parser.add_argument('--segments', type=int, default=8, help='segments du scan parallèle de la table')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='workers parallèles')
+    parser.add_argument('--batch-size', type=int, default=50000, help='items décodés par lot')
+    parser.add_argument('--since', help='premier jour inclus (AAAA-MM-JJ)')
+    parser.add_argument('--until', help='dernier jour inclus (AAAA-MM-JJ)')
+    parser.add_argument('--top', type=int, default=10, help='nombre de forfaits listés')
+    parser.add_argument('--no-numpy', action='store_true', help='réduction par boucle Python même si numpy est là')
+    parser.add_argument('--json', action='store_true', help='rapport en JSON')
+    args = parser.parse_args()
+
+    options = Options(args.since, args.until, args.batch_size, not args.no_numpy)
+    started = time.perf_counter()
+    if args.export:
+        tasks = [(read_export, path, options) for path in args.export]
+    else:
+        tasks = [(scan_segment, segment, args.segments, options) for segment in range(args.segments)]
+    aggregates = Aggregates()
+    # Des processus plutôt que des threads : le décodage des items est limité par le CPU
+    with ProcessPoolExecutor(max_workers=min(args.workers, len(tasks))) as executor:
+        for future in as_completed([executor.submit(*task) for task in tasks]):
+            aggregates.merge(future.result())
+    elapsed = time.perf_counter() - started
+
+    report = build_report(aggregates, args.top)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+    engine = 'numpy' if numpy is not None and options.use_numpy else 'python'
+    print(f"\n{aggregates.items} transactions en {elapsed:.2f} s ({len(tasks)} workers, réduction {engine})",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()